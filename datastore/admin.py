@@ -1,7 +1,22 @@
-from django.contrib import admin
-from django.db.models import TextField
-from django.forms import TextInput
+import json
+from django.contrib import admin, messages
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ORDER_VAR, PAGE_VAR, ChangeList
+from django.contrib.admin.widgets import ForeignKeyRawIdWidget
+from django.core.paginator import Paginator
+from django.db import connections, router
+from django.db.models import CASCADE, TextField
+from django.db.transaction import atomic
+from django.forms import BaseModelFormSet, TextInput
+from django.http import HttpResponseRedirect
+from django.urls import NoReverseMatch, reverse
+from django.utils.functional import cached_property
+from django.utils.text import Truncator
+from . import arm_balance
 from . import models
+from . import purge
+
+AFTER_VAR = 'after'
 
 
 class ReservationIsNullFilter(admin.SimpleListFilter):
@@ -19,6 +34,101 @@ class ReservationIsNullFilter(admin.SimpleListFilter):
         return queryset
 
 
+class EstimatedCountPaginator(Paginator):
+    """
+    On PostgreSQL, counts with the query planner's estimate when it is above estimate_threshold rather than running
+    a COUNT(*) that scans every matching row.
+    """
+    estimate_threshold = 10000
+    count_is_estimate = False
+
+    @cached_property
+    def count(self):
+        estimate = self.estimated_count()
+        if estimate is not None and estimate > self.estimate_threshold:
+            self.count_is_estimate = True
+            return estimate
+        return super().count
+
+    def estimated_count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Pages through results ordered by pk with `?after=<pk>` links, so that later pages cost the same as the first
+    instead of scanning every row before their OFFSET.
+    """
+    def __init__(self, request, *args, **kwargs):
+        self.keyset_after = request.GET.get(AFTER_VAR)
+        self.keyset_next_url = None
+        super().__init__(request, *args, **kwargs)
+        self.params.pop(AFTER_VAR, None)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(AFTER_VAR, None)
+        return lookup_params
+
+    def get_results(self, request):
+        if self.keyset_after is None:
+            super().get_results(request)
+        else:
+            self.get_keyset_results(request)
+        result_list = list(self.result_list)
+        if ORDER_VAR not in self.params and len(result_list) == self.list_per_page:
+            self.keyset_next_url = self.get_query_string({AFTER_VAR: result_list[-1].pk}, [PAGE_VAR])
+
+    def get_keyset_results(self, request):
+        try:
+            after = int(self.keyset_after)
+        except ValueError:
+            raise IncorrectLookupParameters
+        self.paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        self.result_count = self.paginator.count
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.full_result_count = None
+        self.result_list = self.queryset.filter(pk__gt=after).order_by('pk')[:self.list_per_page]
+        self.can_show_all = False
+        self.multi_page = True
+
+
+class LoadedRawIdWidget(ForeignKeyRawIdWidget):
+    """
+    Labels the raw id with related_object, already loaded with the row, instead of querying for it.
+    """
+    related_object = None
+
+    def label_and_url_for_value(self, value):
+        obj = self.related_object
+        if obj is None or str(obj.pk) != str(value):
+            return super().label_and_url_for_value(value)
+        try:
+            url = reverse(f'{self.admin_site.name}:{obj._meta.app_label}_{obj._meta.model_name}_change',
+                          args=(obj.pk,))
+        except NoReverseMatch:
+            url = ''
+        return Truncator(obj).words(14), url
+
+
+class RowChangeListFormSet(BaseModelFormSet):
+    def _construct_form(self, i, **kwargs):
+        form = super()._construct_form(i, **kwargs)
+        form.fields['reservation'].widget.related_object = form.instance.reservation
+        return form
+
+
 class RowAdmin(admin.ModelAdmin):
     readonly_fields = ('id', 'table_name', 'site_id', 'randomization_arm', 'key')
     exclude = ('patient_id',)
@@ -26,13 +136,49 @@ class RowAdmin(admin.ModelAdmin):
                     'processed', 'processed_datetime', 'reservation', 'reservation_datetime', 'key')
     list_editable = ('processed', 'reservation')
     list_filter = ('table', 'processed', ReservationIsNullFilter)
-    list_prefetch_related = ('table', 'table__column_set')
-    search_fields = ('patient_id',)
+    list_select_related = ('table', 'reservation')
+    raw_id_fields = ('reservation',)
+    search_fields = ('=patient_id',)
+    ordering = ('pk',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    history_fields = ('processed', 'reservation', 'processed_datetime', 'reservation_datetime')
 
     @staticmethod
     def table_name(row):
         return row.table.name
 
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_changelist_formset(self, request, **kwargs):
+        return super().get_changelist_formset(request, formset=RowChangeListFormSet, **kwargs)
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'reservation':
+            kwargs['widget'] = LoadedRawIdWidget(db_field.remote_field, self.admin_site, using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def save_model(self, request, obj, form, change):
+        # Edits are recorded as row changes, like reservation transitions, so the row history stays complete.
+        if not change or not set(form.changed_data) & set(self.history_fields):
+            return super().save_model(request, obj, form, change)
+        with atomic(using=router.db_for_write(models.Row)):
+            previous_row = models.Row.objects.select_for_update().get(pk=obj.pk)
+            super().save_model(request, obj, form, change)
+            models.RowChange.record(obj, models.RowChange.ADMIN_EDIT, request.user)
+            arm_balance.record_edit(previous_row, obj)
+
+    def get_search_results(self, request, queryset, search_term):
+        # An exact match on the indexed patient_id. Django's own `=` lookup casts the column to text, which cannot use
+        # the index.
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        if not search_term.isdigit():
+            return queryset.none(), False
+        return queryset.filter(patient_id=int(search_term)), False
+
 
 class ColumnAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'table', 'table_index')
@@ -57,8 +203,51 @@ class TableAdmin(admin.ModelAdmin):
     list_editable = ('is_hidden',)
     list_filter = ('is_hidden',)
 
+    def get_deleted_objects(self, objs, request):
+        # Counts related objects instead of collecting them, which does not scale to tables with many rows.
+        perms_needed = set()
+        model_count = {models.Table._meta.verbose_name_plural: len(objs)}
+        for field in purge.related_fields():
+            if field.remote_field.on_delete != CASCADE:
+                continue
+            model = field.model
+            count = model._base_manager.filter(**{f'{field.name}__in': objs}).count()
+            if not count:
+                continue
+            model_count[model._meta.verbose_name_plural] = count
+            if model in self.admin_site._registry and \
+                    not self.admin_site._registry[model].has_delete_permission(request):
+                perms_needed.add(model._meta.verbose_name)
+        return [str(obj) for obj in objs], model_count, perms_needed, []
+
+    def delete_model(self, request, obj):
+        # Large tables take longer to purge than a request may run, so the worker purges them.
+        purge.create_purge_job(obj, request.user)
+
+    def delete_queryset(self, request, queryset):
+        for table in queryset:
+            purge.create_purge_job(table, request.user)
+
+    def response_delete(self, request, obj_display, obj_id):
+        self.message_user(request, f'The table “{obj_display}” has been hidden and will be purged by the worker. '
+                                   f'Its progress is shown under purge jobs.', messages.SUCCESS)
+        return HttpResponseRedirect(reverse('admin:datastore_table_changelist'))
+
+
+class PurgeJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'table_name', 'status', 'objects_purged', 'requested_by', 'created_datetime',
+                    'finished_datetime', 'error')
+    list_filter = ('status',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 
 admin.site.register(models.Row, RowAdmin)
 admin.site.register(models.Column, ColumnAdmin)
 admin.site.register(models.SiteIdColumn, SiteIdColumnAdmin)
 admin.site.register(models.Table, TableAdmin)
+admin.site.register(models.PurgeJob, PurgeJobAdmin)
@@ -0,0 +1,93 @@
+import io
+from itertools import islice
+from django.db.transaction import atomic
+from . import daos
+from . import models
+from . import table_snapshot
+from permissions import daos as permissions_daos
+
+# Archiving moves the rows of a closed table into a TableArchive snapshot, after which the table is read-only and
+# reads its rows from the archive.
+
+BATCH_SIZE = 5000
+
+
+def archive_table(table, batch_size=BATCH_SIZE):
+    """
+    Archives a table and returns its TableArchive. Raises ValueError if any of its rows are reserved but not
+    processed.
+    """
+    with atomic():
+        table = models.Table.objects.select_for_update().get(pk=table.pk)
+        archive = models.TableArchive.objects.filter(table=table).defer('snapshot').first()
+        if not archive:
+            # Locking the open rows waits for reservations in progress, and makes reservations that start now wait
+            # for the table to be marked as archived, which they check once they hold their row.
+            open_rows = table.row_set.filter(processed=False).select_for_update()
+            if any(reservation_id is not None for reservation_id in open_rows.values_list('reservation_id', flat=True)):
+                raise ValueError(f'Table `{table.name}` has open reservations and cannot be archived')
+            table_export_dao = daos.TableExportDAO(table, permissions_daos.get_table_owner(table))
+            snapshot_file = io.BytesIO()
+            table_snapshot.write_table_snapshot(table_export_dao, snapshot_file)
+            archive = models.TableArchive.objects.create(table=table, snapshot=snapshot_file.getvalue(),
+                                                         row_count=table.row_set.count())
+            models.Table.objects.filter(pk=table.pk).update(is_archived=True)
+    _delete_rows(table, batch_size)
+    return archive
+
+
+def _delete_rows(table, batch_size):
+    while True:
+        with atomic():
+            pks = list(table.row_set.order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                return
+            models.Row.objects.filter(table_id=table.pk, pk__in=pks).delete()
+
+
+def restore_table(table, batch_size=BATCH_SIZE):
+    """
+    Moves the rows of an archived table back into the row table and returns the number of rows restored.
+    """
+    archive = models.TableArchive.objects.get(table=table)
+    rows = archived_rows(table, archive)
+    restored = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        with atomic():
+            models.Row.objects.bulk_create(batch, ignore_conflicts=True)
+        restored += len(batch)
+    with atomic():
+        models.Table.objects.filter(pk=table.pk).update(is_archived=False)
+        archive.delete()
+    table.is_archived = False
+    return restored
+
+
+def archived_snapshot(table, archive=None, row_ids=None):
+    """
+    Loads the TableSnapshot of an archived table, with only the rows in row_ids if given.
+    """
+    archive = archive or models.TableArchive.objects.get(table=table)
+    return table_snapshot.TableSnapshot.load(io.BytesIO(archive.snapshot), row_ids)
+
+
+def archived_row_values(table, archive=None, row_ids=None):
+    """
+    Yields the values of each archived row of table, or only of the rows in row_ids, in the order of
+    TableExportDAO.snapshot_row_fields.
+    """
+    return archived_snapshot(table, archive, row_ids).row_values_iter()
+
+
+def archived_rows(table, archive=None, row_ids=None):
+    """
+    Yields an unsaved Row for each archived row of table, or only for the rows in row_ids.
+    """
+    for (pk, key, site_id, randomization_arm, patient_id, processed, reservation_id, reservation_datetime,
+         processed_datetime) in archived_row_values(table, archive, row_ids):
+        yield models.Row(pk=pk, table=table, key=key, site_id=site_id, randomization_arm=randomization_arm,
+                         patient_id=patient_id, processed=processed, reservation_id=reservation_id,
+                         reservation_datetime=reservation_datetime, processed_datetime=processed_datetime)
@@ -0,0 +1,100 @@
+import numpy as np
+from django.db.models import F, Q, Count
+from django.db.transaction import atomic
+from django.db.utils import IntegrityError
+from . import models
+
+# Reserved and completed row counts per (table, site_id, key, randomization_arm), updated by each reservation
+# transition and rebuilt from the table's rows on demand.
+
+ACTION_DELTAS = {
+    models.RowChange.RESERVE: (1, 0),
+    models.RowChange.COMPLETE: (-1, 1),
+    models.RowChange.CANCEL: (-1, 0),
+    models.RowChange.COMPLETE_OVERRIDE: (-1, 1),
+    models.RowChange.CANCEL_OVERRIDE: (-1, 0),
+}
+MISSING_SITE_ID = -1
+CHUNK_SIZE = 10000
+
+
+def record_transition(row, action):
+    _apply_delta(row, *ACTION_DELTAS[action])
+
+
+def record_edit(previous_row, row):
+    """
+    Applies the change in state of a row edited outside of a reservation transition, such as in the admin.
+    """
+    reserved = _is_reserved(row) - _is_reserved(previous_row)
+    completed = int(row.processed) - int(previous_row.processed)
+    if reserved or completed:
+        _apply_delta(row, reserved, completed)
+
+
+def _is_reserved(row):
+    return int(row.reservation_id is not None and not row.processed)
+
+
+def _apply_delta(row, reserved, completed):
+    arm_counts = models.ArmCount.objects.filter(table_id=row.table_id, site_id=row.site_id, key=row.key,
+                                                randomization_arm=row.randomization_arm)
+    if arm_counts.update(reserved=F('reserved') + reserved, completed=F('completed') + completed):
+        return
+    try:
+        with atomic():
+            _create_arm_count(row)
+    except IntegrityError:
+        # Created by a concurrent transition, whose count of the rows did not include this row's change yet.
+        arm_counts.update(reserved=F('reserved') + reserved, completed=F('completed') + completed)
+
+
+def _create_arm_count(row):
+    rows = models.Row.objects.filter(table_id=row.table_id, site_id=row.site_id, key=row.key,
+                                     randomization_arm=row.randomization_arm)
+    counts = rows.aggregate(reserved=Count('pk', filter=Q(reservation__isnull=False, processed=False)),
+                            completed=Count('pk', filter=Q(processed=True)))
+    models.ArmCount.objects.create(table_id=row.table_id, site_id=row.site_id, key=row.key,
+                                   randomization_arm=row.randomization_arm, **counts)
+
+
+def _row_arrays(table):
+    rows = table.row_set.values_list('site_id', 'key', 'randomization_arm', 'reservation_id', 'processed')
+    chunks = []
+    chunk = []
+    for site_id, key, randomization_arm, reservation_id, processed in rows.iterator(chunk_size=CHUNK_SIZE):
+        chunk.append((MISSING_SITE_ID if site_id is None else site_id, key, randomization_arm,
+                      reservation_id is not None, processed))
+        if len(chunk) == CHUNK_SIZE:
+            chunks.append(np.array(chunk, dtype=np.int64))
+            chunk = []
+    if chunk:
+        chunks.append(np.array(chunk, dtype=np.int64))
+    if not chunks:
+        return np.zeros((0, 5), dtype=np.int64)
+    return np.concatenate(chunks)
+
+
+def calculate_arm_counts(row_arrays):
+    """
+    Takes an (n, 5) array of site_id, key, randomization_arm, is_reserved and processed, and returns the distinct
+    (site_id, key, randomization_arm) groups with their reserved and completed counts.
+    """
+    groups, group_index = np.unique(row_arrays[:, :3], axis=0, return_inverse=True)
+    group_index = group_index.reshape(-1)
+    processed = row_arrays[:, 4].astype(bool)
+    reserved = row_arrays[:, 3].astype(bool) & ~processed
+    reserved_counts = np.bincount(group_index, weights=reserved, minlength=len(groups)).astype(np.int64)
+    completed_counts = np.bincount(group_index, weights=processed, minlength=len(groups)).astype(np.int64)
+    return groups, reserved_counts, completed_counts
+
+
+@atomic
+def rebuild_arm_counts(table):
+    groups, reserved_counts, completed_counts = calculate_arm_counts(_row_arrays(table))
+    models.ArmCount.objects.filter(table=table).delete()
+    models.ArmCount.objects.bulk_create([
+        models.ArmCount(table=table, site_id=None if site_id == MISSING_SITE_ID else int(site_id), key=int(key),
+                        randomization_arm=int(randomization_arm), reserved=int(reserved), completed=int(completed))
+        for (site_id, key, randomization_arm), reserved, completed
+        in zip(groups, reserved_counts, completed_counts)])
@@ -0,0 +1,39 @@
+import numpy as np
+
+# Permuted block randomization: each stratum is a run of blocks of randomly chosen sizes, each holding the arms
+# in the allocation ratio in a random order. The same seed always produces the same table.
+
+
+def validate_block_sizes(block_sizes, allocation_ratio):
+    if len(allocation_ratio) != 2 or min(allocation_ratio) < 1:
+        raise ValueError('Allocation ratio must be two positive integers.')
+    if not block_sizes:
+        raise ValueError('At least one block size is required.')
+    for block_size in block_sizes:
+        if block_size < 1 or block_size % sum(allocation_ratio):
+            raise ValueError(f'Block size {block_size} is not a multiple of the allocation ratio total '
+                             f'{sum(allocation_ratio)}.')
+
+
+def permuted_block_arms(number_of_strata, rows_per_stratum, block_sizes, allocation_ratio=(1, 1), seed=None):
+    """
+    Returns a (number_of_strata, rows_per_stratum) array of randomization arms, 1 or 2. The last block of a stratum
+    is cut short when rows_per_stratum is not a multiple of its size.
+    """
+    validate_block_sizes(block_sizes, allocation_ratio)
+    rng = np.random.default_rng(seed)
+    blocks_per_stratum = -(-rows_per_stratum // min(block_sizes))
+    sizes = rng.choice(np.asarray(block_sizes, dtype=np.int64), size=number_of_strata * blocks_per_stratum)
+    block_of_position = np.repeat(np.arange(len(sizes)), sizes)
+    block_starts = np.cumsum(sizes) - sizes
+    positions = np.arange(len(block_of_position))
+    offsets = positions - block_starts[block_of_position]
+    template_arms = np.where(offsets * sum(allocation_ratio) < sizes[block_of_position] * allocation_ratio[0], 1, 2)
+    order = np.argsort(block_of_position + rng.random(len(block_of_position)))
+    arms = np.empty_like(template_arms, dtype=np.int8)
+    arms[order] = template_arms
+    stratum_sizes = sizes.reshape(number_of_strata, blocks_per_stratum).sum(axis=1)
+    stratum_starts = np.cumsum(stratum_sizes) - stratum_sizes
+    stratum_of_position = block_of_position // blocks_per_stratum
+    keep = positions - stratum_starts[stratum_of_position] < rows_per_stratum
+    return arms[keep].reshape(number_of_strata, rows_per_stratum)
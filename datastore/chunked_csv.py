@@ -0,0 +1,170 @@
+import csv
+import io
+import lzma
+import mmap
+import os
+import zipfile
+from collections import Counter, namedtuple
+from . import compression
+from . import table_creation
+
+# Chunked reading and validation of staged CSV uploads for import jobs.
+
+CHUNK_BYTES = 4 * 1024 * 1024
+CHUNK_ROWS = 20000
+IGNORED_FIELDS = ('randomization_arm', 'processed')
+
+ByteRange = namedtuple('ByteRange', ('path', 'start', 'end'))
+ChunkValidation = namedtuple('ChunkValidation', ('row_count', 'potential_column_values', 'site_id_counter',
+                                                 'error'))
+
+
+def read_header(path):
+    with compression.open_text(path) as staged_file:
+        return next(csv.reader(staged_file), None)
+
+
+def read_file_header(binary_file):
+    """
+    Reads the header of an uploaded, possibly compressed, file and rewinds it. Raises ValueError if the file cannot
+    be read as CSV.
+    """
+    try:
+        stream = compression.decompressed(binary_file)
+        text_file = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+        try:
+            return next(csv.reader(text_file), None)
+        finally:
+            text_file.detach()
+            if stream is not binary_file:
+                stream.close()
+    except (csv.Error, EOFError, OSError, UnicodeDecodeError, lzma.LZMAError, zipfile.BadZipFile) as e:
+        raise ValueError(f'Could not read a CSV header ({e})')
+    finally:
+        binary_file.seek(0)
+
+
+def chunks(path, chunk_bytes=CHUNK_BYTES, chunk_rows=CHUNK_ROWS):
+    """
+    Splits a staged file into newline-aligned byte ranges that each worker parses from its own memory map. Files with
+    quotes, whose records may span lines, and compressed files fall back to chunks of records parsed serially.
+    """
+    if os.path.getsize(path) == 0:
+        return iter(())
+    if compression.sniff_path(path):
+        return record_chunks(path, chunk_rows)
+    with open(path, 'rb') as staged_file, mmap.mmap(staged_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        has_quotes = mapped.find(b'"') != -1
+    if has_quotes:
+        return record_chunks(path, chunk_rows)
+    return iter(byte_ranges(path, chunk_bytes))
+
+
+def byte_ranges(path, chunk_bytes=CHUNK_BYTES):
+    ranges = []
+    with open(path, 'rb') as staged_file, mmap.mmap(staged_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        size = len(mapped)
+        start = mapped.find(b'\n') + 1 or size
+        while start < size:
+            end = mapped.find(b'\n', min(start + chunk_bytes, size) - 1) + 1 or size
+            ranges.append(ByteRange(path, start, end))
+            start = end
+    return ranges
+
+
+def record_chunks(path, chunk_rows=CHUNK_ROWS):
+    with compression.open_text(path) as staged_file:
+        reader = csv.reader(staged_file)
+        next(reader, None)
+        records = []
+        for record in reader:
+            if not record:
+                continue
+            records.append(record)
+            if len(records) == chunk_rows:
+                yield records
+                records = []
+        if records:
+            yield records
+
+
+def chunk_records(chunk):
+    if not isinstance(chunk, ByteRange):
+        return chunk
+    with open(chunk.path, 'rb') as staged_file, mmap.mmap(staged_file.fileno(), 0,
+                                                          access=mmap.ACCESS_READ) as mapped:
+        text = mapped[chunk.start:chunk.end].decode('utf-8')
+    return [record for record in csv.reader(io.StringIO(text, newline='')) if record]
+
+
+def _row_dict(header, record):
+    # Matches csv.DictReader: extra values go under None and missing values are None.
+    row = dict(zip(header, record))
+    if len(record) > len(header):
+        row[None] = record[len(header):]
+    for name in header[len(record):]:
+        row[name] = None
+    return row
+
+
+def _validate_row(header, record):
+    row = _row_dict(header, record)
+    table_creation.validate_row_data_core(row)
+    if set(header) != set(row.keys()):
+        raise ValueError(f'Row keys do not match header.')
+
+
+def validate_chunk(header, chunk, site_id_field):
+    """
+    Validates each distinct (column, value) pair of a chunk once, and reports the first error by its offset within the
+    chunk, which line_error turns into a line number of the file.
+    """
+    records = chunk_records(chunk)
+    cell_errors = [{} for _ in header]
+    site_id_index = header.index(site_id_field) if site_id_field else None
+    site_id_counter = Counter() if site_id_field else None
+    error = None
+    row_count = 0
+    for offset, record in enumerate(records):
+        if len(record) != len(header) or 'randomization_arm' not in header:
+            try:
+                _validate_row(header, record)
+            except ValueError as e:
+                error = (offset, e)
+                break
+        else:
+            for column_index, value in enumerate(record):
+                if value not in cell_errors[column_index]:
+                    try:
+                        table_creation.validate_cell_data(header[column_index], value)
+                        cell_errors[column_index][value] = None
+                    except ValueError as e:
+                        cell_errors[column_index][value] = e
+                if cell_errors[column_index][value]:
+                    error = (offset, cell_errors[column_index][value])
+                    break
+            if error:
+                break
+        if site_id_counter is not None:
+            site_id_counter[record[site_id_index]] += 1
+        row_count += 1
+    potential_column_values = {name: {value for value, cell_error in values.items() if not cell_error}
+                               for name, values in zip(header, cell_errors) if name not in IGNORED_FIELDS}
+    return ChunkValidation(row_count, potential_column_values, site_id_counter, error)
+
+
+def line_error(error, rows_before):
+    offset, exception = error
+    return ValueError(f'{exception}. Line {rows_before + offset + 2}.')
+
+
+def encode_chunk(header, chunk, row_transformer, key_columns, option_counts, site_id_field):
+    encoded_rows = []
+    for record in chunk_records(chunk):
+        row = _row_dict(header, record)
+        key = 0
+        for column_name, number_of_options in reversed(list(zip(key_columns, option_counts))):
+            key = key * number_of_options + row_transformer[column_name][row[column_name]]
+        site_id = row_transformer[site_id_field][row[site_id_field]] if site_id_field else None
+        encoded_rows.append((site_id, key, int(row['randomization_arm']), int(row.get('processed') or 0)))
+    return encoded_rows
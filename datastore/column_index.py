@@ -0,0 +1,44 @@
+from bisect import bisect_left
+from functools import lru_cache
+
+# Sorted, case folded index of a column's potential values, so a prefix search is a binary
+# search. Indexes are cached per potential_values string.
+
+
+class ColumnValueIndex:
+    def __init__(self, potential_values_list):
+        self._values = [str(value) for value in potential_values_list]
+        entries = sorted((value.casefold(), index) for index, value in enumerate(self._values))
+        self._folded_values = [folded_value for folded_value, _ in entries]
+        self._indexes = [index for _, index in entries]
+        self._value_to_index = {value: index for index, value in enumerate(self._values)}
+
+    def __len__(self):
+        return len(self._values)
+
+    def search(self, prefix, allowed_indexes=None, limit=20):
+        prefix = prefix.casefold()
+        results = []
+        position = bisect_left(self._folded_values, prefix)
+        while position < len(self._folded_values) and len(results) < limit:
+            if not self._folded_values[position].startswith(prefix):
+                break
+            index = self._indexes[position]
+            if allowed_indexes is None or index in allowed_indexes:
+                results.append((index, self._values[index]))
+            position += 1
+        return results
+
+    def lookup(self, value):
+        return self._value_to_index[str(value)]
+
+
+@lru_cache(maxsize=256)
+def _get_column_value_index(potential_values, number_of_options):
+    if potential_values:
+        return ColumnValueIndex(potential_values.split(','))
+    return ColumnValueIndex(range(number_of_options))
+
+
+def get_column_value_index(column):
+    return _get_column_value_index(column.potential_values, column.number_of_options)
@@ -0,0 +1,66 @@
+import bz2
+import gzip
+import io
+import lzma
+import zipfile
+from contextlib import contextmanager
+
+# Gzip, bzip2, xz and zip uploads, detected from their leading bytes and decompressed as a stream, so staged
+# uploads stay compressed on disk.
+
+GZIP = 'gzip'
+BZIP2 = 'bzip2'
+XZ = 'xz'
+ZIP = 'zip'
+MAGIC_NUMBERS = (
+    (b'\x1f\x8b', GZIP),
+    (b'BZh', BZIP2),
+    (b'\xfd7zXZ\x00', XZ),
+    (b'PK\x03\x04', ZIP),
+)
+
+
+def sniff(binary_file):
+    binary_file.seek(0)
+    magic = binary_file.read(max(len(magic_number) for magic_number, _ in MAGIC_NUMBERS))
+    binary_file.seek(0)
+    for magic_number, compression in MAGIC_NUMBERS:
+        if magic.startswith(magic_number):
+            return compression
+    return None
+
+
+def sniff_path(path):
+    with open(path, 'rb') as binary_file:
+        return sniff(binary_file)
+
+
+def decompressed(binary_file):
+    """
+    Returns a binary stream of the decompressed contents of binary_file, or binary_file itself if it is not
+    compressed. Closing the returned stream does not close binary_file.
+    """
+    compression = sniff(binary_file)
+    if compression == GZIP:
+        return gzip.GzipFile(fileobj=binary_file, mode='rb')
+    if compression == BZIP2:
+        return bz2.BZ2File(binary_file, mode='rb')
+    if compression == XZ:
+        return lzma.LZMAFile(binary_file, mode='rb')
+    if compression == ZIP:
+        archive = zipfile.ZipFile(binary_file)
+        members = [member for member in archive.infolist() if not member.is_dir()]
+        if len(members) != 1:
+            raise ValueError(f'Zip archives must contain exactly one file, found {len(members)}')
+        return archive.open(members[0])
+    return binary_file
+
+
+@contextmanager
+def open_text(path):
+    with open(path, 'rb') as binary_file:
+        text_file = io.TextIOWrapper(decompressed(binary_file), encoding='utf-8', newline='')
+        try:
+            yield text_file
+        finally:
+            text_file.close()
@@ -1,36 +1,43 @@
+from django.contrib.auth.models import User
+from django.db import connections, router
 from django.db.models import Max
 from django.db.transaction import atomic
 from django.urls import reverse
 from django.utils.translation import gettext
+from . import archives
+from . import arm_balance
+from . import column_index
+from . import enrollment
 from . import input_validators
 from . import models
+from . import notifications
+from . import partitioning
+from . import row_history
 from . import row_transforms
+from . import simulation
 from . import table_creation
 from permissions import daos as permissions_daos
 
 
 @atomic
-def create_table(name, owner):
+def create_table(name, owner, pk=None):
     if not owner:
         raise PermissionError('Owner must be provided for a table to be created')
     if not table_creation.user_can_create_tables(owner):
         raise PermissionError('Owner must have permissions to create a table')
-    table = models.Table.objects.create(name=name)
+    table = models.Table.objects.create(pk=pk, name=name)
+    partitioning.create_partition(table.pk)
     permissions_daos.set_table_owner(table, owner)
     return TableCreationDAO(table, owner)
 
 
+@atomic
 def register_user_for_table(request, user, table_activation_code):
-    permissions_daos.register_user_for_table(user, table_activation_code)
-    from django.conf import settings
-    if settings.SLACK_TOKEN:
-        from slacker import Slacker
-        approval_site = request.build_absolute_uri(reverse('access_approval'))
-        slack = Slacker(settings.SLACK_TOKEN)
-        slack_message = f'`{user}` has requested access to table `{activation_code.table.name}` ' \
-                        f'with activation code `{table_activation_code}`. ' \
-                        f'You may approve this request at {approval_site}.'
-        slack.chat.post_message('#study-randomizer', slack_message)
+    activation_code = permissions_daos.register_user_for_table(user, table_activation_code)
+    approval_site = request.build_absolute_uri(reverse('access_approval'))
+    notifications.enqueue(f'`{user}` has requested access to table `{activation_code.table.name}` '
+                          f'with activation code `{table_activation_code}`. '
+                          f'You may approve this request at {approval_site}.')
 
 
 class TableDAO:
@@ -55,12 +62,25 @@ class TableDAO:
         return row_transforms.row_key_to_row_values(row.key, self._get_columns())
 
     def row_dao_iter(self, as_staff):
+        if self._table.is_archived:
+            yield from self._archived_row_dao_iter(as_staff)
+            return
         rows = self._table.row_set.all()
         if as_staff or not self.is_owner:
             rows = rows.filter(reservation=self._user, processed=True).order_by('patient_id')
         for row in rows:
             yield RowDAO(row, self)
 
+    def _archived_row_dao_iter(self, as_staff):
+        rows = archives.archived_rows(self._table)
+        if as_staff or not self.is_owner:
+            rows = sorted((row for row in rows if row.reservation_id == self._user.pk and row.processed),
+                          key=lambda row: row.patient_id)
+        for row in rows:
+            if row.reservation_id == self._user.pk:
+                row.reservation = self._user
+            yield RowDAO(row, self)
+
     def has_site_id_column(self):
         return hasattr(self._table, 'site_id_column')
 
@@ -101,6 +121,8 @@ class TableDAO:
 
 
 class TableCreationDAO(TableDAO):
+    bulk_batch_size = 5000
+
     def __init__(self, table, user):
         super().__init__(table, user)
         if not self.is_owner:
@@ -134,6 +156,53 @@ class TableCreationDAO(TableDAO):
 
     @atomic
     def create_row(self, fields, row_transformer):
+        row = self.build_row(fields, row_transformer)
+        row.save()
+        return row
+
+    @atomic
+    def bulk_create_rows(self, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == self.bulk_batch_size:
+                models.Row.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            models.Row.objects.bulk_create(batch)
+
+    @atomic
+    def bulk_insert_encoded_rows(self, encoded_rows):
+        """
+        Inserts rows given as (site_id, key, randomization_arm, processed) tuples, without building a model instance
+        per row. On PostgreSQL each batch is a single multi-row INSERT, as psycopg2's executemany sends one statement
+        per row.
+        """
+        connection = connections[router.db_for_write(models.Row)]
+        quote_name = connection.ops.quote_name
+        columns = [models.Row._meta.get_field(name).column
+                   for name in ('table', 'site_id', 'key', 'randomization_arm', 'processed')]
+        sql = (f'INSERT INTO {quote_name(models.Row._meta.db_table)} '
+               f'({", ".join(quote_name(column) for column in columns)}) VALUES ')
+        if connection.vendor == 'postgresql':
+            from psycopg2.extras import execute_values
+
+            def insert(cursor, batch):
+                execute_values(cursor.cursor, sql + '%s', batch, page_size=len(batch))
+        else:
+            def insert(cursor, batch):
+                cursor.executemany(sql + f'({", ".join(["%s"] * len(columns))})', batch)
+        with connection.cursor() as cursor:
+            batch = []
+            for site_id, key, randomization_arm, processed in encoded_rows:
+                batch.append((self._table.pk, site_id, key, randomization_arm, bool(processed)))
+                if len(batch) == self.bulk_batch_size:
+                    insert(cursor, batch)
+                    batch = []
+            if batch:
+                insert(cursor, batch)
+
+    def build_row(self, fields, row_transformer):
         cleaned_fields = {}
         site_id_column_name = self._table.site_id_column.name if self.has_site_id_column() else None
         kwargs = {'table': self._table}
@@ -147,11 +216,14 @@ class TableCreationDAO(TableDAO):
             else:
                 cleaned_fields[field_name] = row_transformer[field_name][field_value]
         kwargs['key'] = self.fields_to_row_key(cleaned_fields)
-        return models.Row.objects.create(**kwargs)
+        return models.Row(**kwargs)
 
     def create_activation_codes(self):
         permissions_daos.create_activation_codes(self._table)
 
+    def rebuild_arm_counts(self):
+        arm_balance.rebuild_arm_counts(self._table)
+
     @atomic
     def rename_columns_and_values(self, updates):
         self.rename_randomization_arms(updates)
@@ -180,6 +252,11 @@ class TableCreationDAO(TableDAO):
             setattr(self._table, arm, updates[arm])
         self._table.save()
 
+    def validate_header_against_existing(self, header):
+        header_columns = set(header) - {'randomization_arm', 'processed'}
+        if header_columns != set(self.column_names()) | {self.site_id_column_name()}:
+            raise KeyError('Header does not match the columns of the table')
+
     def validate_potential_column_values_against_existing(self, potential_column_values):
         column_name_to_column = {column.name: column for column in self._get_columns()}
         if len(potential_column_values) != len(column_name_to_column) + 1:
@@ -208,19 +285,41 @@ class TableCreationDAO(TableDAO):
 
 
 class TableReservationDAO(TableDAO):
-    def column_names_and_choices_iter(self, include_site_column=False):
+    def column_names_and_choices_iter(self, include_site_column=False, site_choice_limit=None):
         for column in self._get_columns():
             yield column.name, column.choices()
         if self.has_site_id_column():
             site_id_column = self._table.site_id_column
-            choices = site_id_column.choices()
             if include_site_column or self.site_ids == [None]:
                 if not self.is_owner:
                     raise PermissionError('Only owner has permission to include all site columns')
-                yield site_id_column.name, choices
+                if site_choice_limit and site_id_column.number_of_options > site_choice_limit:
+                    yield site_id_column.name, None
+                else:
+                    yield site_id_column.name, site_id_column.choices()
             elif len(self.site_ids) > 1:
-                choices = [x for i, x in enumerate(choices) if i == 0 or (i - 1) in self.site_ids]
-                yield site_id_column.name, choices
+                if site_choice_limit and len(self.site_ids) > site_choice_limit:
+                    yield site_id_column.name, None
+                else:
+                    choices = site_id_column.choices()
+                    choices = [x for i, x in enumerate(choices) if i == 0 or (i - 1) in self.site_ids]
+                    yield site_id_column.name, choices
+
+    def search_site_id_choices(self, prefix, limit=20):
+        if not self.has_site_id_column():
+            return []
+        allowed_site_ids = None if None in self.site_ids else set(self.site_ids)
+        matches = self._get_site_id_column_index().search(prefix, allowed_site_ids, limit)
+        return [(str(site_id), value) for site_id, value in matches]
+
+    def site_id_for_value(self, value):
+        try:
+            site_id = self._get_site_id_column_index().lookup(value)
+        except KeyError:
+            raise KeyError(gettext('SiteIdInvalidError'))
+        if None not in self.site_ids and site_id not in self.site_ids:
+            raise KeyError(gettext('SiteIdInvalidError'))
+        return site_id
 
     def my_reserved_row_pk(self):
         return self._my_reserved_row().pk
@@ -237,6 +336,11 @@ class TableReservationDAO(TableDAO):
     def get_reserved_row_dao(self):
         return RowDAO(self._my_reserved_row(), self)
 
+    def get_row_dao(self, row_pk):
+        if not self.is_owner:
+            raise PermissionError('Only owner has permission to access rows by key')
+        return RowDAO(self._table.row_set.select_related('reservation').get(pk=row_pk), self)
+
     @atomic
     def reserve_next_available_row(self, fields):
         row = self._get_next_available_row(fields)
@@ -244,42 +348,62 @@ class TableReservationDAO(TableDAO):
             raise LookupError(gettext('NoRowsAvailableError'))
         patient_id = self._calculate_patient_id(row.site_id)
         row.reserve(self._user, patient_id)
+        self._record_transition(row, models.RowChange.RESERVE)
         return row
 
     @atomic
     def complete_my_reservation(self, row_pk):
         row = self._get_row_for_processing(row_pk)
         row.complete_reservation()
+        self._record_transition(row, models.RowChange.COMPLETE)
         return row
 
     @atomic
     def cancel_my_reservation(self, row_pk):
         row = self._get_row_for_processing(row_pk)
         row.cancel_reservation()
+        self._record_transition(row, models.RowChange.CANCEL)
         return row
 
     @atomic
     def complete_override_reservation(self, row_pk):
         row = self._get_row_for_processing_override(row_pk)
         row.complete_reservation()
+        self._record_transition(row, models.RowChange.COMPLETE_OVERRIDE)
         return row
 
     @atomic
     def cancel_override_reservation(self, row_pk):
         row = self._get_row_for_processing_override(row_pk)
         row.cancel_reservation()
+        self._record_transition(row, models.RowChange.CANCEL_OVERRIDE)
         return row
 
+    def _record_transition(self, row, action):
+        models.RowChange.record(row, action, self._user)
+        arm_balance.record_transition(row, action)
+
+    def _validate_not_archived(self, refresh=False):
+        if self._table.is_archived or (
+                refresh and models.Table.objects.filter(pk=self._table.pk, is_archived=True).exists()):
+            raise PermissionError('Archived tables are read-only')
+
     def _get_next_available_row(self, fields):
+        self._validate_not_archived()
         if self.has_reserved_row():
             raise PermissionError(gettext('RowReservationAlreadyExistsError'))
         kwargs = {'reservation__isnull': True, 'processed': False}
         if self.has_site_id_column():
             kwargs['site_id'] = self._process_site_id_column(fields)
         kwargs['key'] = self.fields_to_row_key(fields)
-        return self._table.row_set.filter(**kwargs).select_for_update().first()
+        row = self._table.row_set.filter(**kwargs).select_for_update().first()
+        # archive_table locks the open rows of a table, so once the row is locked an archiving that was in progress
+        # has committed and is seen here.
+        self._validate_not_archived(refresh=True)
+        return row
 
     def _get_row_for_processing(self, row_pk):
+        self._validate_not_archived()
         row = self._my_reserved_row(select_for_update=True)
         if int(row_pk) != row.pk:
             raise KeyError(gettext('RowReservationDoesNotMatchError'))
@@ -291,6 +415,7 @@ class TableReservationDAO(TableDAO):
         return row
 
     def _get_row_for_processing_override(self, row_pk):
+        self._validate_not_archived()
         if not self.is_owner:
             raise PermissionError('Cannot override row processing as non-owner')
         kwargs = {'reservation__isnull': False, 'processed': False}
@@ -319,6 +444,9 @@ class TableReservationDAO(TableDAO):
             return self.site_ids[0]
         raise KeyError(gettext('SiteIdMissingError'))
 
+    def _get_site_id_column_index(self):
+        return column_index.get_column_value_index(self._table.site_id_column)
+
     def _calculate_patient_id(self, site_id):
         all_site_rows = self._table.row_set.select_for_update().filter(site_id=site_id)
         aggregation = all_site_rows.aggregate(Max('patient_id'))
@@ -328,6 +456,250 @@ class TableReservationDAO(TableDAO):
         return ((site_id or 0) + 1) * 10 ** number_of_base_digits + 1
 
 
+class TableExportDAO(TableDAO):
+    chunk_size = 2000
+    row_fields = ('pk', 'key', 'site_id', 'randomization_arm', 'patient_id', 'processed',
+                  'reservation__username', 'reservation_datetime', 'processed_datetime')
+    snapshot_row_fields = ('pk', 'key', 'site_id', 'randomization_arm', 'patient_id', 'processed',
+                           'reservation_id', 'reservation_datetime', 'processed_datetime')
+
+    def __init__(self, table, user):
+        super().__init__(table, user)
+        if not self.is_owner:
+            raise PermissionError('Only owner has permission to export tables')
+
+    def export_filename(self, extension):
+        return f'{self._table.slug()}.{extension}'
+
+    def export_header(self):
+        site_id_column_names = [self.site_id_column_name()] if self.has_site_id_column() else []
+        return ['row_id', 'patient_id'] + site_id_column_names + self.column_names() + \
+               ['randomization_arm', 'processed', 'reserved_by', 'reservation_datetime', 'processed_datetime']
+
+    def snapshot_metadata(self):
+        columns = [{'name': column.name, 'number_of_options': column.number_of_options,
+                    'potential_values': [str(value) for value in column.potential_values_list()]}
+                   for column in self._get_columns()]
+        site_id_column = None
+        if self.has_site_id_column():
+            site_id_column = {'name': self.site_id_column_name(),
+                              'potential_values': [str(value) for value in self.site_id_column_values()]}
+        return {'table': self._table.name, 'columns': columns, 'site_id_column': site_id_column,
+                'arm_names': {arm: self.get_arm_name(arm) for arm in (1, 2)}}
+
+    def snapshot_row_chunks(self):
+        if self._table.is_archived:
+            return self._chunks(archives.archived_row_values(self._table))
+        rows = self._table.row_set.order_by('pk').values_list(*self.snapshot_row_fields)
+        return self._chunks(rows.iterator(chunk_size=self.chunk_size))
+
+    def export_row_values_iter(self, as_of=None):
+        if self._table.is_archived:
+            rows = self._archived_row_values_iter()
+        else:
+            rows = self._table.row_set.order_by('pk').values_list(*self.row_fields)
+            rows = rows.iterator(chunk_size=self.chunk_size)
+        if as_of is None:
+            return rows
+        return self._historical_row_values_iter(rows, as_of)
+
+    def _archived_row_values_iter(self):
+        snapshot = archives.archived_snapshot(self._table)
+        usernames = dict(User.objects.filter(pk__in=snapshot.reservation_ids()).values_list('pk', 'username'))
+        for (pk, key, site_id, randomization_arm, patient_id, processed, reservation_id,
+             *datetimes) in snapshot.row_values_iter():
+            yield (pk, key, site_id, randomization_arm, patient_id, processed, usernames.get(reservation_id),
+                   *datetimes)
+
+    def _historical_row_values_iter(self, rows, as_of):
+        state = row_history.table_state_as_of(self._table, as_of)
+        reservation_ids = {row_state.reservation_id for row_state in state.values()}
+        usernames = dict(User.objects.filter(pk__in=reservation_ids).values_list('pk', 'username'))
+        for pk, key, site_id, randomization_arm, *_ in rows:
+            row_state = state.get(pk, row_history.BLANK_ROW_STATE)
+            yield (pk, key, site_id, randomization_arm, row_state.patient_id, row_state.processed,
+                   usernames.get(row_state.reservation_id), row_state.reservation_datetime,
+                   row_state.processed_datetime)
+
+    def export_records_iter(self, row_values_iter=None):
+        if row_values_iter is None:
+            row_values_iter = self.export_row_values_iter()
+        columns = list(self._get_columns())
+        site_values = self.site_id_column_values() if self.has_site_id_column() else None
+        arm_names = {arm: self.get_arm_name(arm) for arm in (1, 2)}
+        decoded_keys = {}
+        for chunk in self._chunks(row_values_iter):
+            for key in {row_values[1] for row_values in chunk}.difference(decoded_keys):
+                decoded_keys[key] = row_transforms.row_key_to_row_values(key, columns)
+            for pk, key, site_id, arm, patient_id, processed, username, reserved, completed in chunk:
+                site = [site_values[site_id] if site_id is not None else ''] if site_values is not None else []
+                yield [pk, patient_id or ''] + site + decoded_keys[key] + \
+                      [arm_names.get(arm, arm), int(processed), username or '',
+                       reserved.isoformat() if reserved else '', completed.isoformat() if completed else '']
+
+    def _chunks(self, row_values_iter):
+        chunk = []
+        for row_values in row_values_iter:
+            chunk.append(row_values)
+            if len(chunk) == self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+class ArmBalanceDAO(TableDAO):
+    def __init__(self, table, user):
+        super().__init__(table, user)
+        if not self.is_owner:
+            raise PermissionError('Only owner has permission to view arm balance')
+
+    def arm_balance_iter(self):
+        """
+        Yields the site, decoded stratum values and the reserved and completed counts of each arm, per site and
+        stratum. Reads only the ArmCount aggregates.
+        """
+        site_values = self.site_id_column_values() if self.has_site_id_column() else None
+        columns = self._get_columns()
+        balance = {}
+        for arm_count in self._table.armcount_set.all():
+            counts = balance.setdefault((arm_count.site_id, arm_count.key), {1: (0, 0), 2: (0, 0)})
+            counts[arm_count.randomization_arm] = (arm_count.reserved, arm_count.completed)
+        for (site_id, key), counts in balance.items():
+            site = site_values[site_id] if site_values is not None and site_id is not None else None
+            yield site, row_transforms.row_key_to_row_values(key, columns), counts
+
+
+class EnrollmentForecastDAO(TableDAO):
+    def __init__(self, table, user):
+        super().__init__(table, user)
+        if not self.is_owner:
+            raise PermissionError('Only owner has permission to view enrollment forecasts')
+        self._forecasts = None
+
+    def forecasts(self):
+        if self._forecasts is None:
+            enrollment.refresh_rollups(self._table)
+            self._forecasts = enrollment.forecast_exhaustion(self._table)
+        return self._forecasts
+
+    def forecast_iter(self, top_up_days=enrollment.TOP_UP_DAYS):
+        """
+        Yields the site, decoded stratum values, forecast and whether the stratum needs a top-up within
+        top_up_days.
+        """
+        columns = self._get_columns()
+        for forecast in self.forecasts():
+            yield (self._site_label(forecast.site_id), row_transforms.row_key_to_row_values(forecast.key, columns),
+                   forecast, forecast.days_remaining <= top_up_days)
+
+    def sites_needing_top_up(self, top_up_days=enrollment.TOP_UP_DAYS):
+        return [self._site_label(site_id)
+                for site_id in enrollment.sites_needing_top_up(self.forecasts(), top_up_days)]
+
+    def _site_label(self, site_id):
+        if not self.has_site_id_column() or site_id is None:
+            return None
+        return self.site_id_column_values()[site_id]
+
+
+class SimulationDAO(TableDAO):
+    chunk_size = 10000
+
+    def __init__(self, table, user):
+        super().__init__(table, user)
+        if not self.is_owner:
+            raise PermissionError('Only owner has permission to simulate enrollment')
+
+    def number_of_sites(self):
+        return len(self.site_id_column_values()) if self.has_site_id_column() else 1
+
+    def simulation_strata(self):
+        site_ids = []
+        keys = []
+        arms = []
+        available_rows = self._table.row_set.filter(reservation__isnull=True, processed=False).order_by('pk')
+        for site_id, key, randomization_arm in available_rows.values_list(
+                'site_id', 'key', 'randomization_arm').iterator(chunk_size=self.chunk_size):
+            site_ids.append(site_id or 0)
+            keys.append(key)
+            arms.append(randomization_arm)
+        number_of_keys = len(self.key_probabilities())
+        return simulation.build_strata(site_ids, keys, arms, self.number_of_sites(), number_of_keys)
+
+    def key_probabilities(self):
+        return simulation.key_probabilities([column.number_of_options for column in self._get_columns()])
+
+    def simulate(self, site_rate, days, replicates, seed=None, workers=None):
+        return simulation.run_simulation(self.simulation_strata(), self.key_probabilities(), site_rate, days,
+                                         replicates, seed=seed, workers=workers)
+
+    def stratum_iter(self, simulation_result, limit=None):
+        """
+        Yields the site, decoded stratum values and exhaustion probability of the strata that exhausted in any
+        replicate, most likely first.
+        """
+        columns = self._get_columns()
+        site_values = self.site_id_column_values() if self.has_site_id_column() else None
+        number_of_keys = len(self.key_probabilities())
+        probabilities = simulation_result.exhaustion_probabilities
+        for stratum in (-probabilities).argsort(kind='stable')[:limit]:
+            if probabilities[stratum] == 0:
+                break
+            site_id, key = divmod(int(stratum), number_of_keys)
+            site = site_values[site_id] if site_values is not None else None
+            yield site, row_transforms.row_key_to_row_values(key, columns), float(probabilities[stratum])
+
+
+class RowChangeFeedDAO(TableDAO):
+    max_batch_size = 1000
+
+    def __init__(self, table, user):
+        super().__init__(table, user)
+        if not self.is_owner:
+            raise PermissionError('Only owner has permission to read the change feed')
+
+    def changes_since(self, cursor=0, limit=100, visible_before=None):
+        limit = max(1, min(int(limit), self.max_batch_size))
+        changes = self._table.rowchange_set.filter(pk__gt=int(cursor)).order_by('pk')
+        related = ('changed_by', 'reservation') if self._table.is_archived else ('row', 'changed_by', 'reservation')
+        changes = list(changes.select_related(*related)[:limit + 1])
+        if visible_before:
+            # A change can carry an earlier timestamp than one with a lower sequence, so the page stops at the first
+            # change that is still settling rather than skipping over it.
+            settled = next((i for i, change in enumerate(changes) if change.changed_datetime >= visible_before),
+                           len(changes))
+            changes = changes[:settled]
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        next_cursor = changes[-1].pk if changes else int(cursor)
+        if not self._table.is_archived:
+            rows = {change.row_id: change.row for change in changes}
+        elif changes:
+            # Only the rows of the page are read from the archive, and none once a poll has caught up.
+            rows = {row.pk: row for row in archives.archived_rows(self._table,
+                                                                  row_ids={change.row_id for change in changes})}
+        else:
+            rows = {}
+        return [self._change_as_dict(change, rows[change.row_id]) for change in changes], next_cursor, has_more
+
+    def _change_as_dict(self, change, row):
+        column_values = dict(zip(self.column_names(), self.get_row_values(row)))
+        return {'sequence': change.pk, 'row_id': row.pk, 'action': change.action,
+                'changed_by': change.changed_by.username if change.changed_by else None,
+                'changed_datetime': change.changed_datetime.isoformat(),
+                'site': self.site_id_column_values()[row.site_id] if self.has_site_id_column() else None,
+                'columns': column_values, 'randomization_arm': self.get_arm_name(row.randomization_arm),
+                'patient_id': change.patient_id, 'processed': change.processed,
+                'reserved_by': change.reservation.username if change.reservation else None,
+                'reservation_datetime': self._isoformat(change.reservation_datetime),
+                'processed_datetime': self._isoformat(change.processed_datetime)}
+
+    @staticmethod
+    def _isoformat(value):
+        return value.isoformat() if value else None
+
+
 class RowDAO:
     def __init__(self, row, table_dao):
         self._row = row
@@ -0,0 +1,114 @@
+from collections import namedtuple
+from datetime import timedelta
+import numpy as np
+from django.db.models import Count, F, Min, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.db.transaction import atomic
+from django.utils import timezone
+from . import models
+
+# Hourly and daily enrollment rollups per site, and a forecast of when each stratum runs out of available
+# rows.
+
+ROLLUP_SETTLE_SECONDS = 60
+RATE_WINDOW_DAYS = 28
+TOP_UP_DAYS = 14
+MISSING_SITE_ID = -1
+PERIOD_FUNCTIONS = ((models.EnrollmentRollup.HOUR, TruncHour), (models.EnrollmentRollup.DAY, TruncDay))
+ROLLUP_FIELDS = (('reservation_datetime', 'reserved'), ('processed_datetime', 'completed'))
+
+StratumForecast = namedtuple('StratumForecast', ('site_id', 'key', 'remaining', 'daily_rate', 'days_remaining',
+                                                 'exhaustion_datetime'))
+
+
+@atomic
+def refresh_rollups(table, settle_seconds=ROLLUP_SETTLE_SECONDS):
+    """
+    Adds the rows reserved or processed since the table's watermark to its rollups. Rows from the last
+    settle_seconds are left for the next refresh, as their transaction may not have committed yet. Reservations
+    cancelled before they are rolled up are not counted, as a cancellation clears reservation_datetime.
+    """
+    watermark, _ = models.EnrollmentWatermark.objects.select_for_update().get_or_create(table=table)
+    cutoff = timezone.now() - timedelta(seconds=settle_seconds)
+    if watermark.rolled_up_to and watermark.rolled_up_to >= cutoff:
+        return watermark
+    for datetime_field, counter in ROLLUP_FIELDS:
+        window = {f'{datetime_field}__lte': cutoff}
+        if watermark.rolled_up_to:
+            window[f'{datetime_field}__gt'] = watermark.rolled_up_to
+        rows = table.row_set.filter(**window).order_by()
+        for period, truncate in PERIOD_FUNCTIONS:
+            counts = rows.annotate(period_start=truncate(datetime_field)).values('site_id', 'period_start')
+            for count in counts.annotate(count=Count('pk')):
+                _add_to_rollup(table, count['site_id'], period, count['period_start'], counter, count['count'])
+    watermark.rolled_up_to = cutoff
+    watermark.save()
+    return watermark
+
+
+def _add_to_rollup(table, site_id, period, period_start, counter, count):
+    rollups = models.EnrollmentRollup.objects.filter(table=table, site_id=site_id, period=period,
+                                                     period_start=period_start)
+    if not rollups.update(**{counter: F(counter) + count}):
+        models.EnrollmentRollup.objects.create(table=table, site_id=site_id, period=period,
+                                               period_start=period_start, **{counter: count})
+
+
+def project_days_remaining(remaining, used, site_index, site_daily_rates):
+    """
+    Projects the days until each stratum runs out of rows, from the rows remaining and the rows used so far per
+    stratum, the index of each stratum's site, and the daily reservation rate per site. A site's rate is split
+    across its strata in proportion to their use, or evenly if the site has not used any rows yet.
+    """
+    remaining = np.asarray(remaining, dtype=np.float64)
+    used = np.asarray(used, dtype=np.float64)
+    site_used = np.bincount(site_index, weights=used, minlength=len(site_daily_rates))
+    site_strata = np.bincount(site_index, minlength=len(site_daily_rates))
+    share = np.where(site_used[site_index] > 0, used / np.maximum(site_used[site_index], 1),
+                     1 / np.maximum(site_strata[site_index], 1))
+    daily_rates = np.asarray(site_daily_rates, dtype=np.float64)[site_index] * share
+    with np.errstate(divide='ignore'):
+        days_remaining = np.where(daily_rates > 0, remaining / np.where(daily_rates > 0, daily_rates, 1), np.inf)
+    return np.where(remaining > 0, days_remaining, 0), daily_rates
+
+
+def site_daily_rates(table, now, window_days=RATE_WINDOW_DAYS):
+    rollups = models.EnrollmentRollup.objects.filter(table=table, period=models.EnrollmentRollup.DAY,
+                                                     period_start__gte=now - timedelta(days=window_days))
+    first_period_start = rollups.aggregate(Min('period_start'))['period_start__min']
+    if not first_period_start:
+        return {}
+    days = max((now - first_period_start).total_seconds() / 86400, 1)
+    return {rollup['site_id']: rollup['reserved'] / days
+            for rollup in rollups.order_by().values('site_id').annotate(reserved=Sum('reserved'))}
+
+
+def forecast_exhaustion(table, now=None, window_days=RATE_WINDOW_DAYS):
+    now = now or timezone.now()
+    strata = {}
+    for arm_count in table.armcount_set.order_by().values('site_id', 'key').annotate(
+            used=Sum('reserved') + Sum('completed')):
+        strata[(arm_count['site_id'], arm_count['key'])] = [0, arm_count['used']]
+    available_rows = table.row_set.filter(reservation__isnull=True, processed=False).order_by()
+    for available in available_rows.values('site_id', 'key').annotate(remaining=Count('pk')):
+        strata.setdefault((available['site_id'], available['key']), [0, 0])[0] = available['remaining']
+    if not strata:
+        return []
+    strata_keys = sorted(strata, key=lambda stratum: (MISSING_SITE_ID if stratum[0] is None else stratum[0],
+                                                      stratum[1]))
+    site_ids = np.array([MISSING_SITE_ID if site_id is None else site_id for site_id, _ in strata_keys])
+    sites, site_index = np.unique(site_ids, return_inverse=True)
+    rates = site_daily_rates(table, now, window_days)
+    site_rates = [rates.get(None if site_id == MISSING_SITE_ID else int(site_id), 0) for site_id in sites]
+    remaining = [strata[stratum][0] for stratum in strata_keys]
+    used = [strata[stratum][1] for stratum in strata_keys]
+    days_remaining, daily_rates = project_days_remaining(remaining, used, site_index.reshape(-1), site_rates)
+    return [StratumForecast(site_id, key, stratum_remaining, float(daily_rate), float(days),
+                            now + timedelta(days=float(days)) if np.isfinite(days) else None)
+            for (site_id, key), stratum_remaining, daily_rate, days
+            in zip(strata_keys, remaining, daily_rates, days_remaining)]
+
+
+def sites_needing_top_up(forecasts, top_up_days=TOP_UP_DAYS):
+    return sorted({forecast.site_id for forecast in forecasts if forecast.days_remaining <= top_up_days},
+                  key=lambda site_id: MISSING_SITE_ID if site_id is None else site_id)
@@ -0,0 +1,130 @@
+import asyncio
+from importlib import import_module
+from types import SimpleNamespace
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import auth
+from django.db import close_old_connections
+from django.http import parse_cookie
+from django.urls import Resolver404, resolve
+from . import daos
+from . import model_html
+from . import models
+from . import row_events
+
+
+def database_sync_to_async(fn):
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(wrapper)
+
+
+class TableEventStreamApplication:
+    """
+    Serves the `table_events` URL as a server-sent event stream of row state
+    changes for table owners, and hands every other request to Django.
+    """
+    url_name = 'table_events'
+    keepalive_seconds = 15
+    poll_seconds = 1
+
+    def __init__(self, application):
+        self.application = application
+        self.tail_task = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            table_pk = self.get_table_pk(scope['path'])
+            if table_pk is not None:
+                return await self.stream(scope, receive, send, table_pk)
+        return await self.application(scope, receive, send)
+
+    def get_table_pk(self, path):
+        try:
+            match = resolve(path)
+        except Resolver404:
+            return None
+        if match.url_name != self.url_name:
+            return None
+        return match.kwargs['pk']
+
+    async def stream(self, scope, receive, send, table_pk):
+        try:
+            table_reservation_dao = await database_sync_to_async(self.get_table_reservation_dao)(scope, table_pk)
+            cursor = await database_sync_to_async(row_events.latest_change_pk)()
+        except Exception:
+            await send({'type': 'http.response.start', 'status': 403, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+        subscription = row_events.broker.subscribe(table_pk)
+        self.ensure_tailing(cursor)
+        disconnect = asyncio.ensure_future(self.wait_for_disconnect(receive))
+        try:
+            await send({'type': 'http.response.start', 'status': 200,
+                        'headers': [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'),
+                                    (b'x-accel-buffering', b'no')]})
+            await send({'type': 'http.response.body', 'body': b': connected\n\n', 'more_body': True})
+            while not disconnect.done():
+                next_event = asyncio.ensure_future(subscription.get())
+                await asyncio.wait({next_event, disconnect}, timeout=self.keepalive_seconds,
+                                   return_when=asyncio.FIRST_COMPLETED)
+                if not next_event.done():
+                    next_event.cancel()
+                    if not disconnect.done():
+                        await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+                    continue
+                event = await database_sync_to_async(self.render_event)(table_reservation_dao, next_event.result())
+                await send({'type': 'http.response.body', 'more_body': True,
+                            'body': row_events.format_server_sent_event('row', event)})
+        finally:
+            subscription.close()
+            disconnect.cancel()
+
+    def ensure_tailing(self, cursor):
+        """
+        Starts reading row changes from cursor for the subscribed tables of this process, unless already reading.
+        """
+        if self.tail_task is None or self.tail_task.done():
+            self.tail_task = asyncio.ensure_future(self.tail_row_changes(row_events.RowChangeTail(cursor)))
+
+    async def tail_row_changes(self, tail):
+        while row_events.broker.table_pks():
+            for table_pk, event in await database_sync_to_async(tail.read)(row_events.broker.table_pks()):
+                row_events.broker.publish(table_pk, event)
+            await asyncio.sleep(self.poll_seconds)
+
+    @staticmethod
+    async def wait_for_disconnect(receive):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+
+    @staticmethod
+    def get_table_reservation_dao(scope, table_pk):
+        headers = dict(scope.get('headers', []))
+        cookies = parse_cookie(headers.get(b'cookie', b'').decode('latin-1'))
+        session_store = import_module(settings.SESSION_ENGINE).SessionStore
+        session = session_store(session_key=cookies.get(settings.SESSION_COOKIE_NAME))
+        user = auth.get_user(SimpleNamespace(session=session))
+        table = models.Table.objects.get(pk=table_pk, is_hidden=False)
+        table_reservation_dao = daos.TableReservationDAO(table, user)
+        if not table_reservation_dao.is_owner:
+            raise PermissionError('Only owner has permission to follow table events')
+        return table_reservation_dao
+
+    @staticmethod
+    def render_event(table_reservation_dao, event):
+        if event['state'] == row_events.RELOAD:
+            return event
+        html = ''
+        if event['state'] == row_events.RESERVED:
+            row_dao = table_reservation_dao.get_row_dao(event['row'])
+            if row_dao.is_locked_for_reservation():
+                table_html = model_html.TableHtml(table_reservation_dao, as_staff=False)
+                html = model_html.RowHtml(row_dao, table_html).as_html_tr(as_owner=True)
+        return dict(event, html=html)
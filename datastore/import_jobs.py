@@ -0,0 +1,248 @@
+import time
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from datetime import timedelta
+import django
+from django.core.files import File
+from django.db import connections, router
+from django.db.models import F
+from django.urls import reverse
+from django.utils import timezone
+from . import chunked_csv
+from . import daos
+from . import models
+from . import staged_files
+from . import table_creation
+
+# Table imports run as ImportJobs on the process_import_jobs worker, with a process pool validating and encoding
+# chunks of the staged file. Each table is created or appended in a single transaction.
+
+PROGRESS_INTERVAL_SECONDS = 1
+JOB_LEASE = timedelta(minutes=10)
+MAX_ATTEMPTS = 2
+INTERRUPTED_ERROR = 'Import was interrupted, please upload again'
+
+
+def create_import_job(owner, uploaded_file, table_name='', site_id_field='', table=None):
+    uploaded_file.seek(0)
+    return create_staged_import_job(owner, staged_files.stage(uploaded_file.chunks()), table_name, site_id_field,
+                                    table)
+
+
+def create_staged_import_job(owner, staged_file, table_name='', site_id_field='', table=None):
+    kind = models.ImportJob.APPEND if table else models.ImportJob.CREATE
+    return models.ImportJob.objects.create(kind=kind, owner=owner, table=table, table_name=table_name,
+                                           site_id_field=site_id_field or '', staged_file=staged_file)
+
+
+def job_progress(job):
+    progress = {'status': job.status, 'rows_parsed': job.rows_parsed, 'rows_validated': job.rows_validated,
+                'rows_inserted': job.rows_inserted, 'error': job.error, 'table_url': None}
+    if job.status == models.ImportJob.SUCCEEDED and job.table:
+        progress['table_url'] = reverse('table_detail', args=(job.table.pk, job.table.slug()))
+    return progress
+
+
+class ImportProgress:
+    """
+    Writes a job's row counts at most every PROGRESS_INTERVAL_SECONDS. Inside the import transaction the counts
+    are written through a separate connection so that they are visible before the job commits; SQLite cannot
+    take a second writer, so there they are only written once the transaction ends. Without a job the counts
+    are only kept in memory.
+    """
+    fields = ('rows_parsed', 'rows_validated', 'rows_inserted')
+
+    def __init__(self, job):
+        self.job = job
+        self.counts = {field: 0 for field in self.fields}
+        self._last_flush = 0
+        self._side_connection = None
+
+    def add(self, **counts):
+        for field, count in counts.items():
+            self.counts[field] += count
+        if time.monotonic() - self._last_flush >= PROGRESS_INTERVAL_SECONDS:
+            self.flush()
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        if self.job is None:
+            return
+        connection = connections[router.db_for_write(models.ImportJob)]
+        values = dict(self.counts, heartbeat_datetime=timezone.now())
+        if not connection.in_atomic_block:
+            models.ImportJob.objects.filter(pk=self.job.pk).update(**values)
+        elif connection.vendor != 'sqlite':
+            if not self._side_connection:
+                self._side_connection = connection.__class__(dict(connection.settings_dict), connection.alias)
+            values['heartbeat_datetime'] = connection.ops.adapt_datetimefield_value(values['heartbeat_datetime'])
+            quote_name = connection.ops.quote_name
+            assignments = ', '.join(f'{quote_name(field)} = %s' for field in values)
+            with self._side_connection.cursor() as cursor:
+                cursor.execute(f'UPDATE {quote_name(models.ImportJob._meta.db_table)} SET {assignments} '
+                               f'WHERE {quote_name("id")} = %s', list(values.values()) + [self.job.pk])
+
+    def close(self):
+        if self._side_connection:
+            self._side_connection.close()
+            self._side_connection = None
+
+
+class StagedImportMixin:
+    """
+    Reads a staged CSV file in chunks and hands validation and row encoding to a process pool, or runs them in
+    this process when no executor is given.
+    """
+    executor = None
+    progress = None
+    staged_file_path = None
+    max_pending_chunks = 8
+
+    def map_chunks(self, fn, *args):
+        header = chunked_csv.read_header(self.staged_file_path)
+        chunks = chunked_csv.chunks(self.staged_file_path)
+        if self.executor is None:
+            for chunk in chunks:
+                yield fn(header, chunk, *args)
+            return
+        pending = deque()
+        for chunk in chunks:
+            pending.append(self.executor.submit(fn, header, chunk, *args))
+            if len(pending) >= self.max_pending_chunks:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def potential_column_values(self):
+        header = chunked_csv.read_header(self.staged_file_path)
+        if self.site_id_field and self.site_id_field not in (header or []):
+            raise KeyError(f'Site id field `{self.site_id_field}` not found in header')
+        row_count = 0
+        site_id_counter = Counter()
+        potential_column_values = defaultdict(set)
+        for chunk_validation in self.map_chunks(chunked_csv.validate_chunk, self.site_id_field):
+            if chunk_validation.error:
+                raise chunked_csv.line_error(chunk_validation.error, row_count)
+            row_count += chunk_validation.row_count
+            for key, values in chunk_validation.potential_column_values.items():
+                potential_column_values[key] |= values
+            if chunk_validation.site_id_counter:
+                site_id_counter.update(chunk_validation.site_id_counter)
+            self.progress.add(rows_parsed=chunk_validation.row_count, rows_validated=chunk_validation.row_count)
+        if not row_count:
+            raise ValueError('No data.')
+        if site_id_counter and min(site_id_counter.values()) != max(site_id_counter.values()):
+            raise KeyError('All sites must have the same number of rows')
+        return potential_column_values
+
+    def create_rows(self):
+        key_columns = self.table_creation_dao.column_names()
+        option_counts = [len(self.column_value_options[column_name]) for column_name in key_columns]
+        row_transformer = {column_name: dict(values) for column_name, values in self.row_transformer.items()}
+        self.table_creation_dao.bulk_insert_encoded_rows(self._encoded_rows(row_transformer, key_columns,
+                                                                            option_counts))
+
+    def _encoded_rows(self, row_transformer, key_columns, option_counts):
+        for encoded_rows in self.map_chunks(chunked_csv.encode_chunk, row_transformer, key_columns, option_counts,
+                                            self.site_id_field):
+            yield from encoded_rows
+            self.progress.add(rows_inserted=len(encoded_rows))
+
+
+class StagedTableCreator(StagedImportMixin, table_creation.CSVTableCreator):
+    def __init__(self, staged_file_path, table_name, site_id_field, owner, progress, executor=None):
+        super().__init__(File(open(staged_file_path, 'rb')), table_name, site_id_field, owner)
+        self.staged_file_path = staged_file_path
+        self.executor = executor
+        self.progress = progress
+
+
+class StagedTableAppender(StagedImportMixin, table_creation.CSVTableAppender):
+    def __init__(self, staged_file_path, table_creation_dao, progress, executor=None):
+        super().__init__(File(open(staged_file_path, 'rb')), table_creation_dao)
+        self.staged_file_path = staged_file_path
+        self.executor = executor
+        self.progress = progress
+
+
+def recover_stale_jobs():
+    """
+    Requeues running jobs whose heartbeat is older than JOB_LEASE, as their worker has stopped, or fails them once
+    they have been started MAX_ATTEMPTS times. Returns the number of jobs recovered.
+    """
+    now = timezone.now()
+    stale_jobs = models.ImportJob.objects.filter(status=models.ImportJob.RUNNING,
+                                                 heartbeat_datetime__lt=now - JOB_LEASE)
+    recovered = 0
+    for job in stale_jobs.order_by('pk'):
+        # The heartbeat is matched again so a worker that has just written one keeps its job.
+        stale_job = models.ImportJob.objects.filter(pk=job.pk, status=models.ImportJob.RUNNING,
+                                                    heartbeat_datetime=job.heartbeat_datetime)
+        if job.attempts < MAX_ATTEMPTS:
+            recovered += stale_job.update(status=models.ImportJob.PENDING, started_datetime=None, rows_parsed=0,
+                                          rows_validated=0, rows_inserted=0)
+        elif stale_job.update(status=models.ImportJob.FAILED, error=INTERRUPTED_ERROR, finished_datetime=now,
+                              staged_file=None):
+            models.StagedFile.objects.filter(pk=job.staged_file_id).delete()
+            recovered += 1
+    return recovered
+
+
+def claim_next_job():
+    recover_stale_jobs()
+    for job in models.ImportJob.objects.filter(status=models.ImportJob.PENDING).order_by('pk')[:10]:
+        now = timezone.now()
+        claimed = models.ImportJob.objects.filter(pk=job.pk, status=models.ImportJob.PENDING).update(
+            status=models.ImportJob.RUNNING, started_datetime=now, heartbeat_datetime=now,
+            attempts=F('attempts') + 1)
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+def run_import_job(job, workers=None):
+    progress = ImportProgress(job)
+    pool = nullcontext() if workers == 1 else ProcessPoolExecutor(max_workers=workers, initializer=django.setup)
+    try:
+        if not job.staged_file:
+            raise ValueError('Upload was lost, please upload again')
+        with pool as executor, staged_files.local_copy(job.staged_file) as staged_file_path:
+            table_creation_dao = _import(job, staged_file_path, executor, progress)
+        job.table_id = table_creation_dao.table_detail_args()[0]
+        job.status = models.ImportJob.SUCCEEDED
+    except Exception as e:
+        job.status = models.ImportJob.FAILED
+        job.error = f'File read error: {e}'
+    finally:
+        progress.close()
+    for field, count in progress.counts.items():
+        setattr(job, field, count)
+    job.finished_datetime = timezone.now()
+    staged_file = job.staged_file
+    job.staged_file = None
+    job.save()
+    if staged_file:
+        staged_file.delete()
+    return job
+
+
+def _import(job, staged_file_path, executor, progress):
+    if job.kind == models.ImportJob.APPEND:
+        table_creation_dao = daos.TableCreationDAO(job.table, job.owner)
+        table_appender = StagedTableAppender(staged_file_path, table_creation_dao, progress, executor)
+        try:
+            table_appender.calculate_column_value_options()
+            progress.flush()
+            return table_appender.append_to_table()
+        finally:
+            table_appender.csv_file.close()
+    table_creator = StagedTableCreator(staged_file_path, job.table_name, job.site_id_field or None, job.owner,
+                                       progress, executor)
+    try:
+        table_creator.calculate_column_value_options_and_row_count()
+        progress.flush()
+        return table_creator.create_table()
+    finally:
+        table_creator.csv_file.close()
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from datastore import archives
+from datastore import models
+
+
+class Command(BaseCommand):
+    help = 'Moves the rows of a closed study into a compressed archive, leaving the table read-only.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('table', type=int, help='Primary key of the table to archive')
+        parser.add_argument('--batch-size', type=int, default=archives.BATCH_SIZE,
+                            help='Number of rows deleted per transaction')
+
+    def handle(self, *args, **options):
+        try:
+            table = models.Table.objects.get(pk=options['table'])
+            archive = archives.archive_table(table, options['batch_size'])
+        except (models.Table.DoesNotExist, PermissionError, ValueError) as e:
+            raise CommandError(e)
+        self.stdout.write(f'Archived {archive.row_count} rows of `{table.name}`')
@@ -0,0 +1,15 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from datastore import upload_sessions
+
+
+class Command(BaseCommand):
+    help = 'Removes the staged files of resumable uploads that have not received a chunk recently.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=upload_sessions.STALE_SESSION_AGE.total_seconds() / 3600,
+                            help='Expire uploads idle for at least this many hours')
+
+    def handle(self, *args, **options):
+        expired = upload_sessions.expire_stale_sessions(timedelta(hours=options['hours']))
+        self.stdout.write(f'Expired {expired} upload sessions')
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from datastore import daos
+from datastore import models
+from datastore import table_snapshot
+from permissions import daos as permissions_daos
+from randomizer import db_routers
+
+
+class Command(BaseCommand):
+    help = 'Writes a compressed columnar NumPy snapshot (.npz) of a randomization table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('table', type=int, help='Primary key of the table to snapshot')
+        parser.add_argument('output', help='Path of the .npz file to write')
+
+    def handle(self, *args, **options):
+        with db_routers.replica_reads():
+            try:
+                table = models.Table.objects.get(pk=options['table'])
+                table_export_dao = daos.TableExportDAO(table, permissions_daos.get_table_owner(table))
+            except (models.Table.DoesNotExist, PermissionError) as e:
+                raise CommandError(e)
+            with open(options['output'], 'wb') as output_file:
+                table_snapshot.write_table_snapshot(table_export_dao, output_file)
+            self.stdout.write(f'Wrote snapshot of `{table.name}` to {options["output"]}')
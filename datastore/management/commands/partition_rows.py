@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+from datastore import partitioning
+
+
+class Command(BaseCommand):
+    help = ('Partitions the row table by study on PostgreSQL, or if it is already partitioned, adds the partitions '
+            'of any tables that do not have one.')
+
+    def handle(self, *args, **options):
+        if not partitioning.is_supported():
+            raise CommandError('Row partitioning requires PostgreSQL')
+        if partitioning.partition_row_table():
+            self.stdout.write(f'Partitioned {partitioning.ROW_TABLE} into '
+                              f'{len(partitioning.partition_names())} partitions')
+            return
+        created = partitioning.create_missing_partitions()
+        self.stdout.write(f'Created {len(created)} missing partitions')
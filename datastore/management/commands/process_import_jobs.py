@@ -0,0 +1,31 @@
+import time
+from django.core.management.base import BaseCommand
+from datastore import import_jobs
+from datastore import purge
+
+
+class Command(BaseCommand):
+    help = 'Runs pending table import jobs, then pending table purge jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit once no jobs are pending')
+        parser.add_argument('--workers', type=int, help='Number of parsing processes, defaults to the CPU count')
+        parser.add_argument('--poll-seconds', type=float, default=5, help='Seconds to wait when no jobs are pending')
+
+    def handle(self, *args, **options):
+        while True:
+            job = import_jobs.claim_next_job()
+            if job:
+                job = import_jobs.run_import_job(job, options['workers'])
+                self.stdout.write(f'Import job {job.pk}: {job.status} after {job.rows_inserted} rows '
+                                  f'{job.error}'.strip())
+                continue
+            purge_job = purge.claim_next_purge_job()
+            if purge_job:
+                purge_job = purge.run_purge_job(purge_job)
+                self.stdout.write(f'Purge job {purge_job.pk}: {purge_job.status} after {purge_job.objects_purged} '
+                                  f'objects {purge_job.error}'.strip())
+                continue
+            if options['once']:
+                return
+            time.sleep(options['poll_seconds'])
@@ -0,0 +1,46 @@
+import csv
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from datastore import provisioning
+
+
+class Command(BaseCommand):
+    help = 'Creates tables for many studies in parallel from a directory of CSV files or a JSON manifest.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Directory of CSV files, or a JSON manifest of CSV files and generator specs')
+        parser.add_argument('--owner', required=True, help='Username of the staff user who will own the tables')
+        parser.add_argument('--site-id-field', help='Site column of every CSV file in a directory')
+        parser.add_argument('--workers', type=int, help='Number of processes, defaults to the CPU count')
+        parser.add_argument('--report', help='Write the tables and activation codes to this CSV file')
+
+    def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(username=options['owner'])
+            specs = provisioning.load_specs(options['path'], options['site_id_field'])
+        except (User.DoesNotExist, OSError, ValueError) as e:
+            raise CommandError(e)
+        reports = []
+        for report in provisioning.provision_studies(specs, owner, options['workers']):
+            reports.append(report)
+            if report.error:
+                self.stderr.write(f'`{report.name}`: failed after {report.seconds:.1f}s. {report.error}')
+            else:
+                self.stdout.write(f'`{report.name}`: table {report.table_pk} with {report.rows} rows and '
+                                  f'{len(report.activation_codes)} activation codes in {report.seconds:.1f}s')
+        if options['report']:
+            self.write_report(options['report'], reports)
+        failed = [report.name for report in reports if report.error]
+        if failed:
+            raise CommandError(f'{len(failed)} of {len(reports)} studies failed: {", ".join(failed)}')
+
+    @staticmethod
+    def write_report(path, reports):
+        with open(path, 'w', newline='') as report_file:
+            writer = csv.writer(report_file)
+            writer.writerow(['study', 'table', 'rows', 'seed', 'site', 'activation_code', 'error'])
+            for report in reports:
+                for activation_code in report.activation_codes or [()]:
+                    site, code = activation_code if len(activation_code) == 2 else ('', ''.join(activation_code))
+                    writer.writerow([report.name, report.table_pk or '', report.rows,
+                                     '' if report.seed is None else report.seed, site, code, report.error or ''])
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from datastore import models
+from datastore import purge
+
+
+class Command(BaseCommand):
+    help = 'Deletes tables and everything referring to them in batches, each committed separately.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tables', type=int, nargs='+', help='Primary keys of the tables to purge')
+        parser.add_argument('--batch-size', type=int, default=purge.BATCH_SIZE,
+                            help='Number of objects deleted per transaction')
+
+    def handle(self, *args, **options):
+        tables = list(models.Table.objects.filter(pk__in=options['tables']))
+        missing = set(options['tables']).difference(table.pk for table in tables)
+        if missing:
+            raise CommandError(f'No tables with primary keys {", ".join(str(pk) for pk in sorted(missing))}')
+        for table in tables:
+            self.stdout.write(f'Purging `{table.name}`')
+            purged = purge.purge_table(table, options['batch_size'], self.report_progress)
+            self.stdout.write(f'Purged `{table.name}` and {sum(purged.values()) - 1} related objects')
+
+    def report_progress(self, model, purged):
+        self.stdout.write(f'  {model._meta.verbose_name_plural}: {purged}')
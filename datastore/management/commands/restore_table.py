@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from datastore import archives
+from datastore import models
+
+
+class Command(BaseCommand):
+    help = 'Moves the rows of an archived table back into the row table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('table', type=int, help='Primary key of the table to restore')
+        parser.add_argument('--batch-size', type=int, default=archives.BATCH_SIZE,
+                            help='Number of rows inserted per transaction')
+
+    def handle(self, *args, **options):
+        try:
+            table = models.Table.objects.get(pk=options['table'])
+            restored = archives.restore_table(table, options['batch_size'])
+        except (models.Table.DoesNotExist, models.TableArchive.DoesNotExist) as e:
+            raise CommandError(e)
+        self.stdout.write(f'Restored {restored} rows of `{table.name}`')
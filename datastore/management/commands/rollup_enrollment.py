@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from datastore import enrollment
+from datastore import models
+
+
+class Command(BaseCommand):
+    help = 'Rolls up hourly and daily reservations and completions per site for each table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--table', type=int, action='append', help='Primary key of a table to roll up')
+        parser.add_argument('--settle-seconds', type=int, default=enrollment.ROLLUP_SETTLE_SECONDS,
+                            help='Leave out rows changed within this many seconds')
+
+    def handle(self, *args, **options):
+        tables = models.Table.objects.order_by('pk')
+        if options['table']:
+            tables = tables.filter(pk__in=options['table'])
+        for table in tables:
+            watermark = enrollment.refresh_rollups(table, options['settle_seconds'])
+            self.stdout.write(f'`{table.name}`: rolled up to {watermark.rolled_up_to}')
@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand
+from datastore import notifications
+
+
+class Command(BaseCommand):
+    help = 'Sends queued notifications to their sinks, retrying failures with backoff.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit once no notifications are due')
+        parser.add_argument('--batch-size', type=int, default=50, help='Notifications claimed at a time')
+        parser.add_argument('--poll-seconds', type=float, default=5,
+                            help='Seconds to wait when no notifications are due')
+
+    def handle(self, *args, **options):
+        while True:
+            sent = notifications.send_batch(options['batch_size'])
+            for notification in sent:
+                if notification.last_error:
+                    self.stderr.write(f'{notification}: attempt {notification.attempts} failed. '
+                                      f'{notification.last_error}')
+            if not sent:
+                if options['once']:
+                    return
+                time.sleep(options['poll_seconds'])
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from datastore import daos
+from datastore import models
+from permissions import daos as permissions_daos
+from randomizer import db_routers
+
+
+class Command(BaseCommand):
+    help = 'Simulates enrollment into a randomization table and reports stratum exhaustion and arm imbalance.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('table', type=int, help='Primary key of the table to simulate')
+        parser.add_argument('--patients-per-site-per-week', type=float, default=5,
+                            help='Expected number of patients each site enrolls per week')
+        parser.add_argument('--weeks', type=int, default=52, help='Number of weeks of enrollment')
+        parser.add_argument('--replicates', type=int, default=10000, help='Number of replicates to run')
+        parser.add_argument('--seed', type=int, help='Seed for reproducible results')
+        parser.add_argument('--workers', type=int, help='Number of worker processes, defaults to the CPU count')
+        parser.add_argument('--strata', type=int, default=20, help='Number of strata most likely to run out to list')
+
+    def handle(self, *args, **options):
+        with db_routers.replica_reads():
+            self.simulate(options)
+
+    def simulate(self, options):
+        try:
+            table = models.Table.objects.get(pk=options['table'])
+            simulation_dao = daos.SimulationDAO(table, permissions_daos.get_table_owner(table))
+        except (models.Table.DoesNotExist, PermissionError) as e:
+            raise CommandError(e)
+        result = simulation_dao.simulate(options['patients_per_site_per_week'] / 7, options['weeks'] * 7,
+                                         options['replicates'], seed=options['seed'], workers=options['workers'])
+        self.stdout.write(f'`{table.name}`: {result.replicates} replicates')
+        self.stdout.write(f'Probability that any stratum runs out of rows: {result.any_exhaustion_probability:.3f}')
+        for label, quantiles in (('Total arm imbalance', result.total_imbalance_quantiles),
+                                 ('Largest site arm imbalance', result.site_imbalance_quantiles),
+                                 ('Largest stratum arm imbalance', result.stratum_imbalance_quantiles)):
+            values = ', '.join(f'{quantile:.0%}: {value:.1f}' for quantile, value in quantiles.items())
+            self.stdout.write(f'{label}: {values}')
+        for site, row_values, probability in simulation_dao.stratum_iter(result, options['strata']):
+            stratum = ', '.join(str(value) for value in ([site] if site is not None else []) + row_values)
+            self.stdout.write(f'{stratum}: runs out in {probability:.1%} of replicates')
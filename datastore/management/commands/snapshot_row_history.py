@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from datastore import models
+from datastore import row_history
+
+
+class Command(BaseCommand):
+    help = 'Compacts recent row changes into a history snapshot for each table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--table', type=int, action='append', help='Primary key of a table to snapshot')
+        parser.add_argument('--settle-seconds', type=int, default=row_history.SNAPSHOT_SETTLE_SECONDS,
+                            help='Leave out changes made within this many seconds')
+
+    def handle(self, *args, **options):
+        tables = models.Table.objects.order_by('pk')
+        if options['table']:
+            tables = tables.filter(pk__in=options['table'])
+        for table in tables:
+            previous_snapshot = row_history.latest_snapshot(table)
+            snapshot = row_history.create_snapshot(table, options['settle_seconds'])
+            if snapshot and snapshot != previous_snapshot:
+                self.stdout.write(f'`{table.name}`: snapshot at sequence {snapshot.sequence} '
+                                  f'with {snapshot.row_count} rows')
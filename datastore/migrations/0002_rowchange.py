@@ -0,0 +1,39 @@
+# Generated by Django 3.0.8 on 2026-10-19 04:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('datastore', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RowChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('reserve', 'Reserve'), ('complete', 'Complete'), ('cancel', 'Cancel'), ('complete_override', 'Complete (override)'), ('cancel_override', 'Cancel (override)'), ('admin_edit', 'Edit (admin)')], max_length=32)),
+                ('changed_datetime', models.DateTimeField()),
+                ('patient_id', models.IntegerField(blank=True, null=True)),
+                ('processed', models.BooleanField()),
+                ('processed_datetime', models.DateTimeField(blank=True, null=True)),
+                ('reservation_datetime', models.DateTimeField(blank=True, null=True)),
+                ('changed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('reservation', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('row', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='datastore.Row')),
+                ('table', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='datastore.Table')),
+            ],
+            options={
+                'ordering': ('pk',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='rowchange',
+            index=models.Index(fields=['table', 'id'], name='datastore_r_table_i_1365e9_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.0.8 on 2026-10-19 04:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datastore', '0002_rowchange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RowHistorySnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.BigIntegerField()),
+                ('max_changed_datetime', models.DateTimeField()),
+                ('created_datetime', models.DateTimeField(auto_now_add=True)),
+                ('row_count', models.IntegerField()),
+                ('state', models.BinaryField()),
+                ('table', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='datastore.Table')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='rowhistorysnapshot',
+            index=models.Index(fields=['table', 'sequence'], name='datastore_r_table_i_40045a_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 3.0.8 on 2026-10-19 04:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_arm_counts(apps, schema_editor):
+    # Tables created before arm counts existed are counted from their rows, as arm_balance.rebuild_arm_counts would.
+    ArmCount = apps.get_model('datastore', 'ArmCount')
+    Table = apps.get_model('datastore', 'Table')
+    for table in Table.objects.order_by('pk').iterator():
+        counts = table.row_set.order_by().values('site_id', 'key', 'randomization_arm').annotate(
+            reserved=models.Count('pk', filter=models.Q(reservation__isnull=False, processed=False)),
+            completed=models.Count('pk', filter=models.Q(processed=True)))
+        ArmCount.objects.bulk_create((ArmCount(table=table, **count) for count in counts.iterator()),
+                                     batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datastore', '0003_rowhistorysnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArmCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('site_id', models.IntegerField(blank=True, null=True)),
+                ('key', models.IntegerField()),
+                ('randomization_arm', models.IntegerField()),
+                ('reserved', models.IntegerField(default=0)),
+                ('completed', models.IntegerField(default=0)),
+                ('table', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='datastore.Table')),
+            ],
+            options={
+                'ordering': ('site_id', 'key', 'randomization_arm'),
+                'unique_together': {('table', 'site_id', 'key', 'randomization_arm')},
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='armcount',
+            constraint=models.UniqueConstraint(condition=models.Q(site_id__isnull=True), fields=('table', 'key', 'randomization_arm'), name='datastore_armcount_unique_without_site'),
+        ),
+        migrations.RunPython(backfill_arm_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.0.8 on 2026-10-19 04:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datastore', '0004_armcount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnrollmentWatermark',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rolled_up_to', models.DateTimeField(blank=True, null=True)),
+                ('table', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='datastore.Table')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EnrollmentRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('site_id', models.IntegerField(blank=True, null=True)),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=8)),
+                ('period_start', models.DateTimeField()),
+                ('reserved', models.IntegerField(default=0)),
+                ('completed', models.IntegerField(default=0)),
+                ('table', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='datastore.Table')),
+            ],
+            options={
+                'ordering': ('period', 'period_start', 'site_id'),
+                'unique_together': {('table', 'site_id', 'period', 'period_start')},
+            },
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 3.0.8 on 2026-10-19 04:56
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('datastore', '0005_enrollmentrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StagedFile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('size', models.BigIntegerField(default=0)),
+                ('created_datetime', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StagedFileChunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('offset', models.BigIntegerField()),
+                ('data', models.BinaryField()),
+                ('staged_file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='datastore.StagedFile')),
+            ],
+            options={
+                'ordering': ('offset',),
+                'unique_together': {('staged_file', 'offset')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('create', 'Create table'), ('append', 'Append to table')], max_length=16)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='pending', max_length=16)),
+                ('table_name', models.TextField(blank=True)),
+                ('site_id_field', models.TextField(blank=True)),
+                ('rows_parsed', models.IntegerField(default=0)),
+                ('rows_validated', models.IntegerField(default=0)),
+                ('rows_inserted', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_datetime', models.DateTimeField(default=django.utils.timezone.now)),
+                ('started_datetime', models.DateTimeField(blank=True, null=True)),
+                ('finished_datetime', models.DateTimeField(blank=True, null=True)),
+                ('heartbeat_datetime', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('staged_file', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='datastore.StagedFile')),
+                ('table', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='datastore.Table')),
+            ],
+            options={
+                'ordering': ('pk',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='importjob',
+            index=models.Index(fields=['status'], name='datastore_i_status_23624b_idx'),
+        ),
+    ]
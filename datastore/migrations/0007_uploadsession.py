@@ -0,0 +1,39 @@
+# Generated by Django 3.0.8 on 2026-10-19 05:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('datastore', '0006_importjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('uploading', 'Uploading'), ('complete', 'Complete'), ('failed', 'Failed')], default='uploading', max_length=16)),
+                ('table_name', models.TextField(blank=True)),
+                ('site_id_field', models.TextField(blank=True)),
+                ('total_size', models.BigIntegerField()),
+                ('received_size', models.BigIntegerField(default=0)),
+                ('sha256', models.CharField(max_length=64)),
+                ('error', models.TextField(blank=True)),
+                ('created_datetime', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_datetime', models.DateTimeField(default=django.utils.timezone.now)),
+                ('import_job', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='datastore.ImportJob')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('staged_file', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='datastore.StagedFile')),
+                ('table', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='datastore.Table')),
+            ],
+            options={
+                'ordering': ('pk',),
+            },
+        ),
+    ]
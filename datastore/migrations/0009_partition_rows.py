@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def partition_rows(apps, schema_editor):
+    if getattr(settings, 'ROW_PARTITIONING', False) and schema_editor.connection.vendor == 'postgresql':
+        from datastore import partitioning
+        partitioning.partition_row_table(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datastore', '0008_notification'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_rows, migrations.RunPython.noop),
+    ]
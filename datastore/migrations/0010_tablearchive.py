@@ -0,0 +1,30 @@
+# Generated by Django 3.0.8 on 2026-10-19 05:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datastore', '0009_partition_rows'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='table',
+            name='is_archived',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='TableArchive',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('snapshot', models.BinaryField()),
+                ('row_count', models.IntegerField()),
+                ('archived_datetime', models.DateTimeField(default=django.utils.timezone.now)),
+                ('table', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='datastore.Table')),
+            ],
+        ),
+    ]
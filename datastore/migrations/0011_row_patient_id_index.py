@@ -0,0 +1,17 @@
+# Generated by Django 3.0.8 on 2026-10-19 05:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datastore', '0010_tablearchive'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='row',
+            index=models.Index(fields=['patient_id'], name='datastore_r_patient_3fef6d_idx'),
+        ),
+    ]
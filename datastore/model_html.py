@@ -112,3 +112,84 @@ class ColumnUpdateHtml(HtmlTableGenerator):
         arm_name = self.table_reservation_dao.get_arm_name(arm)
         arm_name_input = input_tag(f'arm_{arm}', arm_name)
         return tr_tag(first_column +  tds([arm_name, arm_name_input]))
+
+
+class ArmBalanceHtml(HtmlTableGenerator):
+    def __init__(self, arm_balance_dao):
+        self.arm_balance_dao = arm_balance_dao
+
+    def get_html_table_header(self):
+        arm_columns = []
+        for arm in (1, 2):
+            arm_name = self.arm_balance_dao.get_arm_name(arm)
+            arm_columns += [f'{arm_name} Reserved', f'{arm_name} Completed']
+        columns = (self.get_site_id_columns(self.arm_balance_dao) + self.arm_balance_dao.column_names() +
+                   arm_columns + ['Completed Difference'])
+        return thead_tag(tr_tag(ths(columns)))
+
+    def get_html_table_body(self):
+        rows_html = ''
+        totals = [0, 0, 0, 0]
+        for site, row_values, counts in self.arm_balance_dao.arm_balance_iter():
+            arm_values = list(counts[1]) + list(counts[2])
+            totals = [total + value for total, value in zip(totals, arm_values)]
+            site_values = [site or ''] if self.arm_balance_dao.has_site_id_column() else []
+            rows_html += tr_tag(tds(site_values + row_values + arm_values + [arm_values[1] - arm_values[3]]))
+        column_count = len(self.get_site_id_columns(self.arm_balance_dao)) + len(self.arm_balance_dao.column_names())
+        if not rows_html:
+            return tbody_tag(tr_tag(td_tag('No rows in table', colspan=column_count + 5)))
+        total_tds = td_tag('Total', colspan=column_count) if column_count else ''
+        rows_html += tr_tag(total_tds + tds(totals + [totals[1] - totals[3]]))
+        return tbody_tag(rows_html)
+
+
+class EnrollmentForecastHtml(HtmlTableGenerator):
+    def __init__(self, enrollment_forecast_dao):
+        self.enrollment_forecast_dao = enrollment_forecast_dao
+
+    def get_html_table_header(self):
+        columns = (self.get_site_id_columns(self.enrollment_forecast_dao) +
+                   self.enrollment_forecast_dao.column_names() +
+                   ['Rows Remaining', 'Rows Per Day', 'Days Remaining', 'Projected Exhaustion', 'Needs Top-up'])
+        return thead_tag(tr_tag(ths(columns)))
+
+    def get_html_table_body(self):
+        rows_html = ''
+        for site, row_values, forecast, needs_top_up in self.enrollment_forecast_dao.forecast_iter():
+            site_values = [site or ''] if self.enrollment_forecast_dao.has_site_id_column() else []
+            if forecast.exhaustion_datetime:
+                days_remaining = f'{forecast.days_remaining:.1f}'
+                exhaustion = forecast.exhaustion_datetime.strftime('%Y-%m-%d')
+            else:
+                days_remaining = exhaustion = 'No recent enrollment'
+            rows_html += tr_tag(tds(site_values + row_values +
+                                    [forecast.remaining, f'{forecast.daily_rate:.2f}', days_remaining, exhaustion,
+                                     'Yes' if needs_top_up else '']))
+        if not rows_html:
+            column_count = (len(self.get_site_id_columns(self.enrollment_forecast_dao)) +
+                            len(self.enrollment_forecast_dao.column_names()) + 5)
+            rows_html = tr_tag(td_tag('No rows in table', colspan=column_count))
+        return tbody_tag(rows_html)
+
+
+class SimulationHtml(HtmlTableGenerator):
+    def __init__(self, simulation_dao, simulation_result, limit=50):
+        self.simulation_dao = simulation_dao
+        self.simulation_result = simulation_result
+        self.limit = limit
+
+    def get_html_table_header(self):
+        columns = (self.get_site_id_columns(self.simulation_dao) + self.simulation_dao.column_names() +
+                   ['Exhaustion Probability'])
+        return thead_tag(tr_tag(ths(columns)))
+
+    def get_html_table_body(self):
+        rows_html = ''
+        for site, row_values, probability in self.simulation_dao.stratum_iter(self.simulation_result, self.limit):
+            site_values = [site or ''] if self.simulation_dao.has_site_id_column() else []
+            rows_html += tr_tag(tds(site_values + row_values + [f'{probability:.1%}']))
+        if not rows_html:
+            column_count = (len(self.get_site_id_columns(self.simulation_dao)) +
+                            len(self.simulation_dao.column_names()) + 1)
+            rows_html = tr_tag(td_tag('No stratum ran out of rows in any replicate', colspan=column_count))
+        return tbody_tag(rows_html)
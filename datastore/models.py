@@ -7,6 +7,7 @@ from django.utils import timezone
 class Table(models.Model):
     name = models.TextField(unique=True)
     is_hidden = models.BooleanField(default=False)
+    is_archived = models.BooleanField(default=False)
     arm_1 = models.TextField(blank=True, null=True)
     arm_2 = models.TextField(blank=True, null=True)
 
@@ -32,25 +33,296 @@ class Row(models.Model):
         return f'Table={self.table.name}, Patient ID={self.patient_id}, Site ID={self.site_id}'
 
     class Meta:
-        indexes = [models.Index(fields=['key']), models.Index(fields=['table'])]
+        indexes = [models.Index(fields=['key']), models.Index(fields=['table']), models.Index(fields=['patient_id'])]
         ordering = ('patient_id', 'pk')
 
     def reserve(self, user, patient_id):
         self.reservation = user
         self.reservation_datetime = timezone.localtime()
         self.patient_id = patient_id
-        self.save()
+        self._save_fields('reservation', 'reservation_datetime', 'patient_id')
 
     def complete_reservation(self):
         self.processed = True
         self.processed_datetime = timezone.localtime()
-        self.save()
+        self._save_fields('processed', 'processed_datetime')
 
     def cancel_reservation(self):
         self.reservation = None
         self.reservation_datetime = None
         self.patient_id = None
-        self.save()
+        self._save_fields('reservation', 'reservation_datetime', 'patient_id')
+
+    def _save_fields(self, *field_names):
+        # Filtering on the table as well as the pk prunes a partitioned row table to the table's partition.
+        Row.objects.filter(pk=self.pk, table_id=self.table_id).update(
+            **{field_name: getattr(self, field_name) for field_name in field_names})
+
+
+class RowChangeQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        raise PermissionError('Row changes are append-only')
+
+    def delete(self):
+        raise PermissionError('Row changes are append-only')
+
+
+class RowChange(models.Model):
+    RESERVE = 'reserve'
+    COMPLETE = 'complete'
+    CANCEL = 'cancel'
+    COMPLETE_OVERRIDE = 'complete_override'
+    CANCEL_OVERRIDE = 'cancel_override'
+    ADMIN_EDIT = 'admin_edit'
+    ACTION_CHOICES = ((RESERVE, 'Reserve'), (COMPLETE, 'Complete'), (CANCEL, 'Cancel'),
+                      (COMPLETE_OVERRIDE, 'Complete (override)'), (CANCEL_OVERRIDE, 'Cancel (override)'),
+                      (ADMIN_EDIT, 'Edit (admin)'))
+
+    table = models.ForeignKey(Table, on_delete=models.CASCADE)
+    # Changes outlive their rows, such as the rows of an archived table, whose row ids are kept in the archive.
+    row = models.ForeignKey(Row, on_delete=models.DO_NOTHING, db_constraint=False)
+    action = models.CharField(max_length=32, choices=ACTION_CHOICES)
+    changed_by = models.ForeignKey(User, blank=True, null=True, on_delete=models.SET_NULL, related_name='+')
+    changed_datetime = models.DateTimeField()
+    patient_id = models.IntegerField(blank=True, null=True)
+    processed = models.BooleanField()
+    reservation = models.ForeignKey(User, blank=True, null=True, on_delete=models.SET_NULL, related_name='+')
+    processed_datetime = models.DateTimeField(blank=True, null=True)
+    reservation_datetime = models.DateTimeField(blank=True, null=True)
+
+    # Only deleting the table, through the base manager, removes its changes.
+    objects = RowChangeQuerySet.as_manager()
+
+    def __str__(self):
+        return f'Table={self.table_id}, Sequence={self.pk}, Row={self.row_id}, Action={self.action}'
+
+    class Meta:
+        indexes = [models.Index(fields=['table', 'id'])]
+        ordering = ('pk',)
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise PermissionError('Row changes are append-only')
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def record(cls, row, action, user):
+        return cls.objects.create(table_id=row.table_id, row=row, action=action, changed_by=user,
+                                  changed_datetime=timezone.localtime(), patient_id=row.patient_id,
+                                  processed=row.processed, reservation=row.reservation,
+                                  processed_datetime=row.processed_datetime,
+                                  reservation_datetime=row.reservation_datetime)
+
+
+class RowHistorySnapshot(models.Model):
+    table = models.ForeignKey(Table, on_delete=models.CASCADE)
+    sequence = models.BigIntegerField()
+    max_changed_datetime = models.DateTimeField()
+    created_datetime = models.DateTimeField(auto_now_add=True)
+    row_count = models.IntegerField()
+    state = models.BinaryField()
+
+    def __str__(self):
+        return f'Table={self.table_id}, Sequence={self.sequence}, Rows={self.row_count}'
+
+    class Meta:
+        indexes = [models.Index(fields=['table', 'sequence'])]
+
+
+class ArmCount(models.Model):
+    table = models.ForeignKey(Table, on_delete=models.CASCADE)
+    site_id = models.IntegerField(blank=True, null=True)
+    key = models.IntegerField()
+    randomization_arm = models.IntegerField()
+    reserved = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f'Table={self.table_id}, Site ID={self.site_id}, Key={self.key}, Arm={self.randomization_arm}'
+
+    class Meta:
+        ordering = ('site_id', 'key', 'randomization_arm')
+        unique_together = (('table', 'site_id', 'key', 'randomization_arm'),)
+        # NULLs are distinct in unique_together, so counts of tables without a site column need their own constraint.
+        constraints = [models.UniqueConstraint(fields=['table', 'key', 'randomization_arm'],
+                                               condition=models.Q(site_id__isnull=True),
+                                               name='datastore_armcount_unique_without_site')]
+
+
+class EnrollmentRollup(models.Model):
+    HOUR = 'hour'
+    DAY = 'day'
+    PERIOD_CHOICES = ((HOUR, 'Hour'), (DAY, 'Day'))
+
+    table = models.ForeignKey(Table, on_delete=models.CASCADE)
+    site_id = models.IntegerField(blank=True, null=True)
+    period = models.CharField(max_length=8, choices=PERIOD_CHOICES)
+    period_start = models.DateTimeField()
+    reserved = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f'Table={self.table_id}, Site ID={self.site_id}, {self.period} starting {self.period_start}'
+
+    class Meta:
+        ordering = ('period', 'period_start', 'site_id')
+        unique_together = (('table', 'site_id', 'period', 'period_start'),)
+
+
+class EnrollmentWatermark(models.Model):
+    table = models.OneToOneField(Table, on_delete=models.CASCADE)
+    rolled_up_to = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f'Table={self.table_id}, rolled up to {self.rolled_up_to}'
+
+
+class StagedFile(models.Model):
+    size = models.BigIntegerField(default=0)
+    created_datetime = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'Staged file {self.pk} ({self.size} bytes)'
+
+
+class StagedFileChunk(models.Model):
+    staged_file = models.ForeignKey(StagedFile, on_delete=models.CASCADE)
+    offset = models.BigIntegerField()
+    data = models.BinaryField()
+
+    def __str__(self):
+        return f'Staged file {self.staged_file_id}, Offset={self.offset}'
+
+    class Meta:
+        ordering = ('offset',)
+        unique_together = (('staged_file', 'offset'),)
+
+
+class ImportJob(models.Model):
+    CREATE = 'create'
+    APPEND = 'append'
+    KIND_CHOICES = ((CREATE, 'Create table'), (APPEND, 'Append to table'))
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = ((PENDING, 'Pending'), (RUNNING, 'Running'), (SUCCEEDED, 'Succeeded'), (FAILED, 'Failed'))
+
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    table = models.ForeignKey(Table, blank=True, null=True, on_delete=models.SET_NULL)
+    table_name = models.TextField(blank=True)
+    site_id_field = models.TextField(blank=True)
+    staged_file = models.ForeignKey(StagedFile, blank=True, null=True, on_delete=models.SET_NULL)
+    rows_parsed = models.IntegerField(default=0)
+    rows_validated = models.IntegerField(default=0)
+    rows_inserted = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_datetime = models.DateTimeField(default=timezone.now)
+    started_datetime = models.DateTimeField(blank=True, null=True)
+    finished_datetime = models.DateTimeField(blank=True, null=True)
+    heartbeat_datetime = models.DateTimeField(blank=True, null=True)
+    attempts = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f'Import job {self.pk} ({self.kind}, {self.status})'
+
+    class Meta:
+        ordering = ('pk',)
+        indexes = [models.Index(fields=['status'])]
+
+    def is_finished(self):
+        return self.status in (self.SUCCEEDED, self.FAILED)
+
+
+class UploadSession(models.Model):
+    UPLOADING = 'uploading'
+    COMPLETE = 'complete'
+    FAILED = 'failed'
+    STATUS_CHOICES = ((UPLOADING, 'Uploading'), (COMPLETE, 'Complete'), (FAILED, 'Failed'))
+
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=UPLOADING)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    table = models.ForeignKey(Table, blank=True, null=True, on_delete=models.CASCADE)
+    table_name = models.TextField(blank=True)
+    site_id_field = models.TextField(blank=True)
+    staged_file = models.ForeignKey(StagedFile, blank=True, null=True, on_delete=models.SET_NULL)
+    total_size = models.BigIntegerField()
+    received_size = models.BigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64)
+    import_job = models.OneToOneField(ImportJob, blank=True, null=True, on_delete=models.SET_NULL)
+    error = models.TextField(blank=True)
+    created_datetime = models.DateTimeField(default=timezone.now)
+    updated_datetime = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'Upload session {self.pk} ({self.received_size}/{self.total_size} bytes, {self.status})'
+
+    class Meta:
+        ordering = ('pk',)
+
+
+class TableArchive(models.Model):
+    table = models.OneToOneField(Table, on_delete=models.CASCADE)
+    snapshot = models.BinaryField()
+    row_count = models.IntegerField()
+    archived_datetime = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'Archive of table {self.table_id} ({self.row_count} rows)'
+
+
+class Notification(models.Model):
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = ((PENDING, 'Pending'), (SENDING, 'Sending'), (SENT, 'Sent'), (FAILED, 'Failed'))
+
+    sink = models.CharField(max_length=64)
+    message = models.TextField()
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.IntegerField(default=0)
+    next_attempt_datetime = models.DateTimeField(default=timezone.now)
+    claim = models.CharField(max_length=32, blank=True)
+    last_error = models.TextField(blank=True)
+    created_datetime = models.DateTimeField(default=timezone.now)
+    sent_datetime = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f'Notification {self.pk} via {self.sink} ({self.status})'
+
+    class Meta:
+        ordering = ('pk',)
+        indexes = [models.Index(fields=['status', 'next_attempt_datetime'])]
+
+
+class PurgeJob(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = ((PENDING, 'Pending'), (RUNNING, 'Running'), (SUCCEEDED, 'Succeeded'), (FAILED, 'Failed'))
+
+    # Not a foreign key, as the purge deletes the table.
+    table_pk = models.IntegerField()
+    table_name = models.TextField()
+    requested_by = models.ForeignKey(User, blank=True, null=True, on_delete=models.SET_NULL, related_name='+')
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    objects_purged = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_datetime = models.DateTimeField(default=timezone.now)
+    started_datetime = models.DateTimeField(blank=True, null=True)
+    finished_datetime = models.DateTimeField(blank=True, null=True)
+    heartbeat_datetime = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f'Purge job {self.pk} ({self.table_name}, {self.status})'
+
+    class Meta:
+        ordering = ('pk',)
+        indexes = [models.Index(fields=['status'])]
 
 
 class BaseColumn(models.Model):
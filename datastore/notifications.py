@@ -0,0 +1,103 @@
+import uuid
+from datetime import timedelta
+import requests
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from . import models
+
+# Outbound notifications go through an outbox: enqueue writes them in the caller's transaction, and the
+# send_notifications command sends them, retrying failures and leasing each claim so a stopped worker's batch is resent.
+
+MAX_ATTEMPTS = 8
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 6 * 60 * 60
+CLAIM_LEASE = timedelta(minutes=5)
+WEBHOOK_TIMEOUT_SECONDS = 10
+
+
+class SlackSink:
+    def __init__(self):
+        from slacker import Slacker
+        self.slack = Slacker(settings.SLACK_TOKEN)
+
+    def send(self, message):
+        self.slack.chat.post_message(settings.NOTIFICATION_SLACK_CHANNEL, message)
+
+
+class WebhookSink:
+    def send(self, message):
+        response = requests.post(settings.NOTIFICATION_WEBHOOK_URL, json={'text': message},
+                                 timeout=WEBHOOK_TIMEOUT_SECONDS)
+        response.raise_for_status()
+
+
+class FakeSink:
+    """
+    Keeps sent messages in memory, for tests and local development.
+    """
+    sent = []
+
+    def send(self, message):
+        self.sent.append(message)
+
+
+def enqueue(message):
+    return models.Notification.objects.bulk_create(models.Notification(sink=sink, message=message)
+                                                   for sink in settings.NOTIFICATION_SINKS)
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS))
+
+
+def claim_batch(batch_size):
+    now = timezone.now()
+    due = Q(status__in=(models.Notification.PENDING, models.Notification.SENDING), next_attempt_datetime__lte=now)
+    pks = list(models.Notification.objects.filter(due).order_by('next_attempt_datetime', 'pk')
+               .values_list('pk', flat=True)[:batch_size])
+    claim = uuid.uuid4().hex
+    models.Notification.objects.filter(due, pk__in=pks).update(status=models.Notification.SENDING, claim=claim,
+                                                               next_attempt_datetime=now + CLAIM_LEASE)
+    return list(models.Notification.objects.filter(claim=claim, status=models.Notification.SENDING))
+
+
+def renew_claim(notification):
+    """
+    Extends the lease on a claimed notification, returning False if its claim has been taken over.
+    """
+    return models.Notification.objects.filter(pk=notification.pk, claim=notification.claim,
+                                              status=models.Notification.SENDING) \
+        .update(next_attempt_datetime=timezone.now() + CLAIM_LEASE) == 1
+
+
+def send_batch(batch_size=50):
+    """
+    Sends one batch of due notifications and returns the notifications it attempted, with their new status.
+    """
+    notifications = []
+    sinks = {}
+    for notification in claim_batch(batch_size):
+        if not renew_claim(notification):
+            continue
+        notifications.append(notification)
+        notification.attempts += 1
+        try:
+            if notification.sink not in sinks:
+                sinks[notification.sink] = import_string(settings.NOTIFICATION_SINKS[notification.sink])()
+            sinks[notification.sink].send(notification.message)
+            notification.status = models.Notification.SENT
+            notification.sent_datetime = timezone.now()
+            notification.last_error = ''
+        except Exception as e:
+            notification.last_error = f'{e.__class__.__name__}: {e}'
+            if notification.attempts >= MAX_ATTEMPTS:
+                notification.status = models.Notification.FAILED
+            else:
+                notification.status = models.Notification.PENDING
+                notification.next_attempt_datetime = timezone.now() + retry_delay(notification.attempts)
+        models.Notification.objects.filter(pk=notification.pk, claim=notification.claim).update(
+            status=notification.status, attempts=notification.attempts, last_error=notification.last_error,
+            sent_datetime=notification.sent_datetime, next_attempt_datetime=notification.next_attempt_datetime)
+    return notifications
@@ -0,0 +1,144 @@
+from django.db import connections, router
+from django.db.transaction import atomic
+from . import models
+
+# On PostgreSQL the row table can be partitioned by LIST on table_id, with a partition per study and a DEFAULT
+# partition for tables without one yet.
+
+ROW_TABLE = models.Row._meta.db_table
+DEFAULT_PARTITION = f'{ROW_TABLE}_default'
+
+
+def _connection():
+    return connections[router.db_for_write(models.Row)]
+
+
+def partition_name(table_pk):
+    return f'{ROW_TABLE}_p{int(table_pk)}'
+
+
+def is_supported(connection=None):
+    return (connection or _connection()).vendor == 'postgresql'
+
+
+def is_partitioned(connection=None):
+    connection = connection or _connection()
+    if not is_supported(connection):
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)', [ROW_TABLE])
+        return cursor.fetchone() is not None
+
+
+def partition_names(connection=None):
+    with (connection or _connection()).cursor() as cursor:
+        cursor.execute('SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+                       'WHERE pg_inherits.inhparent = to_regclass(%s)', [ROW_TABLE])
+        return {name for name, in cursor.fetchall()}
+
+
+def create_partition(table_pk, connection=None):
+    """
+    Adds the partition of a table to a partitioned row table, moving any of its rows out of the default partition.
+    Returns False if the row table is not partitioned or the partition already exists.
+    """
+    connection = connection or _connection()
+    if not is_partitioned(connection) or partition_name(table_pk) in partition_names(connection):
+        return False
+    name = connection.ops.quote_name(partition_name(table_pk))
+    row_table = connection.ops.quote_name(ROW_TABLE)
+    default_partition = connection.ops.quote_name(DEFAULT_PARTITION)
+    # Attaching a standalone table only takes a SHARE UPDATE EXCLUSIVE lock on the row table, which does not block
+    # reservations in other studies, where CREATE TABLE ... PARTITION OF would lock the whole row table. It does take
+    # an ACCESS EXCLUSIVE lock on the default partition to check it for rows of the table, held until the commit.
+    with atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE {name} (LIKE {row_table} INCLUDING DEFAULTS)')
+        cursor.execute(f'WITH moved AS (DELETE FROM {default_partition} WHERE table_id = %s RETURNING *) '
+                       f'INSERT INTO {name} SELECT * FROM moved', [table_pk])
+        cursor.execute(f'ALTER TABLE {row_table} ATTACH PARTITION {name} FOR VALUES IN (%s)', [table_pk])
+    return True
+
+
+def create_partition_for_new_table(connection=None):
+    """
+    Takes the pk of the next table from its sequence and commits a partition for it, so the table can be created and
+    imported in a later transaction. Returns the pk, or None if the row table is not partitioned or this is called
+    inside a transaction, in which case the partition is left for create_table to add.
+    """
+    connection = connection or _connection()
+    if connection.in_atomic_block or not is_partitioned(connection):
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT nextval(pg_get_serial_sequence(%s, %s))', [models.Table._meta.db_table, 'id'])
+        table_pk, = cursor.fetchone()
+    create_partition(table_pk, connection)
+    return table_pk
+
+
+def drop_partition(table_pk, connection=None):
+    """
+    Detaches and drops the partition of a table. Returns False if the row table is not partitioned or the table has
+    no partition.
+    """
+    connection = connection or _connection()
+    if not is_partitioned(connection) or partition_name(table_pk) not in partition_names(connection):
+        return False
+    name = connection.ops.quote_name(partition_name(table_pk))
+    with atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {connection.ops.quote_name(ROW_TABLE)} DETACH PARTITION {name}')
+        cursor.execute(f'DROP TABLE {name}')
+    return True
+
+
+def create_missing_partitions(connection=None):
+    connection = connection or _connection()
+    table_pks = models.Table.objects.using(connection.alias).order_by('pk').values_list('pk', flat=True)
+    return [table_pk for table_pk in table_pks if create_partition(table_pk, connection)]
+
+
+def partition_row_table(connection=None):
+    """
+    Converts the row table into a partitioned table with a partition per existing table, copying every row. This
+    locks the row table until it is done. Returns False if the row table is already partitioned.
+
+    The primary key of the partitioned table has to include the partition key, so it becomes (id, table_id) and
+    foreign keys referencing rows are dropped. Row ids still come from one sequence, and rows are deleted in cascade
+    by Django, not by the database.
+    """
+    connection = connection or _connection()
+    if not is_supported(connection):
+        raise NotImplementedError('Row partitioning requires PostgreSQL')
+    if is_partitioned(connection):
+        return False
+    quote = connection.ops.quote_name
+    old_table = f'{ROW_TABLE}_unpartitioned'
+    with atomic(using=connection.alias), connection.cursor() as cursor:
+        indexes = [(name, constraint['columns'])
+                   for name, constraint in connection.introspection.get_constraints(cursor, ROW_TABLE).items()
+                   if constraint['index'] and not constraint['primary_key'] and not constraint['unique']]
+        cursor.execute('SELECT conrelid::regclass::text, conname FROM pg_constraint '
+                       'WHERE contype = %s AND confrelid = to_regclass(%s)', ['f', ROW_TABLE])
+        for referencing_table, constraint_name in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE {referencing_table} DROP CONSTRAINT {quote(constraint_name)}')
+        cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [ROW_TABLE, 'id'])
+        sequence, = cursor.fetchone()
+        cursor.execute(f'ALTER TABLE {quote(ROW_TABLE)} RENAME TO {quote(old_table)}')
+        cursor.execute(f'CREATE TABLE {quote(ROW_TABLE)} (LIKE {quote(old_table)} INCLUDING DEFAULTS, '
+                       f'PRIMARY KEY (id, table_id)) PARTITION BY LIST (table_id)')
+        for field_name in ('table', 'reservation'):
+            field = models.Row._meta.get_field(field_name)
+            cursor.execute(f'ALTER TABLE {quote(ROW_TABLE)} ADD FOREIGN KEY ({quote(field.column)}) '
+                           f'REFERENCES {quote(field.related_model._meta.db_table)} (id) '
+                           f'DEFERRABLE INITIALLY DEFERRED')
+        cursor.execute(f'CREATE TABLE {quote(DEFAULT_PARTITION)} PARTITION OF {quote(ROW_TABLE)} DEFAULT')
+        for table_pk in models.Table.objects.using(connection.alias).values_list('pk', flat=True):
+            cursor.execute(f'CREATE TABLE {quote(partition_name(table_pk))} PARTITION OF {quote(ROW_TABLE)} '
+                           f'FOR VALUES IN (%s)', [table_pk])
+        cursor.execute(f'INSERT INTO {quote(ROW_TABLE)} SELECT * FROM {quote(old_table)}')
+        cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {quote(ROW_TABLE)}.id')
+        cursor.execute(f'DROP TABLE {quote(old_table)}')
+        for name, columns in indexes:
+            cursor.execute(f'CREATE INDEX {quote(name)} ON {quote(ROW_TABLE)} '
+                           f'({", ".join(quote(column) for column in columns)})')
+        cursor.execute(f'ANALYZE {quote(ROW_TABLE)}')
+    return True
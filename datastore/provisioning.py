@@ -0,0 +1,103 @@
+import json
+import os
+import secrets
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.contrib.auth.models import User
+from django.db import connections
+from . import import_jobs
+from . import input_validators
+from . import models
+from . import table_creation
+
+# Provisions many studies at once from a directory of CSV files or a JSON manifest, each in its own transaction
+# on a worker process, so a failing study does not stop the others.
+
+CSV_SUFFIXES = ('.csv', '.csv.gz', '.csv.bz2', '.csv.xz', '.csv.zip')
+
+StudySpec = namedtuple('StudySpec', ('name', 'csv_path', 'site_id_field', 'generator'))
+StudyReport = namedtuple('StudyReport', ('name', 'table_pk', 'rows', 'activation_codes', 'seed', 'error', 'seconds'))
+
+
+def directory_specs(path, site_id_field=None):
+    specs = []
+    for file_name in sorted(os.listdir(path)):
+        suffix = next((suffix for suffix in CSV_SUFFIXES if file_name.lower().endswith(suffix)), None)
+        if suffix:
+            specs.append(StudySpec(file_name[:-len(suffix)], os.path.join(path, file_name), site_id_field, None))
+    return specs
+
+
+def manifest_specs(path):
+    with open(path) as manifest_file:
+        studies = json.load(manifest_file)
+    specs = []
+    for index, study in enumerate(studies):
+        if not study.get('name') or bool(study.get('csv')) == bool(study.get('generate')):
+            raise ValueError(f'Study {index + 1} in the manifest needs a name and either `csv` or `generate`')
+        if study.get('csv'):
+            csv_path = os.path.join(os.path.dirname(os.path.abspath(path)), study['csv'])
+            specs.append(StudySpec(study['name'], csv_path, study.get('site_id_field'), None))
+        else:
+            generator = dict(study['generate'])
+            generator.setdefault('seed', secrets.randbelow(2 ** 32))
+            specs.append(StudySpec(study['name'], None, generator.get('site_id_field'), generator))
+    return specs
+
+
+def load_specs(path, site_id_field=None):
+    specs = directory_specs(path, site_id_field) if os.path.isdir(path) else manifest_specs(path)
+    names = [spec.name for spec in specs]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f'Duplicate study names: {", ".join(duplicates)}')
+    return specs
+
+
+def provision_study(spec, owner_pk):
+    started = time.monotonic()
+    owner = User.objects.get(pk=owner_pk)
+    seed = spec.generator['seed'] if spec.generator else None
+    try:
+        input_validators.validate_table_name(spec.name)
+        if spec.generator:
+            table_creation_dao = _generated_table_creator(spec, owner).create_table()
+        else:
+            table_creator = import_jobs.StagedTableCreator(spec.csv_path, spec.name, spec.site_id_field, owner,
+                                                           import_jobs.ImportProgress(None))
+            try:
+                table_creation_dao = table_creator.create_table()
+            finally:
+                table_creator.csv_file.close()
+    except Exception as e:
+        return StudyReport(spec.name, None, 0, [], seed, f'{e.__class__.__name__}: {e}',
+                           time.monotonic() - started)
+    table_pk = table_creation_dao.table_detail_args()[0]
+    return StudyReport(spec.name, table_pk, models.Row.objects.filter(table_id=table_pk).count(),
+                       table_creation_dao.get_activation_code_data(), seed, None, time.monotonic() - started)
+
+
+def _generated_table_creator(spec, owner):
+    generator = spec.generator
+    return table_creation.GeneratedTableCreator(
+        generator['columns'], generator['rows_per_stratum'], generator.get('block_sizes', [4]), spec.name, owner,
+        site_id_field=generator.get('site_id_field'), site_values=generator.get('sites'),
+        allocation_ratio=tuple(generator.get('allocation_ratio', (1, 1))), seed=generator['seed'])
+
+
+def provision_studies(specs, owner, workers=None):
+    """
+    Yields a StudyReport for each spec, in order. With more than one worker the studies are created in separate
+    processes, each with its own database connection.
+    """
+    if not table_creation.user_can_create_tables(owner):
+        raise PermissionError('Owner must have permissions to create a table')
+    if workers == 1:
+        for spec in specs:
+            yield provision_study(spec, owner.pk)
+        return
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as executor:
+        yield from executor.map(provision_study, specs, [owner.pk] * len(specs))
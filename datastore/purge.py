@@ -0,0 +1,110 @@
+from datetime import timedelta
+from django.db import router
+from django.db.models import CASCADE, SET_NULL
+from django.db.transaction import atomic
+from django.utils import timezone
+from . import models
+from . import partitioning
+
+# Deletes large tables in batches, each in its own transaction, as delete() would load every related object into
+# memory and delete them in one transaction that times out.
+
+BATCH_SIZE = 5000
+JOB_LEASE = timedelta(minutes=10)
+
+
+def related_fields():
+    """
+    Returns the foreign keys to Table, those of models that refer to other related models first.
+    """
+    fields = [relation.field for relation in models.Table._meta.related_objects]
+    related_models = {field.model for field in fields}
+
+    def refers_to_related_model(field):
+        return any(model_field.related_model in related_models
+                   for model_field in field.model._meta.concrete_fields if model_field.is_relation)
+    return sorted(fields, key=lambda field: not refers_to_related_model(field))
+
+
+def purge_table(table, batch_size=BATCH_SIZE, progress=None):
+    """
+    Hides table, then deletes or detaches everything referring to it in batches, and deletes the table last. progress,
+    if given, is called after each batch with the model and the number of its objects purged so far. Returns the
+    number of objects purged per model.
+    """
+    models.Table.objects.filter(pk=table.pk).update(is_hidden=True)
+    purged = {}
+    for field in related_fields():
+        if field.remote_field.on_delete in (CASCADE, SET_NULL):
+            purged[field.model] = _purge_related(table, field, batch_size, progress)
+    partitioning.drop_partition(table.pk)
+    with atomic(using=router.db_for_write(models.Table)):
+        models.Table.objects.filter(pk=table.pk).delete()
+    purged[models.Table] = 1
+    return purged
+
+
+def _purge_related(table, field, batch_size, progress):
+    queryset = field.model._base_manager.filter(**{field.name: table.pk})
+    purged = 0
+    while True:
+        with atomic(using=router.db_for_write(field.model)):
+            pks = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                return purged
+            batch = queryset.filter(pk__in=pks)
+            if field.remote_field.on_delete == CASCADE:
+                batch.delete()
+            else:
+                batch.update(**{field.name: None})
+        purged += len(pks)
+        if progress:
+            progress(field.model, purged)
+
+
+@atomic
+def create_purge_job(table, user):
+    """
+    Hides table and queues its purge for the process_import_jobs worker.
+    """
+    models.Table.objects.filter(pk=table.pk).update(is_hidden=True)
+    return models.PurgeJob.objects.create(table_pk=table.pk, table_name=table.name, requested_by=user)
+
+
+def claim_next_purge_job():
+    now = timezone.now()
+    # A purge carries on from where it stopped, so the job of a worker that stopped sending heartbeats is requeued.
+    models.PurgeJob.objects.filter(status=models.PurgeJob.RUNNING, heartbeat_datetime__lt=now - JOB_LEASE) \
+        .update(status=models.PurgeJob.PENDING)
+    for job in models.PurgeJob.objects.filter(status=models.PurgeJob.PENDING).order_by('pk')[:10]:
+        claimed = models.PurgeJob.objects.filter(pk=job.pk, status=models.PurgeJob.PENDING).update(
+            status=models.PurgeJob.RUNNING, started_datetime=now, heartbeat_datetime=now)
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+def run_purge_job(job, batch_size=BATCH_SIZE):
+    """
+    Purges the table of a claimed job, writing the number of objects purged and a heartbeat after each batch.
+    """
+    purged_before = job.objects_purged
+    purged = {}
+
+    def progress(model, count):
+        purged[model] = count
+        job.objects_purged = purged_before + sum(purged.values())
+        models.PurgeJob.objects.filter(pk=job.pk).update(objects_purged=job.objects_purged,
+                                                         heartbeat_datetime=timezone.now())
+    try:
+        table = models.Table.objects.filter(pk=job.table_pk).first()
+        if table:
+            job.objects_purged = purged_before + sum(purge_table(table, batch_size, progress).values())
+        job.status = models.PurgeJob.SUCCEEDED
+    except Exception as e:
+        job.status = models.PurgeJob.FAILED
+        job.error = f'{e.__class__.__name__}: {e}'
+    job.finished_datetime = timezone.now()
+    job.save()
+    return job
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from datetime import timedelta
+from django.db.models import Max
+from django.utils import timezone
+from . import models
+
+# Publish/subscribe of row state changes. Changes are read from the RowChange
+# table, so transitions made by any process reach the subscribers of this one.
+
+RESERVED = 'reserved'
+COMPLETED = 'completed'
+CANCELLED = 'cancelled'
+RELOAD = 'reload'
+SETTLE_SECONDS = 5
+BATCH_SIZE = 1000
+
+
+class RowEventSubscription:
+    def __init__(self, broker, table_pk, loop, max_queued_events):
+        self.broker = broker
+        self.table_pk = table_pk
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=max_queued_events)
+        self._overflowed = False
+
+    def put(self, event):
+        self._loop.call_soon_threadsafe(self._put_nowait, event)
+
+    def _put_nowait(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self._overflowed = True
+
+    async def get(self):
+        if self._overflowed:
+            self._overflowed = False
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            return {'state': RELOAD}
+        return await self._queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class RowEventBroker:
+    def __init__(self, max_queued_events=1000):
+        self.max_queued_events = max_queued_events
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def subscribe(self, table_pk, loop=None):
+        subscription = RowEventSubscription(self, table_pk, loop or asyncio.get_event_loop(),
+                                            self.max_queued_events)
+        with self._lock:
+            self._subscriptions[table_pk].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions[subscription.table_pk].discard(subscription)
+            if not self._subscriptions[subscription.table_pk]:
+                del self._subscriptions[subscription.table_pk]
+
+    def has_subscribers(self, table_pk):
+        with self._lock:
+            return bool(self._subscriptions.get(table_pk))
+
+    def table_pks(self):
+        with self._lock:
+            return set(self._subscriptions)
+
+    def publish(self, table_pk, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(table_pk, ()))
+        for subscription in subscriptions:
+            subscription.put(event)
+
+
+broker = RowEventBroker()
+
+
+def latest_change_pk():
+    return models.RowChange.objects.aggregate(Max('pk'))['pk__max'] or 0
+
+
+def change_state(processed, reservation_id):
+    if processed:
+        return COMPLETED
+    return RESERVED if reservation_id is not None else CANCELLED
+
+
+class RowChangeTail:
+    """
+    Reads the row changes of tables after a cursor. A change can commit after one with a higher sequence, so changes
+    are returned once each as soon as they are seen, but the cursor only moves past changes older than
+    SETTLE_SECONDS.
+    """
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self._seen = set()
+
+    def read(self, table_pks):
+        """
+        Returns (table_pk, event) pairs for the new changes to table_pks.
+        """
+        visible_before = timezone.now() - timedelta(seconds=SETTLE_SECONDS)
+        changes = models.RowChange.objects.filter(table_id__in=table_pks, pk__gt=self.cursor).order_by('pk') \
+            .values_list('pk', 'table_id', 'row_id', 'processed', 'reservation_id', 'changed_datetime')
+        events = []
+        settled = True
+        for pk, table_pk, row_pk, processed, reservation_id, changed_datetime in changes[:BATCH_SIZE]:
+            if pk not in self._seen:
+                self._seen.add(pk)
+                events.append((table_pk, {'row': row_pk, 'state': change_state(processed, reservation_id)}))
+            settled = settled and changed_datetime < visible_before
+            if settled:
+                self.cursor = pk
+        self._seen = {pk for pk in self._seen if pk > self.cursor}
+        return events
+
+
+def format_server_sent_event(event_name, data):
+    return f'event: {event_name}\ndata: {json.dumps(data)}\n\n'.encode('utf-8')
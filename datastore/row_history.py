@@ -0,0 +1,125 @@
+import json
+import zlib
+from collections import namedtuple
+from datetime import timedelta
+import numpy as np
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from . import archives
+from . import models
+from . import table_snapshot
+
+# Point-in-time reconstruction of row state from the RowChange log, replaying only the changes after the
+# nearest RowHistorySnapshot.
+
+SNAPSHOT_SETTLE_SECONDS = 60
+CHANGE_FIELDS = ('pk', 'row_id', 'changed_datetime', 'patient_id', 'processed', 'reservation_id',
+                 'reservation_datetime', 'processed_datetime')
+
+
+class RowState(namedtuple('RowState', ('patient_id', 'processed', 'reservation_id',
+                                       'reservation_datetime', 'processed_datetime'))):
+    def is_blank(self):
+        return self.reservation_id is None and not self.processed
+
+
+BLANK_ROW_STATE = RowState(None, False, None, None, None)
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def _parse_datetime(value):
+    return parse_datetime(value) if value else None
+
+
+def encode_state(state):
+    serialized = {str(row_pk): [row_state.patient_id, row_state.processed, row_state.reservation_id,
+                                _isoformat(row_state.reservation_datetime), _isoformat(row_state.processed_datetime)]
+                  for row_pk, row_state in state.items()}
+    return zlib.compress(json.dumps(serialized, separators=(',', ':')).encode('utf-8'))
+
+
+def decode_state(data):
+    serialized = json.loads(zlib.decompress(bytes(data)).decode('utf-8'))
+    return {int(row_pk): RowState(patient_id, processed, reservation_id,
+                                  _parse_datetime(reservation_datetime), _parse_datetime(processed_datetime))
+            for row_pk, (patient_id, processed, reservation_id, reservation_datetime, processed_datetime)
+            in serialized.items()}
+
+
+def apply_changes(state, changes):
+    last_sequence = None
+    last_changed_datetime = None
+    for sequence, row_pk, changed_datetime, *row_state in changes:
+        state[row_pk] = RowState(*row_state)
+        last_sequence = sequence
+        if not last_changed_datetime or changed_datetime > last_changed_datetime:
+            last_changed_datetime = changed_datetime
+    return last_sequence, last_changed_datetime
+
+
+def latest_snapshot(table, as_of=None):
+    snapshots = models.RowHistorySnapshot.objects.filter(table=table)
+    if as_of:
+        snapshots = snapshots.filter(max_changed_datetime__lte=as_of)
+    return snapshots.order_by('-sequence').first()
+
+
+def create_snapshot(table, settle_seconds=SNAPSHOT_SETTLE_SECONDS):
+    """
+    Compacts the changes after the latest snapshot into a new snapshot. Changes from the last settle_seconds are
+    left out, as a lower change sequence may still belong to a transaction that has not committed yet.
+    """
+    previous_snapshot = latest_snapshot(table)
+    state = decode_state(previous_snapshot.state) if previous_snapshot else {}
+    changes = table.rowchange_set.filter(pk__gt=previous_snapshot.sequence if previous_snapshot else 0)
+    cutoff = timezone.now() - timedelta(seconds=settle_seconds)
+    last_settled_change = changes.filter(changed_datetime__lt=cutoff).order_by('-pk').first()
+    if not last_settled_change:
+        return previous_snapshot
+    changes = changes.filter(pk__lte=last_settled_change.pk).order_by('pk').values_list(*CHANGE_FIELDS)
+    sequence, max_changed_datetime = apply_changes(state, changes.iterator())
+    if previous_snapshot and previous_snapshot.max_changed_datetime > max_changed_datetime:
+        max_changed_datetime = previous_snapshot.max_changed_datetime
+    state = {row_pk: row_state for row_pk, row_state in state.items() if not row_state.is_blank()}
+    return models.RowHistorySnapshot.objects.create(table=table, sequence=sequence, row_count=len(state),
+                                                    max_changed_datetime=max_changed_datetime,
+                                                    state=encode_state(state))
+
+
+def table_state_as_of(table, as_of):
+    """
+    Returns the rows of a table that were reserved or processed at as_of, as a dict of row pk to RowState. Rows that
+    never changed keep the state they were imported with, and rows appended after as_of are still included, as rows
+    carry no creation time.
+    """
+    snapshot = latest_snapshot(table, as_of)
+    state = decode_state(snapshot.state) if snapshot else {}
+    changes = table.rowchange_set.filter(pk__gt=snapshot.sequence if snapshot else 0, changed_datetime__lte=as_of)
+    apply_changes(state, changes.order_by('pk').values_list(*CHANGE_FIELDS).iterator())
+    for row_pk, row_state in _unchanged_row_states(table):
+        state[row_pk] = row_state
+    return {row_pk: row_state for row_pk, row_state in state.items() if not row_state.is_blank()}
+
+
+def _unchanged_row_states(table):
+    """
+    Yields the row pk and RowState of the reserved or processed rows of a table that have no changes, reading the
+    archive of an archived table.
+    """
+    if not table.is_archived:
+        unchanged_rows = table.row_set.filter(Q(processed=True) | Q(reservation__isnull=False))
+        unchanged_rows = unchanged_rows.filter(~Exists(models.RowChange.objects.filter(row=OuterRef('pk'))))
+        for row_pk, *row_state in unchanged_rows.values_list('pk', *RowState._fields).iterator():
+            yield row_pk, RowState(*row_state)
+        return
+    snapshot = archives.archived_snapshot(table)
+    changed_row_pks = np.fromiter(set(table.rowchange_set.values_list('row_id', flat=True)), dtype=np.int64)
+    snapshot = snapshot.select((snapshot.arrays['processed'] |
+                                (snapshot.arrays['reservation_id'] != table_snapshot.MISSING)) &
+                               ~np.isin(snapshot.arrays['row_id'], changed_row_pks))
+    for row_pk, _, _, _, *row_state in snapshot.row_values_iter():
+        yield row_pk, RowState(*row_state)
@@ -0,0 +1,102 @@
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+# Monte Carlo simulation of enrollment into a randomization table. Like table_snapshot, this module does not
+# import Django, so that workers in the process pool only need NumPy.
+
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+BATCH_SIZE = 500
+
+SimulationStrata = namedtuple('SimulationStrata', ('number_of_sites', 'number_of_keys', 'lengths', 'starts',
+                                                   'running_differences'))
+SimulationResult = namedtuple('SimulationResult', ('replicates', 'exhaustion_probabilities',
+                                                   'any_exhaustion_probability', 'total_imbalance_quantiles',
+                                                   'stratum_imbalance_quantiles', 'site_imbalance_quantiles'))
+
+
+def build_strata(site_ids, keys, arms, number_of_sites, number_of_keys):
+    """
+    Takes the site index, key and randomization arm of the available rows, in row order, and returns the strata
+    used by run_simulation. Strata keep a running sum of arm differences in stratum order, so the imbalance of the
+    first n rows of any stratum is the difference of two running sums.
+    """
+    strata = np.asarray(site_ids, dtype=np.int64) * number_of_keys + np.asarray(keys, dtype=np.int64)
+    order = np.argsort(strata, kind='stable')
+    differences = np.where(np.asarray(arms)[order] == 1, 1, -1)
+    lengths = np.bincount(strata, minlength=number_of_sites * number_of_keys)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    running_differences = np.concatenate(([0], np.cumsum(differences)))
+    return SimulationStrata(number_of_sites, number_of_keys, lengths, starts, running_differences)
+
+
+def key_probabilities(option_counts, column_weights=None):
+    """
+    Returns the probability of each row key when column values are drawn independently, uniformly unless
+    column_weights gives the weights of each column's values.
+    """
+    number_of_keys = int(np.prod(option_counts, dtype=np.int64))
+    keys = np.arange(number_of_keys)
+    probabilities = np.ones(number_of_keys)
+    stride = 1
+    for index, number_of_options in enumerate(option_counts):
+        weights = np.ones(number_of_options)
+        if column_weights and column_weights[index] is not None:
+            weights = np.asarray(column_weights[index], dtype=np.float64)
+        probabilities *= (weights / weights.sum())[(keys // stride) % number_of_options]
+        stride *= number_of_options
+    return probabilities
+
+
+def simulate_batch(strata, probabilities, expected_site_patients, replicates, seed_sequence):
+    """
+    Draws each site's patients from a Poisson distribution and splits them over the strata with a multinomial draw.
+    A stratum is exhausted when more patients arrive than it has rows.
+    """
+    rng = np.random.default_rng(seed_sequence)
+    site_patients = rng.poisson(expected_site_patients, size=(replicates, strata.number_of_sites))
+    counts = rng.multinomial(site_patients, probabilities).reshape(replicates, -1)
+    used = np.minimum(counts, strata.lengths)
+    stratum_imbalance = (strata.running_differences[strata.starts + used] -
+                         strata.running_differences[strata.starts])
+    site_imbalance = stratum_imbalance.reshape(replicates, strata.number_of_sites, -1).sum(axis=2)
+    return (counts > strata.lengths, stratum_imbalance.sum(axis=1), np.abs(stratum_imbalance).max(axis=1),
+            np.abs(site_imbalance).max(axis=1))
+
+
+def _simulate_batch(args):
+    return simulate_batch(*args)
+
+
+def run_simulation(strata, probabilities, site_rates, days, replicates, seed=None, workers=None,
+                   batch_size=BATCH_SIZE):
+    """
+    Runs replicates of enrolling for the given days, with site_rates patients per site per day (one rate for all
+    sites, or one per site), and returns a SimulationResult. Batches of replicates run in a pool of worker
+    processes, each with its own seed spawned from seed; workers=1 runs them in this process.
+    """
+    expected_site_patients = np.broadcast_to(np.asarray(site_rates, dtype=np.float64) * days,
+                                             (strata.number_of_sites,))
+    batch_sizes = [min(batch_size, replicates - start) for start in range(0, replicates, batch_size)]
+    seed_sequences = np.random.SeedSequence(seed).spawn(len(batch_sizes))
+    batches = [(strata, probabilities, expected_site_patients, size, seed_sequence)
+               for size, seed_sequence in zip(batch_sizes, seed_sequences)]
+    workers = min(workers or os.cpu_count() or 1, len(batches))
+    if workers <= 1:
+        results = [_simulate_batch(batch) for batch in batches]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_simulate_batch, batches))
+    exhausted, total_imbalance, stratum_imbalance, site_imbalance = (np.concatenate(arrays)
+                                                                     for arrays in zip(*results))
+    return SimulationResult(replicates=replicates,
+                            exhaustion_probabilities=exhausted.mean(axis=0),
+                            any_exhaustion_probability=float(exhausted.any(axis=1).mean()),
+                            total_imbalance_quantiles=_quantiles(np.abs(total_imbalance)),
+                            stratum_imbalance_quantiles=_quantiles(stratum_imbalance),
+                            site_imbalance_quantiles=_quantiles(site_imbalance))
+
+
+def _quantiles(values):
+    return dict(zip(QUANTILES, np.quantile(values, QUANTILES).tolist()))
@@ -0,0 +1,57 @@
+import os
+import uuid
+from contextlib import contextmanager
+from django.conf import settings
+from django.db.transaction import atomic
+from . import models
+
+# Uploads are staged in the database in chunks of at most CHUNK_BYTES, as local disk on Heroku is neither
+# shared between dynos nor kept across restarts.
+
+CHUNK_BYTES = 4 * 1024 * 1024
+
+
+@atomic
+def stage(binary_chunks):
+    """
+    Stores the bytes of binary_chunks and returns the StagedFile.
+    """
+    staged_file = models.StagedFile.objects.create()
+    buffer = bytearray()
+    for data in binary_chunks:
+        buffer += data
+        while len(buffer) >= CHUNK_BYTES:
+            append(staged_file, bytes(buffer[:CHUNK_BYTES]))
+            del buffer[:CHUNK_BYTES]
+    if buffer:
+        append(staged_file, bytes(buffer))
+    return staged_file
+
+
+def append(staged_file, data):
+    models.StagedFileChunk.objects.create(staged_file=staged_file, offset=staged_file.size, data=data)
+    staged_file.size += len(data)
+    models.StagedFile.objects.filter(pk=staged_file.pk).update(size=staged_file.size)
+
+
+def data_iter(staged_file):
+    chunks = models.StagedFileChunk.objects.filter(staged_file=staged_file).order_by('offset')
+    for data in chunks.values_list('data', flat=True).iterator(chunk_size=1):
+        yield bytes(data)
+
+
+@contextmanager
+def local_copy(staged_file):
+    """
+    Writes a staged file to IMPORT_STAGING_DIR and yields its path, removing it afterwards.
+    """
+    os.makedirs(settings.IMPORT_STAGING_DIR, exist_ok=True)
+    path = os.path.join(settings.IMPORT_STAGING_DIR, f'{uuid.uuid4().hex}.csv')
+    try:
+        with open(path, 'wb') as local_file:
+            for data in data_iter(staged_file):
+                local_file.write(data)
+        yield path
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
@@ -1,8 +1,12 @@
 import csv
 from collections import defaultdict, Counter
+import numpy as np
 from django.db.transaction import atomic
+from . import block_randomization
+from . import compression
 from . import daos
 from . import input_validators
+from . import partitioning
 
 
 def user_can_create_tables(user):
@@ -52,8 +56,18 @@ def validate_table_data_core(header, rows, site_id_field):
         raise KeyError('All sites must have the same number of rows')
 
 
+def validate_header(header, site_id_field):
+    if not header:
+        raise ValueError('No data.')
+    if 'randomization_arm' not in header:
+        raise KeyError('Column `randomization_arm` is missing.')
+    if site_id_field and site_id_field not in header:
+        raise KeyError(f'Site id field `{site_id_field}` not found in header')
+    input_validators.validate_column_names(header)
+
+
 def validate_table_data(csv_file, site_id_field):
-    csv_reader = csv.DictReader(decode_utf8(csv_file))
+    csv_reader = csv.DictReader(decode_utf8(compression.decompressed(csv_file)))
     validate_table_data_core(csv_reader.fieldnames, csv_reader, site_id_field)
 
 
@@ -80,8 +94,8 @@ class BaseRowCreator:
         self.column_value_options = None
 
     def create_rows(self):
-        for fields in self.rows():
-            self.table_creation_dao.create_row(fields, self.row_transformer)
+        self.table_creation_dao.bulk_create_rows(self.table_creation_dao.build_row(fields, self.row_transformer)
+                                                 for fields in self.rows())
 
     def init_row_transformer(self):
         for key in self.column_value_options:
@@ -91,6 +105,14 @@ class BaseRowCreator:
     def create_activation_codes(self):
         self.table_creation_dao.create_activation_codes()
 
+    def potential_column_values(self):
+        potential_column_values = defaultdict(set)
+        for row in self.rows():
+            for key in row:
+                if key not in ('randomization_arm', 'processed'):
+                    potential_column_values[key].add(row[key])
+        return potential_column_values
+
     def rows(self):
         raise NotImplementedError
 
@@ -102,11 +124,7 @@ class BaseTableCreator(BaseRowCreator):
         self.owner = owner
 
     def calculate_column_value_options_and_row_count(self):
-        potential_column_values = defaultdict(set)
-        for row_index, row in enumerate(self.rows()):
-            for key in row:
-                if key not in ('randomization_arm', 'processed'):
-                    potential_column_values[key].add(row[key])
+        potential_column_values = self.potential_column_values()
         input_validators.validate_potential_column_values(potential_column_values)
         self.column_value_options = {key: sorted(potential_column_values[key]) for key in potential_column_values}
 
@@ -120,15 +138,25 @@ class BaseTableCreator(BaseRowCreator):
             is_site_id_column = column_name == self.site_id_field
             self.table_creation_dao.create_column(column_name, value_options, is_site_id_column)
 
-    @atomic
     def create_table(self):
         if not self.column_value_options:
             self.calculate_column_value_options_and_row_count()
-        self.table_creation_dao = daos.create_table(self.table_name, self.owner)
+        table_pk = partitioning.create_partition_for_new_table()
+        try:
+            return self._create_table(table_pk)
+        except Exception:
+            if table_pk is not None:
+                partitioning.drop_partition(table_pk)
+            raise
+
+    @atomic
+    def _create_table(self, table_pk):
+        self.table_creation_dao = daos.create_table(self.table_name, self.owner, pk=table_pk)
         self.create_columns()
         self.init_row_transformer()
         self.create_rows()
         self.create_activation_codes()
+        self.table_creation_dao.rebuild_arm_counts()
         return self.table_creation_dao
 
     def rows(self):
@@ -145,11 +173,11 @@ class CSVTableCreator(BaseTableCreator):
         super().__init__(table_name, site_id_field, owner)
 
     def rows(self):
-        return csv.DictReader(decode_utf8(self.csv_file))
+        return csv.DictReader(decode_utf8(compression.decompressed(self.csv_file)))
 
     def column_names(self):
         if not self._columns:
-            self._columns = csv.DictReader(decode_utf8(self.csv_file)).fieldnames
+            self._columns = csv.DictReader(decode_utf8(compression.decompressed(self.csv_file))).fieldnames
         return self._columns
 
 
@@ -166,6 +194,52 @@ class GenericTableCreator(BaseTableCreator):
         return self._columns
 
 
+class GeneratedTableCreator(BaseTableCreator):
+    """
+    Creates a table of permuted blocks for every combination of site and column values, generated from a seed
+    instead of read from a file.
+    """
+    def __init__(self, column_values, rows_per_stratum, block_sizes, table_name, owner, site_id_field=None,
+                 site_values=None, allocation_ratio=(1, 1), seed=None):
+        super().__init__(table_name, site_id_field, owner)
+        if bool(site_id_field) != bool(site_values):
+            raise ValueError('Site values must be provided together with a site id field.')
+        if rows_per_stratum < 1:
+            raise ValueError('Rows per stratum must be positive.')
+        block_randomization.validate_block_sizes(block_sizes, allocation_ratio)
+        self.column_value_options = dict(column_values)
+        if site_id_field:
+            self.column_value_options[site_id_field] = list(site_values)
+        for column_name, values in self.column_value_options.items():
+            if not values:
+                raise ValueError(f'For column `{column_name}`, no values were provided')
+            input_validators.validate_potential_column_values(values)
+        self._columns = list(column_values) + ([site_id_field] if site_id_field else []) + ['randomization_arm']
+        if 'processed' in self._columns:
+            raise ValueError('Invalid column name. `processed` is reserved.')
+        input_validators.validate_column_names(self._columns)
+        self.rows_per_stratum = rows_per_stratum
+        self.block_sizes = block_sizes
+        self.allocation_ratio = allocation_ratio
+        self.seed = seed
+
+    def create_rows(self):
+        number_of_sites = len(self.column_value_options[self.site_id_field]) if self.site_id_field else 1
+        number_of_keys = int(np.prod([len(self.column_value_options[column_name])
+                                      for column_name in self._columns[:-1] if column_name != self.site_id_field]))
+        arms = block_randomization.permuted_block_arms(number_of_sites * number_of_keys, self.rows_per_stratum,
+                                                       self.block_sizes, self.allocation_ratio, self.seed)
+        keys = np.tile(np.repeat(np.arange(number_of_keys), self.rows_per_stratum), number_of_sites)
+        site_ids = np.repeat(np.arange(number_of_sites), number_of_keys * self.rows_per_stratum)
+        site_ids = site_ids.tolist() if self.site_id_field else [None] * len(keys)
+        self.table_creation_dao.bulk_insert_encoded_rows(
+            (site_id, key, randomization_arm, False)
+            for site_id, key, randomization_arm in zip(site_ids, keys.tolist(), arms.ravel().tolist()))
+
+    def column_names(self):
+        return self._columns
+
+
 class BaseTableAppender(BaseRowCreator):
     def __init__(self, table_creation_dao):
         super().__init__(table_creation_dao)
@@ -174,11 +248,7 @@ class BaseTableAppender(BaseRowCreator):
         self.column_value_options = None
 
     def calculate_column_value_options(self):
-        potential_column_values = defaultdict(set)
-        for row_index, row in enumerate(self.rows()):
-            for key in row:
-                if key not in ('randomization_arm', 'processed'):
-                    potential_column_values[key].add(row[key])
+        potential_column_values = self.potential_column_values()
         input_validators.validate_potential_column_values(potential_column_values)
         self.table_creation_dao.validate_potential_column_values_against_existing(potential_column_values)
         self.column_value_options = self.table_creation_dao.get_column_value_options()
@@ -196,6 +266,7 @@ class BaseTableAppender(BaseRowCreator):
         self.init_row_transformer()
         self.create_rows()
         self.create_activation_codes()
+        self.table_creation_dao.rebuild_arm_counts()
         return self.table_creation_dao
 
     def rows(self):
@@ -212,11 +283,11 @@ class CSVTableAppender(BaseTableAppender):
         super().__init__(table_creation_dao)
 
     def rows(self):
-        return csv.DictReader(decode_utf8(self.csv_file))
+        return csv.DictReader(decode_utf8(compression.decompressed(self.csv_file)))
 
     def column_names(self):
         if not self._columns:
-            self._columns = csv.DictReader(decode_utf8(self.csv_file)).fieldnames
+            self._columns = csv.DictReader(decode_utf8(compression.decompressed(self.csv_file))).fieldnames
         return self._columns
 
 
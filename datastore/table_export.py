@@ -0,0 +1,35 @@
+import csv
+import json
+
+# Serializers for TableExportDAO records, returning generators of text for a StreamingHttpResponse that hold a
+# single record in memory at a time.
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+CONTENT_TYPES = {CSV: 'text/csv', NDJSON: 'application/x-ndjson'}
+
+
+class EchoBuffer:
+    @staticmethod
+    def write(value):
+        return value
+
+
+def csv_lines(header, records):
+    writer = csv.writer(EchoBuffer())
+    yield writer.writerow(header)
+    for record in records:
+        yield writer.writerow(record)
+
+
+def ndjson_lines(header, records):
+    for record in records:
+        yield json.dumps(dict(zip(header, record))) + '\n'
+
+
+def export_lines(export_format, header, records):
+    if export_format == CSV:
+        return csv_lines(header, records)
+    if export_format == NDJSON:
+        return ndjson_lines(header, records)
+    raise KeyError(f'Unknown export format `{export_format}`')
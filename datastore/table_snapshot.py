@@ -0,0 +1,141 @@
+import json
+from datetime import timezone
+import numpy as np
+
+# Columnar snapshots of a table as compressed NumPy .npz archives, with MISSING for missing integers and NaT
+# for missing timestamps. Loading a snapshot only needs NumPy, so this module does not import Django.
+
+SNAPSHOT_VERSION = 1
+MISSING = -1
+ROW_CHUNK_SIZE = 10000
+INTEGER_FIELDS = (('row_id', np.int64), ('key', np.int64), ('site_id', np.int32), ('randomization_arm', np.int8),
+                  ('patient_id', np.int64), ('processed', np.bool_), ('reservation_id', np.int64))
+DATETIME_FIELDS = ('reservation_datetime', 'processed_datetime')
+FIELDS = tuple(name for name, _ in INTEGER_FIELDS) + DATETIME_FIELDS
+
+
+def _integer_array(values, dtype):
+    return np.array([MISSING if value is None else value for value in values], dtype=dtype)
+
+
+def _datetime_array(values):
+    return np.array([value.astimezone(timezone.utc).replace(tzinfo=None) if value else None for value in values],
+                    dtype='datetime64[us]')
+
+
+def _chunk_arrays(chunk):
+    columns = list(zip(*chunk))
+    arrays = {name: _integer_array(values, dtype) for (name, dtype), values in zip(INTEGER_FIELDS, columns)}
+    for name, values in zip(DATETIME_FIELDS, columns[len(INTEGER_FIELDS):]):
+        arrays[name] = _datetime_array(values)
+    return arrays
+
+
+def snapshot_arrays(row_chunks):
+    chunk_arrays = [_chunk_arrays(chunk) for chunk in row_chunks]
+    if not chunk_arrays:
+        empty = {name: np.zeros(0, dtype=dtype) for name, dtype in INTEGER_FIELDS}
+        empty.update({name: np.zeros(0, dtype='datetime64[us]') for name in DATETIME_FIELDS})
+        return empty
+    return {name: np.concatenate([arrays[name] for arrays in chunk_arrays]) for name in FIELDS}
+
+
+def write_table_snapshot(table_export_dao, output_file):
+    arrays = snapshot_arrays(table_export_dao.snapshot_row_chunks())
+    metadata = dict(table_export_dao.snapshot_metadata(), version=SNAPSHOT_VERSION)
+    np.savez_compressed(output_file, metadata=np.array(json.dumps(metadata)), **arrays)
+
+
+class TableSnapshot:
+    def __init__(self, arrays, metadata):
+        self.arrays = arrays
+        self.metadata = metadata
+
+    @classmethod
+    def load(cls, snapshot_file, row_ids=None):
+        """
+        Reads a snapshot, keeping only the rows in row_ids if given.
+        """
+        with np.load(snapshot_file, allow_pickle=False) as data:
+            metadata = json.loads(str(data['metadata']))
+            if metadata.get('version') != SNAPSHOT_VERSION:
+                raise ValueError(f'Unsupported snapshot version `{metadata.get("version")}`')
+            if row_ids is None:
+                arrays = {name: data[name] for name in FIELDS}
+            else:
+                rows = np.isin(data['row_id'], np.fromiter(row_ids, dtype=np.int64))
+                arrays = {name: data[name][rows] for name in FIELDS}
+        return cls(arrays, metadata)
+
+    def __len__(self):
+        return len(self.arrays['row_id'])
+
+    def select(self, rows):
+        """
+        Returns a snapshot of the rows selected by a boolean array.
+        """
+        return TableSnapshot({name: array[rows] for name, array in self.arrays.items()}, self.metadata)
+
+    def row_values_iter(self, chunk_size=ROW_CHUNK_SIZE):
+        """
+        Yields the values of each row in FIELDS order, with None for missing values and timestamps in UTC. Rows are
+        converted to Python values chunk_size at a time.
+        """
+        for start in range(0, len(self), chunk_size):
+            columns = []
+            for name, _ in INTEGER_FIELDS:
+                values = self.arrays[name][start:start + chunk_size].tolist()
+                columns.append(values if name == 'processed' else [None if value == MISSING else value
+                                                                   for value in values])
+            for name in DATETIME_FIELDS:
+                columns.append([value.replace(tzinfo=timezone.utc) if value else None
+                                for value in self.arrays[name][start:start + chunk_size].tolist()])
+            yield from zip(*columns)
+
+    def reservation_ids(self):
+        reservation_ids = np.unique(self.arrays['reservation_id'])
+        return reservation_ids[reservation_ids != MISSING].tolist()
+
+    def column_names(self):
+        return [column['name'] for column in self.metadata['columns']]
+
+    def column_codes(self):
+        codes = {}
+        stride = 1
+        for column in self.metadata['columns']:
+            codes[column['name']] = (self.arrays['key'] // stride) % column['number_of_options']
+            stride *= column['number_of_options']
+        return codes
+
+    def site_labels(self):
+        site_id_column = self.metadata['site_id_column']
+        if not site_id_column:
+            return None
+        site_ids = self.arrays['site_id']
+        labels = np.asarray(site_id_column['potential_values'] + [''])
+        return labels[np.where(site_ids == MISSING, len(labels) - 1, site_ids)]
+
+    def arm_labels(self):
+        arm_names = self.metadata['arm_names']
+        labels = np.asarray([str(arm) for arm in range(max(len(arm_names), 3))], dtype=object)
+        for arm, name in arm_names.items():
+            labels[int(arm)] = name
+        return labels[self.arrays['randomization_arm']].astype(str)
+
+    def labeled_frame(self):
+        frame = {'row_id': self.arrays['row_id'], 'patient_id': self.arrays['patient_id']}
+        site_labels = self.site_labels()
+        if site_labels is not None:
+            frame[self.metadata['site_id_column']['name']] = site_labels
+        column_values = {column['name']: np.asarray(column['potential_values'])
+                         for column in self.metadata['columns']}
+        for name, codes in self.column_codes().items():
+            frame[name] = column_values[name][codes]
+        frame['randomization_arm'] = self.arm_labels()
+        for name in ('processed', 'reservation_id') + DATETIME_FIELDS:
+            frame[name] = self.arrays[name]
+        return frame
+
+    def to_pandas(self):
+        import pandas
+        return pandas.DataFrame(self.labeled_frame())
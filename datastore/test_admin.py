@@ -0,0 +1,105 @@
+from unittest import mock
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from . import admin
+from . import daos
+from . import models
+from . import row_history
+from . import table_creation
+from permissions import models as permissions_models
+
+
+class RowAdminTestCase(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create(username='test_staff', is_staff=True, is_superuser=True)
+        header = ['randomization_arm', 'column_1', 'site']
+        rows = [{'randomization_arm': str(1 + i % 2), 'column_1': column_1, 'site': site}
+                for site in ('x', 'y') for column_1 in ('a', 'b', 'c') for i in range(4)]
+        self.table = table_creation.GenericTableCreator(header, rows, 'admin_test', 'site',
+                                                        self.staff).create_table()._table
+        self.pks = list(self.table.row_set.order_by('pk').values_list('pk', flat=True))
+        self.client.force_login(self.staff)
+
+    def reserve_rows(self, count):
+        for _ in range(count):
+            user = User.objects.create(username=f'test_user_{User.objects.count()}')
+            permissions_models.TablePermission.objects.create(table=self.table, user=user)
+            permissions_models.TableSiteIdAccess.objects.create(table=self.table, user=user, is_active=True)
+            row = daos.TableReservationDAO(self.table, user).reserve_next_available_row({'column_1': 0, 'site': 0})
+            daos.TableReservationDAO(self.table, user).complete_my_reservation(row.pk)
+
+    def changelist_pks(self, query=''):
+        response = self.client.get(f'/admin/datastore/row/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response, [row.pk for row in response.context['cl'].result_list]
+
+    @mock.patch.object(admin.RowAdmin, 'list_per_page', 10)
+    def test_keyset_pagination(self):
+        response, pks = self.changelist_pks()
+        self.assertEqual(pks, self.pks[:10])
+        self.assertEqual(response.context['cl'].keyset_next_url, f'?after={self.pks[9]}')
+        response, pks = self.changelist_pks(f'?after={self.pks[9]}')
+        self.assertEqual(pks, self.pks[10:20])
+        self.assertContains(response, f'?after={self.pks[19]}')
+        self.assertContains(response, '24 rows')
+        response, pks = self.changelist_pks(f'?after={self.pks[19]}&processed__exact=0')
+        self.assertEqual(pks, self.pks[20:])
+        self.assertIsNone(response.context['cl'].keyset_next_url)
+        self.assertEqual(self.client.get('/admin/datastore/row/?after=x').status_code, 302)
+
+    def test_search_is_an_exact_patient_id_match(self):
+        self.reserve_rows(2)
+        row = self.table.row_set.filter(patient_id__isnull=False).first()
+        self.assertEqual(self.changelist_pks(f'?q={row.patient_id}')[1], [row.pk])
+        self.assertEqual(self.changelist_pks(f'?q={str(row.patient_id)[:-1]}')[1], [])
+        self.assertEqual(self.changelist_pks('?q=abc')[1], [])
+
+    def test_changelist_queries_do_not_grow_with_reservations(self):
+        self.reserve_rows(1)
+        with CaptureQueriesContext(connection) as context:
+            self.changelist_pks()
+        queries = len(context.captured_queries)
+        self.reserve_rows(3)
+        with CaptureQueriesContext(connection) as context:
+            response, _ = self.changelist_pks()
+        self.assertEqual(len(context.captured_queries), queries)
+        self.assertContains(response, 'test_user_1')
+
+    def arm_count(self, row):
+        return models.ArmCount.objects.get(table=self.table, site_id=row.site_id, key=row.key,
+                                           randomization_arm=row.randomization_arm)
+
+    def test_edits_are_recorded_as_row_changes(self):
+        self.reserve_rows(1)
+        row = self.table.row_set.get(processed=True)
+        completed = self.arm_count(row).completed
+        response = self.client.post('/admin/datastore/row/', {
+            'form-TOTAL_FORMS': 1, 'form-INITIAL_FORMS': 1, 'form-0-id': row.pk,
+            'form-0-reservation': row.reservation_id, '_save': 'Save'})
+        self.assertEqual(response.status_code, 302)
+        change = models.RowChange.objects.filter(row=row).last()
+        self.assertEqual((change.action, change.changed_by, change.processed),
+                         (models.RowChange.ADMIN_EDIT, self.staff, False))
+        self.assertFalse(row_history.table_state_as_of(self.table, change.changed_datetime)[row.pk].processed)
+        self.assertEqual(self.arm_count(row).completed, completed - 1)
+        self.assertEqual(self.arm_count(row).reserved, 1)
+
+
+class TableSiteIdAccessAdminTestCase(TestCase):
+    def test_site_column_queries_do_not_grow_with_rows(self):
+        staff = User.objects.create(username='test_staff', is_staff=True, is_superuser=True)
+        header = ['randomization_arm', 'site']
+        rows = [{'randomization_arm': '1', 'site': site} for site in ('x', 'y')]
+        table = table_creation.GenericTableCreator(header, rows, 'access_admin_test', 'site', staff).create_table()
+        self.client.force_login(staff)
+        query_counts = []
+        for i in range(2):
+            user = User.objects.create(username=f'test_user_{i}')
+            permissions_models.TableSiteIdAccess.objects.create(table=table._table, user=user, site_id=i)
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get('/admin/permissions/tablesiteidaccess/')
+            query_counts.append(len(context.captured_queries))
+        self.assertEqual(query_counts[0], query_counts[1])
+        self.assertContains(response, '<td class="field-site">y</td>', html=True)
@@ -0,0 +1,111 @@
+import io
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from . import archives
+from . import daos
+from . import models
+from . import row_history
+from . import table_creation
+from permissions import models as permissions_models
+
+
+class TableArchiveTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_not_staff')
+        self.staff = User.objects.create(username='test_staff', is_staff=True)
+        header = ['randomization_arm', 'column_1', 'site']
+        rows = [{'randomization_arm': str(1 + i % 2), 'column_1': column_1, 'site': site}
+                for site in ('x', 'y') for column_1 in ('a', 'b', 'c') for i in range(4)]
+        table_creator = table_creation.GenericTableCreator(header, rows, 'archive_test', 'site', self.staff)
+        self.table = table_creator.create_table()._table
+        permissions_models.TablePermission.objects.create(table=self.table, user=self.user)
+        permissions_models.TableSiteIdAccess.objects.create(table=self.table, user=self.user, site_id=1, is_active=True)
+        self.row = daos.TableReservationDAO(self.table, self.user).reserve_next_available_row({'column_1': 2})
+        daos.TableReservationDAO(self.table, self.user).complete_my_reservation(self.row.pk)
+
+    def export_records(self):
+        return list(daos.TableExportDAO(self.table, self.staff).export_records_iter())
+
+    def test_archive_and_restore(self):
+        rows = list(self.table.row_set.order_by('pk').values())
+        records = self.export_records()
+        changes = daos.RowChangeFeedDAO(self.table, self.staff).changes_since()
+        archive = archives.archive_table(self.table, batch_size=5)
+        self.table.refresh_from_db()
+        self.assertTrue(self.table.is_archived)
+        self.assertEqual(archive.row_count, 24)
+        self.assertFalse(self.table.row_set.exists())
+        self.assertEqual(self.export_records(), records)
+        self.assertEqual(daos.RowChangeFeedDAO(self.table, self.staff).changes_since(), changes)
+        row_daos = list(daos.TableReservationDAO(self.table, self.user).row_dao_iter(as_staff=True))
+        self.assertEqual([row_dao.get_pk() for row_dao in row_daos], [self.row.pk])
+        with self.assertRaises(PermissionError):
+            daos.TableReservationDAO(self.table, self.user).reserve_next_available_row({'column_1': 0})
+        self.assertEqual(archives.restore_table(self.table, batch_size=5), 24)
+        self.table.refresh_from_db()
+        self.assertFalse(self.table.is_archived)
+        self.assertFalse(models.TableArchive.objects.exists())
+        self.assertEqual(list(self.table.row_set.order_by('pk').values()), rows)
+
+    def test_rows_are_deleted_in_batches(self):
+        with CaptureQueriesContext(connection) as context:
+            archives.archive_table(self.table, batch_size=5)
+        deletes = [query['sql'] for query in context.captured_queries
+                   if query['sql'].startswith('DELETE FROM "datastore_row"')]
+        self.assertEqual(len(deletes), 5)
+
+    def test_open_reservation_prevents_archive(self):
+        daos.TableReservationDAO(self.table, self.user).reserve_next_available_row({'column_1': 0})
+        with self.assertRaises(ValueError):
+            archives.archive_table(self.table)
+        self.assertFalse(models.TableArchive.objects.exists())
+        self.assertEqual(self.table.row_set.count(), 24)
+
+    def test_reservation_rechecks_archiving_once_row_is_locked(self):
+        table_reservation_dao = daos.TableReservationDAO(self.table, self.user)
+        models.Table.objects.filter(pk=self.table.pk).update(is_archived=True)
+        with self.assertRaises(PermissionError):
+            table_reservation_dao.reserve_next_available_row({'column_1': 0})
+        self.assertEqual(self.table.row_set.filter(reservation__isnull=False).count(), 1)
+
+    def test_change_feed_reads_only_page_rows_from_archive(self):
+        daos.TableReservationDAO(self.table, self.user).reserve_next_available_row({'column_1': 0})
+        daos.TableReservationDAO(self.table, self.user).cancel_my_reservation(
+            self.table.row_set.get(processed=False, reservation__isnull=False).pk)
+        changes, next_cursor, has_more = daos.RowChangeFeedDAO(self.table, self.staff).changes_since(limit=2)
+        archives.archive_table(self.table)
+        self.table.refresh_from_db()
+        change_feed_dao = daos.RowChangeFeedDAO(self.table, self.staff)
+        with mock.patch.object(archives, 'archived_rows', wraps=archives.archived_rows) as archived_rows:
+            self.assertEqual(change_feed_dao.changes_since(limit=2), (changes, next_cursor, has_more))
+            self.assertEqual(archived_rows.call_args[1]['row_ids'], {change['row_id'] for change in changes})
+            later_changes, cursor, has_more = change_feed_dao.changes_since(next_cursor)
+            self.assertEqual((len(later_changes), has_more), (2, False))
+            self.assertEqual(change_feed_dao.changes_since(cursor), ([], cursor, False))
+        self.assertEqual(archived_rows.call_count, 2)
+
+    def test_history_of_archived_table(self):
+        imported_row = self.table.row_set.exclude(pk=self.row.pk).order_by('pk').first()
+        models.Row.objects.filter(pk=imported_row.pk).update(processed=True)
+        state = row_history.table_state_as_of(self.table, timezone.now())
+        self.assertEqual(set(state), {imported_row.pk, self.row.pk})
+        archives.archive_table(self.table)
+        self.table.refresh_from_db()
+        self.assertEqual(row_history.table_state_as_of(self.table, timezone.now()), state)
+
+    def test_archived_table_is_read_only(self):
+        call_command('archive_table', self.table.pk, stdout=io.StringIO())
+        self.client.force_login(self.user)
+        url = f'/{self.table.pk}-{self.table.slug()}/'
+        response = self.client.get(url)
+        self.assertContains(response, 'archived and is read-only')
+        self.assertNotContains(response, 'type="submit"')
+        response = self.client.post(url, {'column_1': '0'})
+        self.assertContains(response, 'Archived tables are read-only')
+        call_command('restore_table', self.table.pk, stdout=io.StringIO())
+        self.assertEqual(self.table.row_set.count(), 24)
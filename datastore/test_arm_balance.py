@@ -0,0 +1,95 @@
+from importlib import import_module
+import numpy as np
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.db.transaction import atomic
+from django.db.utils import IntegrityError
+from django.test import TestCase
+from . import arm_balance
+from . import daos
+from . import model_html
+from . import models
+from . import table_creation
+from permissions import models as permissions_models
+
+
+class ArmBalanceTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_not_staff')
+        self.staff = User.objects.create(username='test_staff', is_staff=True)
+        header = ['randomization_arm', 'processed', 'column_name']
+        rows = [{'randomization_arm': '1', 'processed': '1', 'column_name': 'a'}] + \
+               [{'randomization_arm': str(1 + i % 2), 'processed': '0', 'column_name': 'a'} for i in range(4)] + \
+               [{'randomization_arm': '2', 'processed': '0', 'column_name': 'b'}]
+        table_creator = table_creation.GenericTableCreator(header, rows, 'balance_test', None, self.staff)
+        self.table = table_creator.create_table()._table
+        permissions_models.TablePermission.objects.create(table=self.table, user=self.user)
+        permissions_models.TableSiteIdAccess.objects.create(table=self.table, user=self.user, is_active=True)
+
+    def arm_counts(self):
+        return {(arm_count.key, arm_count.randomization_arm): (arm_count.reserved, arm_count.completed)
+                for arm_count in self.table.armcount_set.all()}
+
+    def test_counts_after_import(self):
+        self.assertEqual(self.arm_counts(), {(0, 1): (0, 1), (0, 2): (0, 0), (1, 2): (0, 0)})
+
+    def test_counts_follow_transitions(self):
+        dao = daos.TableReservationDAO(self.table, self.user)
+        row_a = dao.reserve_next_available_row({'column_name': 0})
+        self.assertEqual(self.arm_counts()[(0, row_a.randomization_arm)][0], 1)
+        dao.complete_my_reservation(row_a.pk)
+        row_b = dao.reserve_next_available_row({'column_name': 0})
+        dao.cancel_my_reservation(row_b.pk)
+        expected = {(0, 1): [0, 1], (0, 2): [0, 0], (1, 2): [0, 0]}
+        expected[(0, row_a.randomization_arm)][1] += 1
+        self.assertEqual(self.arm_counts(), {key: tuple(value) for key, value in expected.items()})
+        dao.reserve_next_available_row({'column_name': 1})
+        self.assertEqual(self.arm_counts()[(1, 2)], (1, 0))
+        incremental_counts = self.arm_counts()
+        arm_balance.rebuild_arm_counts(self.table)
+        self.assertEqual(self.arm_counts(), incremental_counts)
+
+    def test_missing_count_is_created(self):
+        self.table.armcount_set.all().delete()
+        dao = daos.TableReservationDAO(self.table, self.user)
+        row = dao.reserve_next_available_row({'column_name': 1})
+        self.assertEqual(self.arm_counts(), {(1, 2): (1, 0)})
+        dao.complete_my_reservation(row.pk)
+        self.assertEqual(self.arm_counts(), {(1, 2): (0, 1)})
+
+    def test_counts_without_site_are_unique(self):
+        arm_count = self.table.armcount_set.first()
+        with self.assertRaises(IntegrityError), atomic():
+            models.ArmCount.objects.create(table=self.table, site_id=None, key=arm_count.key,
+                                           randomization_arm=arm_count.randomization_arm)
+        models.ArmCount.objects.create(table=self.table, site_id=0, key=arm_count.key,
+                                       randomization_arm=arm_count.randomization_arm)
+
+    def test_rebuild_with_many_strata(self):
+        header = ['randomization_arm', 'column_name']
+        rows = [{'randomization_arm': '1', 'column_name': str(i)} for i in range(600)]
+        table = table_creation.GenericTableCreator(header, rows, 'many_strata', None, self.staff).create_table()._table
+        arm_balance.rebuild_arm_counts(table)
+        self.assertEqual(table.armcount_set.count(), 600)
+
+    def test_migration_backfills_existing_tables(self):
+        dao = daos.TableReservationDAO(self.table, self.user)
+        dao.reserve_next_available_row({'column_name': 1})
+        expected = self.arm_counts()
+        models.ArmCount.objects.all().delete()
+        import_module('datastore.migrations.0004_armcount').backfill_arm_counts(apps, None)
+        self.assertEqual(self.arm_counts(), expected)
+
+    def test_calculate_arm_counts(self):
+        row_arrays = np.array([[-1, 0, 1, 1, 0], [-1, 0, 1, 1, 1], [3, 0, 1, 0, 0], [-1, 0, 2, 1, 0]])
+        groups, reserved, completed = arm_balance.calculate_arm_counts(row_arrays)
+        self.assertEqual(groups.tolist(), [[-1, 0, 1], [-1, 0, 2], [3, 0, 1]])
+        self.assertEqual(reserved.tolist(), [1, 1, 0])
+        self.assertEqual(completed.tolist(), [1, 0, 0])
+
+    def test_balance_html(self):
+        with self.assertRaises(PermissionError):
+            daos.ArmBalanceDAO(self.table, self.user)
+        html = model_html.ArmBalanceHtml(daos.ArmBalanceDAO(self.table, self.staff)).as_html_table()
+        self.assertIn('<th>1 Completed</th>', html)
+        self.assertIn('>Total</td><td>0</td><td>1</td>', html)
@@ -0,0 +1,27 @@
+import numpy as np
+from django.test import TestCase
+from . import block_randomization
+
+
+class PermutedBlockTestCase(TestCase):
+    def test_blocks_are_balanced(self):
+        arms = block_randomization.permuted_block_arms(50, 24, [4], seed=3)
+        self.assertEqual(arms.shape, (50, 24))
+        self.assertTrue(((arms.reshape(50, 6, 4) == 1).sum(axis=2) == 2).all())
+        arms = block_randomization.permuted_block_arms(50, 30, [3], allocation_ratio=(2, 1), seed=3)
+        self.assertEqual((arms == 1).sum(), 50 * 20)
+        self.assertEqual(set(np.unique(arms)), {1, 2})
+
+    def test_seed_reproducibility(self):
+        arms = block_randomization.permuted_block_arms(10, 17, [2, 4, 6], seed=11)
+        self.assertTrue((block_randomization.permuted_block_arms(10, 17, [2, 4, 6], seed=11) == arms).all())
+        self.assertFalse((block_randomization.permuted_block_arms(10, 17, [2, 4, 6], seed=12) == arms).all())
+
+    def test_block_size_validation(self):
+        with self.assertRaises(ValueError):
+            block_randomization.validate_block_sizes([4, 5], (1, 1))
+        with self.assertRaises(ValueError):
+            block_randomization.validate_block_sizes([], (1, 1))
+        with self.assertRaises(ValueError):
+            block_randomization.validate_block_sizes([4], (0, 1))
+        block_randomization.validate_block_sizes([3, 6], (1, 2))
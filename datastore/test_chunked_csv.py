@@ -0,0 +1,73 @@
+import csv
+import os
+import tempfile
+from django.test import TestCase
+from . import chunked_csv
+from . import table_creation
+
+
+class ChunkedCsvTestCase(TestCase):
+    def setUp(self):
+        self.header = ['randomization_arm', 'processed', 'sex', 'site']
+        self.lines = [f'{1 + i % 2},0,{"fm"[i % 2]},{"ab"[i // 50]}' for i in range(100)]
+
+    def staged_file(self, lines):
+        staged_file = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False)
+        staged_file.write('\n'.join([','.join(self.header)] + lines) + '\n')
+        staged_file.close()
+        self.addCleanup(os.remove, staged_file.name)
+        return staged_file.name
+
+    def validate(self, path, chunk_bytes):
+        header = chunked_csv.read_header(path)
+        rows_before = 0
+        values = {}
+        for chunk in chunked_csv.chunks(path, chunk_bytes=chunk_bytes, chunk_rows=7):
+            chunk_validation = chunked_csv.validate_chunk(header, chunk, 'site')
+            if chunk_validation.error:
+                raise chunked_csv.line_error(chunk_validation.error, rows_before)
+            rows_before += chunk_validation.row_count
+            for name, chunk_values in chunk_validation.potential_column_values.items():
+                values.setdefault(name, set()).update(chunk_values)
+        return rows_before, values
+
+    def serial_error(self, path):
+        with open(path, newline='') as staged_file:
+            reader = csv.DictReader(staged_file)
+            with self.assertRaises(ValueError) as context:
+                table_creation.validate_table_data_core(reader.fieldnames, reader, 'site')
+        return str(context.exception)
+
+    def test_byte_ranges_are_line_aligned(self):
+        path = self.staged_file(self.lines)
+        ranges = chunked_csv.byte_ranges(path, chunk_bytes=50)
+        self.assertGreater(len(ranges), 5)
+        with open(path, 'rb') as staged_file:
+            data = staged_file.read()
+        self.assertEqual(ranges[0].start, data.index(b'\n') + 1)
+        self.assertEqual(ranges[-1].end, len(data))
+        for previous, following in zip(ranges, ranges[1:]):
+            self.assertEqual(previous.end, following.start)
+            self.assertEqual(data[previous.end - 1:previous.end], b'\n')
+        self.assertEqual(sum(len(chunked_csv.chunk_records(byte_range)) for byte_range in ranges), 100)
+
+    def test_validation(self):
+        self.assertEqual(self.validate(self.staged_file(self.lines), 64),
+                         (100, {'sex': {'f', 'm'}, 'site': {'a', 'b'}}))
+
+    def test_error_line_numbers(self):
+        for index, bad_line in ((0, '3,0,f,a'), (57, '1,0,f<,b'), (99, '1,0,f'), (64, '1,0,f,b,extra')):
+            lines = list(self.lines)
+            lines[index] = bad_line
+            path = self.staged_file(lines)
+            for chunk_bytes in (16, 300, chunked_csv.CHUNK_BYTES):
+                with self.assertRaises(ValueError) as context:
+                    self.validate(path, chunk_bytes)
+                self.assertEqual(str(context.exception), self.serial_error(path))
+
+    def test_quoted_files_use_record_chunks(self):
+        lines = list(self.lines)
+        lines[10] = '1,0,"f",a'
+        path = self.staged_file(lines)
+        self.assertFalse(any(isinstance(chunk, chunked_csv.ByteRange) for chunk in chunked_csv.chunks(path)))
+        self.assertEqual(self.validate(path, 64)[0], 100)
@@ -0,0 +1,59 @@
+import bz2
+import gzip
+import io
+import lzma
+import os
+import tempfile
+import zipfile
+from django.test import TestCase
+from . import chunked_csv
+from . import compression
+
+
+def zip_compress(data, names=('table.csv',)):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name in names:
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+COMPRESSORS = {
+    compression.GZIP: gzip.compress,
+    compression.BZIP2: bz2.compress,
+    compression.XZ: lzma.compress,
+    compression.ZIP: zip_compress,
+}
+
+
+class CompressionTestCase(TestCase):
+    def setUp(self):
+        lines = ['randomization_arm,processed,sex,site'] + \
+                [f'{1 + i % 2},0,{"fm"[i % 2]},{"ab"[i // 50]}' for i in range(100)]
+        self.data = ('\n'.join(lines) + '\n').encode('utf-8')
+
+    def staged_file(self, data):
+        staged_file = tempfile.NamedTemporaryFile(suffix='.csv', delete=False)
+        staged_file.write(data)
+        staged_file.close()
+        self.addCleanup(os.remove, staged_file.name)
+        return staged_file.name
+
+    def test_formats_are_sniffed_and_decompressed(self):
+        self.assertIsNone(compression.sniff(io.BytesIO(self.data)))
+        for name, compress in COMPRESSORS.items():
+            binary_file = io.BytesIO(compress(self.data))
+            self.assertEqual(compression.sniff(binary_file), name)
+            self.assertEqual(compression.decompressed(binary_file).read(), self.data)
+
+    def test_compressed_files_use_record_chunks(self):
+        for compress in COMPRESSORS.values():
+            path = self.staged_file(compress(self.data))
+            self.assertEqual(chunked_csv.read_header(path), ['randomization_arm', 'processed', 'sex', 'site'])
+            chunks = list(chunked_csv.chunks(path, chunk_rows=30))
+            self.assertEqual([len(chunk) for chunk in chunks], [30, 30, 30, 10])
+            self.assertEqual(chunks[0][0], ['1', '0', 'f', 'a'])
+
+    def test_zip_archives_must_hold_one_file(self):
+        with self.assertRaises(ValueError):
+            compression.decompressed(io.BytesIO(zip_compress(self.data, names=('a.csv', 'b.csv'))))
@@ -497,3 +497,107 @@ class TableColumnRenameTestCaseWithSiteId(TableColumnRenameMixin, TestCase):
             self.table_modify_dao.get_arm_name('A')
         with self.assertRaises(ValueError):
             self.table_modify_dao.get_arm_name(0)
+
+
+class SiteIdSearchTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_not_staff')
+        self.staff = User.objects.create(username='test_staff', is_staff=True)
+        table_creation_dao = daos.create_table('dao_test', self.staff)
+        self.table = table_creation_dao._table
+        table_creation_dao.create_column('column_1', ['a', 'b'])
+        self.sites = [f'Site {i:04d}' for i in range(1000)] + ['Boston', 'boulder']
+        table_creation_dao.create_column('site', self.sites, is_site_id_column=True)
+        permissions_models.TablePermission.objects.create(table=self.table, user=self.user)
+        for site_id in (1, 15, 1001):
+            permissions_models.TableSiteIdAccess.objects.create(table=self.table, user=self.user,
+                                                                site_id=site_id, is_active=True)
+
+    def test_owner_search(self):
+        table_reservation_dao = daos.TableReservationDAO(self.table, self.staff)
+        self.assertEqual(table_reservation_dao.search_site_id_choices('bo'), [('1000', 'Boston'), ('1001', 'boulder')])
+        self.assertEqual(table_reservation_dao.search_site_id_choices('site 001', limit=3),
+                         [('10', 'Site 0010'), ('11', 'Site 0011'), ('12', 'Site 0012')])
+        self.assertEqual(table_reservation_dao.search_site_id_choices('missing'), [])
+        self.assertEqual(table_reservation_dao.site_id_for_value('Site 0999'), 999)
+        with self.assertRaises(KeyError):
+            table_reservation_dao.site_id_for_value('site 0999')
+
+    def test_restricted_search(self):
+        table_reservation_dao = daos.TableReservationDAO(self.table, self.user)
+        self.assertEqual(table_reservation_dao.search_site_id_choices('site 00'),
+                         [('1', 'Site 0001'), ('15', 'Site 0015')])
+        self.assertEqual(table_reservation_dao.search_site_id_choices('bo'), [('1001', 'boulder')])
+        self.assertEqual(table_reservation_dao.site_id_for_value('Site 0015'), 15)
+        with self.assertRaises(KeyError):
+            table_reservation_dao.site_id_for_value('Site 0016')
+
+    def test_site_choice_limit(self):
+        table_reservation_dao = daos.TableReservationDAO(self.table, self.staff)
+        columns = list(table_reservation_dao.column_names_and_choices_iter(site_choice_limit=100))
+        self.assertEqual(columns[1], ('site', None))
+        columns = list(table_reservation_dao.column_names_and_choices_iter(site_choice_limit=2000))
+        self.assertEqual(len(columns[1][1]), len(self.sites) + 1)
+        table_reservation_dao = daos.TableReservationDAO(self.table, self.user)
+        columns = list(table_reservation_dao.column_names_and_choices_iter(site_choice_limit=2))
+        self.assertEqual(columns[1], ('site', None))
+        columns = list(table_reservation_dao.column_names_and_choices_iter(site_choice_limit=3))
+        self.assertEqual(columns[1], ('site', [('', ' '), ('1', 'Site 0001'), ('15', 'Site 0015'),
+                                               ('1001', 'boulder')]))
+
+
+class RowChangeFeedTestCase(BasicTableMixin, TestCase):
+    def test_transitions_are_recorded(self):
+        table_reservation_dao = daos.TableReservationDAO(self.table, self.user)
+        row = table_reservation_dao.reserve_next_available_row({'column_1': 1, 'column_2': 2})
+        daos.TableReservationDAO(self.table, self.user).cancel_my_reservation(row.pk)
+        row = daos.TableReservationDAO(self.table, self.user).reserve_next_available_row({'column_1': 1,
+                                                                                         'column_2': 2})
+        daos.TableReservationDAO(self.table, self.staff).complete_override_reservation(row.pk)
+        changes = list(models.RowChange.objects.filter(table=self.table))
+        self.assertEqual([change.action for change in changes],
+                         [models.RowChange.RESERVE, models.RowChange.CANCEL,
+                          models.RowChange.RESERVE, models.RowChange.COMPLETE_OVERRIDE])
+        self.assertEqual([change.patient_id for change in changes], [1001, None, 1001, 1001])
+        self.assertEqual([change.changed_by for change in changes], [self.user, self.user, self.user, self.staff])
+        self.assertEqual(changes[3].reservation, self.user)
+        self.assertTrue(changes[3].processed)
+
+    def test_changes_since_cursor(self):
+        for _ in range(3):
+            row = daos.TableReservationDAO(self.table, self.user).reserve_next_available_row({'column_1': 1,
+                                                                                             'column_2': 2})
+            daos.TableReservationDAO(self.table, self.user).cancel_my_reservation(row.pk)
+        with self.assertRaises(PermissionError):
+            daos.RowChangeFeedDAO(self.table, self.user)
+        row_change_feed_dao = daos.RowChangeFeedDAO(self.table, self.staff)
+        changes, cursor, has_more = row_change_feed_dao.changes_since(0, limit=4)
+        self.assertEqual(len(changes), 4)
+        self.assertTrue(has_more)
+        self.assertEqual(cursor, changes[-1]['sequence'])
+        self.assertEqual(changes[0]['action'], models.RowChange.RESERVE)
+        self.assertEqual(changes[0]['columns'], {'column_1': 'b', 'column_2': '3'})
+        self.assertEqual(changes[0]['reserved_by'], 'test_not_staff')
+        self.assertIsNone(changes[1]['reserved_by'])
+        changes, cursor, has_more = row_change_feed_dao.changes_since(cursor, limit=4)
+        self.assertEqual(len(changes), 2)
+        self.assertFalse(has_more)
+        self.assertEqual(row_change_feed_dao.changes_since(cursor), ([], cursor, False))
+        self.assertEqual(row_change_feed_dao.changes_since(0, visible_before=timezone.now() - timedelta(days=1)),
+                         ([], 0, False))
+
+    def test_changes_since_stops_at_settling_change(self):
+        for _ in range(2):
+            row = daos.TableReservationDAO(self.table, self.user).reserve_next_available_row({'column_1': 1,
+                                                                                             'column_2': 2})
+            daos.TableReservationDAO(self.table, self.user).cancel_my_reservation(row.pk)
+        first, second, third, fourth = self.table.rowchange_set.order_by('pk')
+        visible_before = timezone.now()
+        models.RowChange._base_manager.filter(pk=second.pk).update(
+            changed_datetime=visible_before + timedelta(seconds=1))
+        row_change_feed_dao = daos.RowChangeFeedDAO(self.table, self.staff)
+        changes, cursor, has_more = row_change_feed_dao.changes_since(0, visible_before=visible_before)
+        self.assertEqual([change['sequence'] for change in changes], [first.pk])
+        self.assertEqual((cursor, has_more), (first.pk, False))
+        changes, cursor, has_more = row_change_feed_dao.changes_since(cursor)
+        self.assertEqual([change['sequence'] for change in changes], [second.pk, third.pk, fourth.pk])
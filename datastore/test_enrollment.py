@@ -0,0 +1,81 @@
+from datetime import timedelta
+import numpy as np
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+from . import daos
+from . import enrollment
+from . import model_html
+from . import models
+from . import table_creation
+from permissions import models as permissions_models
+
+
+class EnrollmentTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_not_staff')
+        self.staff = User.objects.create(username='test_staff', is_staff=True)
+        header = ['randomization_arm', 'processed', 'column_name']
+        rows = [{'randomization_arm': '1', 'processed': '0', 'column_name': 'a'} for _ in range(3)] + \
+               [{'randomization_arm': '2', 'processed': '0', 'column_name': 'b'} for _ in range(20)]
+        table_creator = table_creation.GenericTableCreator(header, rows, 'enrollment_test', None, self.staff)
+        self.table = table_creator.create_table()._table
+        permissions_models.TablePermission.objects.create(table=self.table, user=self.user)
+        permissions_models.TableSiteIdAccess.objects.create(table=self.table, user=self.user, is_active=True)
+
+    def enroll(self, column_value, days_ago):
+        dao = daos.TableReservationDAO(self.table, self.user)
+        row = dao.reserve_next_available_row({'column_name': column_value})
+        dao.complete_my_reservation(row.pk)
+        enrolled_datetime = timezone.now() - timedelta(days=days_ago)
+        models.Row.objects.filter(pk=row.pk).update(reservation_datetime=enrolled_datetime,
+                                                    processed_datetime=enrolled_datetime)
+
+    def rollups(self, period):
+        return [(rollup.reserved, rollup.completed)
+                for rollup in self.table.enrollmentrollup_set.filter(period=period)]
+
+    def test_refresh_rollups(self):
+        self.enroll(0, 2)
+        self.enroll(0, 2)
+        self.enroll(1, 1)
+        enrollment.refresh_rollups(self.table, settle_seconds=0)
+        self.assertEqual(self.rollups(models.EnrollmentRollup.DAY), [(2, 2), (1, 1)])
+        self.assertEqual(self.rollups(models.EnrollmentRollup.HOUR), [(2, 2), (1, 1)])
+        enrollment.refresh_rollups(self.table, settle_seconds=0)
+        self.assertEqual(self.rollups(models.EnrollmentRollup.DAY), [(2, 2), (1, 1)])
+        self.enroll(1, 0)
+        enrollment.refresh_rollups(self.table, settle_seconds=0)
+        self.assertEqual(sum(reserved for reserved, _ in self.rollups(models.EnrollmentRollup.DAY)), 4)
+
+    def test_project_days_remaining(self):
+        days_remaining, daily_rates = enrollment.project_days_remaining(
+            [10, 0, 6, 4], [3, 1, 0, 0], np.array([0, 0, 1, 1]), [2, 0])
+        self.assertEqual(daily_rates.tolist(), [1.5, 0.5, 0, 0])
+        self.assertEqual(days_remaining[:2].tolist(), [10 / 1.5, 0])
+        self.assertTrue(np.isinf(days_remaining[2:]).all())
+
+    def test_forecast(self):
+        for _ in range(2):
+            self.enroll(0, 1)
+        self.enroll(1, 1)
+        forecasts = enrollment.forecast_exhaustion(self.table)
+        self.assertEqual([forecast.remaining for forecast in forecasts], [1, 19])
+        self.assertEqual([forecast.exhaustion_datetime for forecast in forecasts], [None, None])
+        enrollment.refresh_rollups(self.table, settle_seconds=0)
+        forecasts = enrollment.forecast_exhaustion(self.table)
+        site_rate = sum(forecast.daily_rate for forecast in forecasts)
+        self.assertTrue(1.5 < site_rate <= 3)
+        self.assertAlmostEqual(forecasts[0].daily_rate, site_rate * 2 / 3)
+        self.assertAlmostEqual(forecasts[1].days_remaining, 19 / (site_rate / 3))
+        self.assertEqual(enrollment.sites_needing_top_up(forecasts), [None])
+        self.assertEqual(enrollment.sites_needing_top_up(forecasts[1:], top_up_days=7), [])
+
+    def test_forecast_html(self):
+        with self.assertRaises(PermissionError):
+            daos.EnrollmentForecastDAO(self.table, self.user)
+        self.enroll(0, 1)
+        html = model_html.EnrollmentForecastHtml(daos.EnrollmentForecastDAO(self.table, self.staff)).as_html_table()
+        self.assertIn('<th>Projected Exhaustion</th>', html)
+        self.assertIn('<td>a</td><td>2</td>', html)
+        self.assertIn('<td>No recent enrollment</td><td></td>', html)
@@ -0,0 +1,137 @@
+import gzip
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.utils import timezone
+from . import import_jobs
+from . import models
+from . import staged_files
+
+
+def csv_upload(lines):
+    return SimpleUploadedFile('table.csv', ('\n'.join(lines) + '\n').encode('utf-8'))
+
+
+class ImportJobTestCase(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create(username='test_staff', is_staff=True)
+        self.lines = ['randomization_arm,processed,sex,site'] + \
+                     [f'{1 + i % 2},{int(i == 0)},{"fm"[i // 2 % 2]},{"ab"[i // 4]}' for i in range(8)]
+
+    def create_job(self, lines, **kwargs):
+        return import_jobs.create_import_job(self.staff, csv_upload(lines), **kwargs)
+
+    def test_create_table(self):
+        job = self.create_job(self.lines, table_name='imported', site_id_field='site')
+        self.assertEqual(b''.join(staged_files.data_iter(job.staged_file)),
+                         ('\n'.join(self.lines) + '\n').encode('utf-8'))
+        self.assertEqual(import_jobs.claim_next_job(), job)
+        self.assertIsNone(import_jobs.claim_next_job())
+        job = import_jobs.run_import_job(job, workers=1)
+        self.assertEqual(job.status, models.ImportJob.SUCCEEDED)
+        self.assertIsNone(job.staged_file)
+        self.assertFalse(models.StagedFile.objects.exists())
+        self.assertEqual((job.rows_parsed, job.rows_validated, job.rows_inserted), (8, 8, 8))
+        table = job.table
+        self.assertEqual(table.name, 'imported')
+        self.assertEqual(table.site_id_column.potential_values, 'a,b')
+        self.assertEqual([(row.site_id, row.key, row.randomization_arm, row.processed)
+                          for row in table.row_set.order_by('pk')][:3], [(0, 0, 1, True), (0, 0, 2, False),
+                                                                         (0, 1, 1, False)])
+        self.assertEqual(table.activationcode_set.count(), 2)
+        self.assertEqual(sum(arm_count.completed for arm_count in table.armcount_set.all()), 1)
+
+    def test_job_of_dead_worker_is_requeued_then_failed(self):
+        job = self.create_job(self.lines, table_name='interrupted', site_id_field='site')
+        self.assertEqual(import_jobs.claim_next_job(), job)
+        import_jobs.ImportProgress(job).flush()
+        self.assertEqual(import_jobs.recover_stale_jobs(), 0)
+        self.assertIsNone(import_jobs.claim_next_job())
+        stale = timezone.now() - import_jobs.JOB_LEASE - timedelta(seconds=1)
+        models.ImportJob.objects.filter(pk=job.pk).update(heartbeat_datetime=stale)
+        job = import_jobs.claim_next_job()
+        self.assertEqual((job.status, job.attempts), (models.ImportJob.RUNNING, 2))
+        models.ImportJob.objects.filter(pk=job.pk).update(heartbeat_datetime=stale)
+        self.assertIsNone(import_jobs.claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), (models.ImportJob.FAILED, import_jobs.INTERRUPTED_ERROR))
+        self.assertIsNone(job.staged_file)
+        self.assertFalse(models.StagedFile.objects.exists())
+        self.assertFalse(models.StagedFileChunk.objects.exists())
+
+    def test_process_pool_and_append(self):
+        job = import_jobs.run_import_job(self.create_job(self.lines, table_name='pooled', site_id_field='site'),
+                                         workers=2)
+        self.assertEqual(job.status, models.ImportJob.SUCCEEDED)
+        lines = [self.lines[0]] + [line[:-1] + 'c' for line in self.lines[1:5]]
+        append_job = import_jobs.run_import_job(self.create_job(lines, table=job.table), workers=2)
+        self.assertEqual(append_job.status, models.ImportJob.SUCCEEDED)
+        self.assertEqual(append_job.table.site_id_column.potential_values, 'a,b,c')
+        self.assertEqual(append_job.table.row_set.filter(site_id=2).count(), 4)
+
+    def test_compressed_upload(self):
+        upload = SimpleUploadedFile('table.csv.gz', gzip.compress(('\n'.join(self.lines) + '\n').encode('utf-8')))
+        job = import_jobs.create_import_job(self.staff, upload, table_name='compressed', site_id_field='site')
+        self.assertEqual(next(staged_files.data_iter(job.staged_file))[:2], b'\x1f\x8b')
+        job = import_jobs.run_import_job(job, workers=2)
+        self.assertEqual(job.status, models.ImportJob.SUCCEEDED)
+        self.assertEqual(job.rows_inserted, 8)
+        self.assertEqual(job.table.site_id_column.potential_values, 'a,b')
+
+    def test_failed_import_is_rolled_back(self):
+        job = import_jobs.run_import_job(self.create_job(self.lines[:4] + ['3,0,f,a'], table_name='failed'),
+                                         workers=1)
+        self.assertEqual(job.status, models.ImportJob.FAILED)
+        self.assertIn('Line 5', job.error)
+        job = import_jobs.run_import_job(self.create_job(self.lines[:6], table_name='failed',
+                                                         site_id_field='site'), workers=1)
+        self.assertEqual(job.error, "File read error: 'All sites must have the same number of rows'")
+        self.assertFalse(models.Table.objects.filter(name='failed').exists())
+
+    def test_progress_views(self):
+        self.client.force_login(self.staff)
+        response = self.client.post('/import/', {'name': 'uploaded', 'site_id_field': 'site',
+                                                 'csv': csv_upload(self.lines)})
+        job = models.ImportJob.objects.get()
+        self.assertEqual(response['Location'], f'/import/{job.pk}/')
+        self.assertEqual(self.client.get(f'/import/{job.pk}/progress/').json()['status'], models.ImportJob.PENDING)
+        import_jobs.run_import_job(import_jobs.claim_next_job(), workers=1)
+        progress = self.client.get(f'/import/{job.pk}/progress/').json()
+        self.assertEqual(progress['rows_inserted'], 8)
+        self.assertEqual(progress['table_url'], f'/{models.Table.objects.get().pk}-uploaded/')
+        self.assertContains(self.client.get(f'/import/{job.pk}/'), 'Go to the table')
+        other_staff = User.objects.create(username='other_staff', is_staff=True)
+        self.client.force_login(other_staff)
+        self.assertEqual(self.client.get(f'/import/{job.pk}/progress/').status_code, 404)
+
+    def test_uploads_are_staged_in_chunks(self):
+        with mock.patch.object(staged_files, 'CHUNK_BYTES', 16):
+            job = self.create_job(self.lines, table_name='chunked', site_id_field='site')
+        self.assertEqual(job.staged_file.stagedfilechunk_set.count(), job.staged_file.size // 16 + 1)
+        self.assertEqual(import_jobs.run_import_job(job, workers=1).rows_inserted, 8)
+
+    def test_header_is_checked_on_upload(self):
+        self.client.force_login(self.staff)
+        for lines, site_id_field, error in (
+                (self.lines, 'center', 'Site id field `center` not found in header'),
+                ([line.partition(',')[2] for line in self.lines], 'site', 'Column `randomization_arm` is missing.'),
+                (['randomization_arm,a<b'], '', 'Invalid column name.')):
+            response = self.client.post('/import/', {'name': 'checked', 'site_id_field': site_id_field,
+                                                     'csv': csv_upload(lines)})
+            self.assertContains(response, error)
+        response = self.client.post('/import/', {'name': 'checked', 'csv': SimpleUploadedFile(
+            'table.csv.gz', b'\x1f\x8bnot gzip')})
+        self.assertContains(response, 'Could not read a CSV header')
+        self.assertFalse(models.ImportJob.objects.exists())
+        job = import_jobs.run_import_job(self.create_job(self.lines, table_name='appended', site_id_field='site'),
+                                         workers=1)
+        url = f'/{job.table.pk}-appended/add-site/'
+        response = self.client.post(url, {'csv': csv_upload(['randomization_arm,sex,center', '1,f,c'])})
+        self.assertContains(response, 'Site id field `site` not found in header')
+        response = self.client.post(url, {'csv': csv_upload(['randomization_arm,age,site', '1,f,c'])})
+        self.assertContains(response, 'Header does not match the columns of the table')
+        self.assertEqual(models.ImportJob.objects.count(), 1)
+        response = self.client.post(url, {'csv': csv_upload(['randomization_arm,sex,site', '1,f,c'])})
+        self.assertEqual(response.status_code, 302)
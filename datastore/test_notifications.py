@@ -0,0 +1,92 @@
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from . import daos
+from . import models
+from . import notifications
+from permissions import models as permissions_models
+
+
+class FailingSink:
+    def send(self, message):
+        raise ConnectionError('Sink is down')
+
+
+class SlowSink:
+    """
+    Lets the leases of the other claimed notifications expire, and another worker claim them, during each send.
+    """
+    def send(self, message):
+        models.Notification.objects.exclude(message=message).update(
+            next_attempt_datetime=timezone.now() - timedelta(seconds=1))
+        notifications.claim_batch(10)
+
+
+class NotificationTestCase(TestCase):
+    def setUp(self):
+        notifications.FakeSink.sent.clear()
+        self.staff = User.objects.create(username='test_staff', is_staff=True)
+        table_creation_dao = daos.create_table('notified', self.staff)
+        table_creation_dao.create_activation_codes()
+        self.activation_code = permissions_models.ActivationCode.objects.get()
+
+    def test_signup_enqueues_and_worker_sends(self):
+        response = self.client.post('/signup/', {'username': 'new_user', 'email': 'new@example.com',
+                                                 'password1': 'a-long-Passw0rd', 'password2': 'a-long-Passw0rd',
+                                                 'activation_code': self.activation_code.code})
+        self.assertEqual(response.status_code, 302)
+        notification = models.Notification.objects.get()
+        self.assertEqual((notification.sink, notification.status), ('fake', models.Notification.PENDING))
+        self.assertEqual(notifications.FakeSink.sent, [])
+        call_command('send_notifications', once=True)
+        self.assertEqual(len(notifications.FakeSink.sent), 1)
+        self.assertIn('`new_user` has requested access to table `notified`', notifications.FakeSink.sent[0])
+        self.assertIn('http://testserver/approve/', notifications.FakeSink.sent[0])
+        self.assertEqual(models.Notification.objects.get().status, models.Notification.SENT)
+        self.assertEqual(notifications.send_batch(), [])
+
+    @override_settings(NOTIFICATION_SINKS={'failing': 'datastore.test_notifications.FailingSink'})
+    def test_retries_with_backoff(self):
+        notifications.enqueue('hello')
+        notification, = notifications.send_batch()
+        self.assertEqual((notification.status, notification.attempts), (models.Notification.PENDING, 1))
+        self.assertEqual(notifications.send_batch(), [])
+        notification = models.Notification.objects.get()
+        self.assertEqual(notification.last_error, 'ConnectionError: Sink is down')
+        self.assertGreater(notification.next_attempt_datetime, timezone.now() + timedelta(seconds=25))
+        self.assertEqual(notifications.retry_delay(3), timedelta(seconds=120))
+        models.Notification.objects.update(attempts=notifications.MAX_ATTEMPTS - 1,
+                                           next_attempt_datetime=timezone.now())
+        notification, = notifications.send_batch()
+        self.assertEqual(notification.status, models.Notification.FAILED)
+
+    def test_expired_claims_are_retried(self):
+        notifications.enqueue('hello')
+        notification, = notifications.claim_batch(10)
+        self.assertEqual(notifications.claim_batch(10), [])
+        models.Notification.objects.update(next_attempt_datetime=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(len(notifications.send_batch()), 1)
+        self.assertEqual(notifications.FakeSink.sent, ['hello'])
+
+    @override_settings(NOTIFICATION_SINKS={'slow': 'datastore.test_notifications.SlowSink'})
+    def test_claims_are_renewed_per_notification(self):
+        notifications.enqueue('first')
+        notifications.enqueue('second')
+        notification, = notifications.send_batch(10)
+        self.assertEqual((notification.message, notification.status), ('first', models.Notification.SENT))
+        second = models.Notification.objects.get(message='second')
+        self.assertEqual((second.status, second.attempts), (models.Notification.SENDING, 0))
+        self.assertNotEqual(second.claim, notification.claim)
+        self.assertTrue(notifications.renew_claim(second))
+        self.assertGreater(models.Notification.objects.get(pk=second.pk).next_attempt_datetime,
+                           timezone.now() + notifications.CLAIM_LEASE - timedelta(seconds=5))
+
+    @override_settings(NOTIFICATION_WEBHOOK_URL='https://hooks.example.com/randomizer')
+    def test_webhook_sink(self):
+        with mock.patch('requests.post') as post:
+            notifications.WebhookSink().send('hello')
+        post.assert_called_once_with('https://hooks.example.com/randomizer', json={'text': 'hello'},
+                                     timeout=notifications.WEBHOOK_TIMEOUT_SECONDS)
@@ -0,0 +1,101 @@
+from unittest import mock, skipIf, skipUnless
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.transaction import atomic
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from . import daos
+from . import models
+from . import partitioning
+from . import table_creation
+from .test_daos import BasicTableMixin
+
+
+def generic_table_creator(name, owner):
+    rows = [{'randomization_arm': str(1 + i % 2), 'column_1': column_1} for column_1 in ('a', 'b') for i in range(2)]
+    return table_creation.GenericTableCreator(['randomization_arm', 'column_1'], rows, name, None, owner)
+
+
+class PartitioningTestCase(BasicTableMixin, TestCase):
+    @skipIf(connection.vendor == 'postgresql', 'Row partitioning is supported on PostgreSQL')
+    def test_partitioning_is_skipped_without_postgres(self):
+        self.assertFalse(partitioning.is_supported())
+        with self.assertNumQueries(0):
+            self.assertFalse(partitioning.is_partitioned())
+            self.assertFalse(partitioning.create_partition(self.table.pk))
+        with self.assertRaises(NotImplementedError):
+            partitioning.partition_row_table()
+        with self.assertRaises(CommandError):
+            call_command('partition_rows')
+
+    def test_partition_name(self):
+        self.assertEqual(partitioning.partition_name(12), 'datastore_row_p12')
+
+    def test_reservation_queries_filter_on_table(self):
+        table_reservation_dao = daos.TableReservationDAO(self.table, self.user)
+        with CaptureQueriesContext(connection) as context:
+            with atomic():
+                row = table_reservation_dao.reserve_next_available_row({'column_1': 1, 'column_2': 2})
+            with atomic():
+                table_reservation_dao.complete_my_reservation(row.pk)
+        row_queries = [query['sql'] for query in context.captured_queries
+                       if 'FROM "datastore_row"' in query['sql'] or 'UPDATE "datastore_row"' in query['sql']]
+        self.assertTrue(row_queries)
+        for sql in row_queries:
+            self.assertIn(f'"datastore_row"."table_id" = {self.table.pk}', sql)
+        row.refresh_from_db()
+        self.assertEqual(row.reservation, self.user)
+        self.assertTrue(row.processed)
+
+    def test_table_is_created_in_partition_made_beforehand(self):
+        next_pk = models.Table.objects.order_by('pk').last().pk + 10
+        with mock.patch.object(partitioning, 'create_partition_for_new_table', return_value=next_pk), \
+                mock.patch.object(partitioning, 'drop_partition') as drop_partition:
+            table = generic_table_creator('partitioned', self.staff).create_table()._table
+            self.assertEqual((table.pk, table.row_set.count()), (next_pk, 4))
+            drop_partition.assert_not_called()
+            with self.assertRaises(PermissionError):
+                generic_table_creator('not_created', self.user).create_table()
+            drop_partition.assert_called_once_with(next_pk)
+        self.assertFalse(models.Table.objects.filter(name='not_created').exists())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Row partitioning requires PostgreSQL')
+class PostgresPartitioningTestCase(BasicTableMixin, TestCase):
+    def row_counts(self, partition):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT table_id, count(*) FROM {connection.ops.quote_name(partition)} GROUP BY table_id')
+            return dict(cursor.fetchall())
+
+    def test_partition_row_table(self):
+        self.assertTrue(partitioning.partition_row_table())
+        self.assertTrue(partitioning.is_partitioned())
+        self.assertFalse(partitioning.partition_row_table())
+        self.assertEqual(partitioning.partition_names(),
+                         {partitioning.DEFAULT_PARTITION, partitioning.partition_name(self.table.pk)})
+        self.assertEqual(self.row_counts(partitioning.partition_name(self.table.pk)), {self.table.pk: 4})
+        self.assertEqual(self.row_counts(partitioning.DEFAULT_PARTITION), {})
+        row = daos.TableReservationDAO(self.table, self.user).reserve_next_available_row({'column_1': 1,
+                                                                                          'column_2': 2})
+        self.assertEqual(models.Row.objects.get(pk=row.pk).reservation, self.user)
+
+    def test_create_and_drop_partition(self):
+        partitioning.partition_row_table()
+        self.assertIsNone(partitioning.create_partition_for_new_table())
+        table = generic_table_creator('partitioned', self.staff).create_table()._table
+        self.assertIn(partitioning.partition_name(table.pk), partitioning.partition_names())
+        self.assertEqual(self.row_counts(partitioning.partition_name(table.pk)), {table.pk: 4})
+        self.assertFalse(partitioning.create_partition(table.pk))
+
+        unpartitioned_table = models.Table.objects.create(name='unpartitioned')
+        models.Row.objects.create(table=unpartitioned_table, key=0, randomization_arm=1)
+        self.assertEqual(self.row_counts(partitioning.DEFAULT_PARTITION), {unpartitioned_table.pk: 1})
+        self.assertEqual(partitioning.create_missing_partitions(), [unpartitioned_table.pk])
+        self.assertEqual(self.row_counts(partitioning.DEFAULT_PARTITION), {})
+        self.assertEqual(self.row_counts(partitioning.partition_name(unpartitioned_table.pk)),
+                         {unpartitioned_table.pk: 1})
+
+        self.assertTrue(partitioning.drop_partition(table.pk))
+        self.assertFalse(partitioning.drop_partition(table.pk))
+        self.assertNotIn(partitioning.partition_name(table.pk), partitioning.partition_names())
@@ -0,0 +1,69 @@
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from . import models
+from . import provisioning
+
+
+class ProvisioningTestCase(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create(username='test_staff', is_staff=True)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        lines = ['randomization_arm,processed,sex,site'] + \
+                [f'{1 + i % 2},0,{"fm"[i // 2 % 2]},{"ab"[i // 4]}' for i in range(8)]
+        self.data = ('\n'.join(lines) + '\n').encode('utf-8')
+
+    def write_file(self, name, data):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'wb') as output_file:
+            output_file.write(data)
+        return path
+
+    def test_directory(self):
+        self.write_file('alpha.csv', self.data)
+        self.write_file('beta.csv.gz', gzip.compress(self.data))
+        self.write_file('notes.txt', b'not a study')
+        specs = provisioning.load_specs(self.directory.name, 'site')
+        self.assertEqual([spec.name for spec in specs], ['alpha', 'beta'])
+        reports = list(provisioning.provision_studies(specs, self.staff, workers=1))
+        self.assertEqual([(report.name, report.rows, report.error) for report in reports],
+                         [('alpha', 8, None), ('beta', 8, None)])
+        self.assertEqual([site for site, _ in reports[1].activation_codes], ['a', 'b'])
+        self.assertEqual(models.Table.objects.get(name='beta').activationcode_set.count(), 2)
+
+    def test_manifest_command_reports_failures(self):
+        self.write_file('alpha.csv', self.data)
+        self.write_file('broken.csv', self.data.replace(b'\n2,', b'\n3,', 1))
+        manifest = [{'name': 'alpha', 'csv': 'alpha.csv', 'site_id_field': 'site'},
+                    {'name': 'broken', 'csv': 'broken.csv'},
+                    {'name': 'generated', 'generate': {'columns': {'sex': ['f', 'm']}, 'rows_per_stratum': 4,
+                                                       'block_sizes': [2], 'site_id_field': 'site',
+                                                       'sites': ['a', 'b', 'c'], 'seed': 7}}]
+        manifest_path = self.write_file('manifest.json', json.dumps(manifest).encode('utf-8'))
+        report_path = os.path.join(self.directory.name, 'report.csv')
+        with self.assertRaisesMessage(CommandError, '1 of 3 studies failed: broken'):
+            call_command('provision_studies', manifest_path, owner='test_staff', workers=1, report=report_path,
+                         stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertFalse(models.Table.objects.filter(name='broken').exists())
+        self.assertEqual(models.Table.objects.get(name='generated').row_set.count(), 24)
+        with open(report_path, newline='') as report_file:
+            rows = list(csv.DictReader(report_file))
+        self.assertEqual([(row['study'], row['site']) for row in rows],
+                         [('alpha', 'a'), ('alpha', 'b'), ('broken', ''), ('generated', 'a'), ('generated', 'b'),
+                          ('generated', 'c')])
+        self.assertEqual(rows[3]['seed'], '7')
+        self.assertIn('Line 3', rows[2]['error'])
+
+    def test_duplicate_names(self):
+        manifest_path = self.write_file('manifest.json', json.dumps([{'name': 'a', 'csv': 'a.csv'},
+                                                                     {'name': 'a', 'csv': 'b.csv'}]).encode())
+        with self.assertRaisesMessage(ValueError, 'Duplicate study names: a'):
+            provisioning.load_specs(manifest_path)
@@ -0,0 +1,87 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from . import daos
+from . import models
+from . import purge
+from . import table_creation
+from permissions import models as permissions_models
+
+
+class PurgeTableTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_not_staff')
+        self.staff = User.objects.create(username='test_staff', is_staff=True, is_superuser=True)
+        self.table = self.create_table('purge_test')
+        self.other_table = self.create_table('kept')
+        self.import_job = models.ImportJob.objects.create(kind=models.ImportJob.APPEND, owner=self.staff,
+                                                          table=self.table)
+
+    def create_table(self, name):
+        header = ['randomization_arm', 'column_1', 'site']
+        rows = [{'randomization_arm': str(1 + i % 2), 'column_1': column_1, 'site': site}
+                for site in ('x', 'y') for column_1 in ('a', 'b', 'c') for i in range(4)]
+        table = table_creation.GenericTableCreator(header, rows, name, 'site', self.staff).create_table()._table
+        permissions_models.TablePermission.objects.create(table=table, user=self.user)
+        permissions_models.TableSiteIdAccess.objects.create(table=table, user=self.user, site_id=1, is_active=True)
+        row = daos.TableReservationDAO(table, self.user).reserve_next_available_row({'column_1': 2})
+        daos.TableReservationDAO(table, self.user).complete_my_reservation(row.pk)
+        return table
+
+    def related_counts(self, table):
+        return {field.model: field.model._base_manager.filter(**{field.name: table.pk}).count()
+                for field in purge.related_fields()}
+
+    def test_purge_table(self):
+        kept_counts = self.related_counts(self.other_table)
+        progress = []
+        with CaptureQueriesContext(connection) as context:
+            purged = purge.purge_table(self.table, 5, lambda model, count: progress.append((model, count)))
+        self.assertFalse(models.Table.objects.filter(pk=self.table.pk).exists())
+        self.assertEqual(set(self.related_counts(self.table).values()), {0})
+        self.assertEqual(self.related_counts(self.other_table), kept_counts)
+        self.import_job.refresh_from_db()
+        self.assertIsNone(self.import_job.table)
+        self.assertEqual(purged[models.Row], 24)
+        self.assertEqual(purged[models.ImportJob], 1)
+        self.assertEqual([count for model, count in progress if model is models.Row], [5, 10, 15, 20, 24])
+        row_deletes = [query['sql'] for query in context.captured_queries
+                       if query['sql'].startswith('DELETE FROM "datastore_row"')]
+        self.assertEqual(len([sql for sql in row_deletes if '"datastore_row"."id" IN' in sql]), 5)
+
+    def test_admin_delete_purges_table(self):
+        self.client.force_login(self.staff)
+        url = f'/admin/datastore/table/{self.table.pk}/delete/'
+        response = self.client.get(url)
+        self.assertContains(response, 'Rows: 24')
+        response = self.client.post(url, {'post': 'yes'})
+        self.assertRedirects(response, '/admin/datastore/table/')
+        self.assertTrue(models.Table.objects.get(pk=self.table.pk).is_hidden)
+        job = purge.claim_next_purge_job()
+        self.assertEqual((job.table_pk, job.table_name, job.requested_by), (self.table.pk, 'purge_test', self.staff))
+        job = purge.run_purge_job(job)
+        self.assertEqual(job.status, models.PurgeJob.SUCCEEDED)
+        self.assertFalse(models.Table.objects.filter(pk=self.table.pk).exists())
+        self.assertFalse(models.Row.objects.filter(table_id=self.table.pk).exists())
+        self.assertEqual(self.other_table.row_set.count(), 24)
+        self.assertContains(self.client.get('/admin/datastore/purgejob/'), 'purge_test')
+
+    def test_purge_job_progress_and_requeue(self):
+        purge.create_purge_job(self.table, self.staff)
+        job = purge.claim_next_purge_job()
+        self.assertEqual(job.status, models.PurgeJob.RUNNING)
+        self.assertIsNone(purge.claim_next_purge_job())
+        models.PurgeJob.objects.filter(pk=job.pk).update(heartbeat_datetime=timezone.now() - purge.JOB_LEASE * 2)
+        job = purge.claim_next_purge_job()
+        self.assertEqual(job.status, models.PurgeJob.RUNNING)
+        with CaptureQueriesContext(connection) as context:
+            job = purge.run_purge_job(job, 5)
+        self.assertEqual(job.status, models.PurgeJob.SUCCEEDED)
+        progress_updates = [query['sql'] for query in context.captured_queries
+                            if query['sql'].startswith('UPDATE "datastore_purgejob" SET "objects_purged"')]
+        self.assertGreaterEqual(len(progress_updates), 5)
+        self.assertGreater(job.objects_purged, 24)
+        self.assertEqual(models.PurgeJob.objects.get(pk=job.pk).objects_purged, job.objects_purged)
+        self.assertFalse(models.Table.objects.filter(pk=self.table.pk).exists())
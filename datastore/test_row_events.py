@@ -0,0 +1,92 @@
+import asyncio
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TransactionTestCase
+from django.utils import timezone
+from . import daos
+from . import event_stream
+from . import models
+from . import row_events
+from permissions import models as permissions_models
+
+
+class RowEventBrokerTestCase(SimpleTestCase):
+    def test_publish_and_subscribe(self):
+        async def run():
+            broker = row_events.RowEventBroker()
+            subscription = broker.subscribe(1)
+            other_subscription = broker.subscribe(2)
+            self.assertTrue(broker.has_subscribers(1))
+            broker.publish(1, {'row': 10, 'state': row_events.RESERVED})
+            broker.publish(1, {'row': 10, 'state': row_events.CANCELLED})
+            self.assertEqual(await subscription.get(), {'row': 10, 'state': row_events.RESERVED})
+            self.assertEqual(await subscription.get(), {'row': 10, 'state': row_events.CANCELLED})
+            self.assertTrue(other_subscription._queue.empty())
+            subscription.close()
+            other_subscription.close()
+            self.assertFalse(broker.has_subscribers(1))
+        asyncio.run(run())
+
+    def test_overflow_requests_reload(self):
+        async def run():
+            broker = row_events.RowEventBroker(max_queued_events=2)
+            subscription = broker.subscribe(1)
+            for row_pk in range(3):
+                broker.publish(1, {'row': row_pk, 'state': row_events.RESERVED})
+            await asyncio.sleep(0)
+            self.assertEqual(await subscription.get(), {'state': row_events.RELOAD})
+            subscription.close()
+        asyncio.run(run())
+
+    def test_format_server_sent_event(self):
+        self.assertEqual(row_events.format_server_sent_event('row', {'row': 1}), b'event: row\ndata: {"row": 1}\n\n')
+
+
+class RowEventPublishingTestCase(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_not_staff')
+        self.staff = User.objects.create(username='test_staff', is_staff=True)
+        table_creation_dao = daos.create_table('dao_test', self.staff)
+        self.table = table_creation_dao._table
+        table_creation_dao.create_column('column_1', ['a', 'b'])
+        table_creation_dao.create_row({'column_1': 'b', 'randomization_arm': '1'}, {'column_1': {'b': 1}})
+        table_creation_dao.create_row({'column_1': 'b', 'randomization_arm': '2'}, {'column_1': {'b': 1}})
+        permissions_models.TablePermission.objects.create(table=self.table, user=self.user)
+        permissions_models.TableSiteIdAccess.objects.create(table=self.table, user=self.user, is_active=True)
+
+    def test_tail_reads_each_change_once(self):
+        cursor = row_events.latest_change_pk()
+        tail = row_events.RowChangeTail(cursor)
+        row = daos.TableReservationDAO(self.table, self.user).reserve_next_available_row({'column_1': 1})
+        self.assertEqual(tail.read({self.table.pk + 1}), [])
+        self.assertEqual(tail.read({self.table.pk}), [(self.table.pk, {'row': row.pk, 'state': row_events.RESERVED})])
+        self.assertEqual(tail.read({self.table.pk}), [])
+        daos.TableReservationDAO(self.table, self.user).cancel_my_reservation(row.pk)
+        self.assertEqual(tail.read({self.table.pk}), [(self.table.pk, {'row': row.pk, 'state': row_events.CANCELLED})])
+        self.assertEqual(tail.cursor, cursor)
+        models.RowChange._base_manager.update(changed_datetime=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(tail.read({self.table.pk}), [])
+        self.assertEqual(tail.cursor, row_events.latest_change_pk())
+
+    def test_transitions_publish_rendered_events(self):
+        application = event_stream.TableEventStreamApplication(None)
+        application.poll_seconds = 0.01
+        loop = asyncio.new_event_loop()
+        subscription = row_events.broker.subscribe(self.table.pk, loop)
+
+        async def start_tailing(cursor):
+            application.ensure_tailing(cursor)
+        loop.run_until_complete(start_tailing(row_events.latest_change_pk()))
+        table_reservation_dao = daos.TableReservationDAO(self.table, self.user)
+        row = table_reservation_dao.reserve_next_available_row({'column_1': 1})
+        owner_dao = daos.TableReservationDAO(self.table, self.staff)
+        reserved_event = loop.run_until_complete(asyncio.wait_for(subscription.get(), 5))
+        reserved_event = event_stream.TableEventStreamApplication.render_event(owner_dao, reserved_event)
+        self.assertEqual(reserved_event['state'], row_events.RESERVED)
+        self.assertIn(f'name="row_{row.pk}"', reserved_event['html'])
+        daos.TableReservationDAO(self.table, self.user).complete_my_reservation(row.pk)
+        self.assertEqual(loop.run_until_complete(asyncio.wait_for(subscription.get(), 5)),
+                         {'row': row.pk, 'state': row_events.COMPLETED})
+        subscription.close()
+        loop.run_until_complete(application.tail_task)
+        loop.close()
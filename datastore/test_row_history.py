@@ -0,0 +1,90 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+from . import daos
+from . import models
+from . import row_history
+from . import table_creation
+from permissions import models as permissions_models
+
+
+class RowHistoryTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_not_staff')
+        self.staff = User.objects.create(username='test_staff', is_staff=True)
+        header = ['randomization_arm', 'processed', 'column_name']
+        rows = [{'randomization_arm': '1', 'processed': '1', 'column_name': 'a'}] + \
+               [{'randomization_arm': '2', 'processed': '0', 'column_name': 'b'} for _ in range(4)]
+        table_creator = table_creation.GenericTableCreator(header, rows, 'history_test', None, self.staff)
+        self.table = table_creator.create_table()._table
+        permissions_models.TablePermission.objects.create(table=self.table, user=self.user)
+        permissions_models.TableSiteIdAccess.objects.create(table=self.table, user=self.user, is_active=True)
+        self.imported_row = self.table.row_set.get(processed=True)
+        self.times = [timezone.now()]
+        self.row_a = self.reserve()
+        self.times.append(timezone.now())
+        daos.TableReservationDAO(self.table, self.user).complete_my_reservation(self.row_a.pk)
+        self.times.append(timezone.now())
+        row_b = self.reserve()
+        daos.TableReservationDAO(self.table, self.user).cancel_my_reservation(row_b.pk)
+        self.times.append(timezone.now())
+        self.row_c = self.reserve()
+        self.times.append(timezone.now())
+
+    def reserve(self):
+        return daos.TableReservationDAO(self.table, self.user).reserve_next_available_row({'column_name': 1})
+
+    def assert_history(self):
+        self.assertEqual(set(row_history.table_state_as_of(self.table, self.times[0])), {self.imported_row.pk})
+        state = row_history.table_state_as_of(self.table, self.times[1])
+        self.assertEqual(set(state), {self.imported_row.pk, self.row_a.pk})
+        self.assertEqual(state[self.row_a.pk].reservation_id, self.user.pk)
+        self.assertEqual(state[self.row_a.pk].patient_id, 1001)
+        self.assertFalse(state[self.row_a.pk].processed)
+        state = row_history.table_state_as_of(self.table, self.times[2])
+        self.assertTrue(state[self.row_a.pk].processed)
+        self.assertEqual(set(row_history.table_state_as_of(self.table, self.times[3])),
+                         {self.imported_row.pk, self.row_a.pk})
+        state = row_history.table_state_as_of(self.table, self.times[4])
+        self.assertEqual(set(state), {self.imported_row.pk, self.row_a.pk, self.row_c.pk})
+        self.assertEqual(state[self.row_c.pk].patient_id, 1002)
+
+    def test_history_without_snapshot(self):
+        self.assert_history()
+
+    def test_history_with_snapshots(self):
+        self.assertIsNone(row_history.create_snapshot(self.table))
+        snapshot = row_history.create_snapshot(self.table, settle_seconds=0)
+        self.assertEqual(snapshot.sequence, self.table.rowchange_set.order_by('pk').last().pk)
+        self.assertEqual(snapshot.row_count, 2)
+        self.assertEqual(row_history.create_snapshot(self.table, settle_seconds=0), snapshot)
+        self.assertIsNone(row_history.latest_snapshot(self.table, self.times[3]))
+        self.assertEqual(row_history.latest_snapshot(self.table, self.times[4]), snapshot)
+        self.assert_history()
+        daos.TableReservationDAO(self.table, self.user).cancel_my_reservation(self.row_c.pk)
+        compacted_snapshot = row_history.create_snapshot(self.table, settle_seconds=0)
+        self.assertEqual(compacted_snapshot.row_count, 1)
+        self.assertEqual(set(row_history.decode_state(compacted_snapshot.state)), {self.row_a.pk})
+        self.assert_history()
+        self.assertEqual(set(row_history.table_state_as_of(self.table, timezone.now())),
+                         {self.imported_row.pk, self.row_a.pk})
+
+    def test_changes_are_append_only(self):
+        change = models.RowChange.objects.filter(table=self.table).first()
+        change.patient_id = 1
+        with self.assertRaises(PermissionError):
+            change.save()
+        with self.assertRaises(PermissionError):
+            models.RowChange.objects.filter(table=self.table).update(patient_id=1)
+        with self.assertRaises(PermissionError):
+            models.RowChange.objects.filter(table=self.table).delete()
+        self.table.row_set.filter(pk=self.row_a.pk).delete()
+        self.assert_history()
+
+    def test_historical_export(self):
+        table_export_dao = daos.TableExportDAO(self.table, self.staff)
+        records = list(table_export_dao.export_records_iter(table_export_dao.export_row_values_iter(self.times[1])))
+        reserved_records = [record for record in records if record[5]]
+        self.assertEqual(len(reserved_records), 1)
+        self.assertEqual(reserved_records[0][:2], [self.row_a.pk, 1001])
+        self.assertEqual(reserved_records[0][2:6], ['b', '2', 0, 'test_not_staff'])
@@ -0,0 +1,59 @@
+import numpy as np
+from django.contrib.auth.models import User
+from django.test import TestCase
+from . import daos
+from . import model_html
+from . import simulation
+from . import table_creation
+from permissions import models as permissions_models
+
+
+class SimulationTestCase(TestCase):
+    def test_build_strata(self):
+        strata = simulation.build_strata([0, 1, 0, 0], [1, 0, 1, 0], [1, 2, 1, 2], 2, 2)
+        self.assertEqual(strata.lengths.tolist(), [1, 2, 1, 0])
+        self.assertEqual(strata.starts.tolist(), [0, 1, 3, 4])
+        self.assertEqual(strata.running_differences.tolist(), [0, -1, 0, 1, 0])
+
+    def test_key_probabilities(self):
+        self.assertEqual(simulation.key_probabilities([2, 3]).tolist(), [1 / 6] * 6)
+        probabilities = simulation.key_probabilities([2, 2], [[3, 1], None])
+        self.assertEqual(probabilities.tolist(), [0.375, 0.125, 0.375, 0.125])
+
+    def test_run_simulation(self):
+        strata = simulation.build_strata([0] * 6 + [1] * 2, [0] * 8, [1, 1, 1, 2, 2, 2, 1, 2], 2, 1)
+        result = simulation.run_simulation(strata, np.ones(1), [0, 1], 1, 500, seed=1, batch_size=100)
+        self.assertEqual(result.replicates, 500)
+        self.assertEqual(result.exhaustion_probabilities[0], 0)
+        self.assertAlmostEqual(result.exhaustion_probabilities[1], 0.08, delta=0.04)
+        self.assertEqual(result.any_exhaustion_probability, result.exhaustion_probabilities[1])
+        self.assertEqual(result.total_imbalance_quantiles[0.99], 1)
+        repeated = simulation.run_simulation(strata, np.ones(1), [0, 1], 1, 500, seed=1, batch_size=100)
+        self.assertEqual(repeated.exhaustion_probabilities.tolist(), result.exhaustion_probabilities.tolist())
+        result = simulation.run_simulation(strata, np.ones(1), 100, 1, 20, seed=1, batch_size=10)
+        self.assertEqual(result.any_exhaustion_probability, 1)
+        self.assertEqual(result.stratum_imbalance_quantiles[0.5], 0)
+
+    def test_process_pool(self):
+        strata = simulation.build_strata([0, 0], [0, 0], [1, 2], 1, 1)
+        result = simulation.run_simulation(strata, np.ones(1), 1, 1, 40, seed=2, workers=2, batch_size=20)
+        self.assertEqual(result.replicates, 40)
+
+    def test_simulation_dao(self):
+        user = User.objects.create(username='test_not_staff')
+        staff = User.objects.create(username='test_staff', is_staff=True)
+        header = ['randomization_arm', 'processed', 'column_name']
+        rows = [{'randomization_arm': '1', 'processed': '0', 'column_name': 'a'},
+                {'randomization_arm': '2', 'processed': '1', 'column_name': 'a'},
+                {'randomization_arm': '2', 'processed': '0', 'column_name': 'b'}]
+        table = table_creation.GenericTableCreator(header, rows, 'simulation_test', None, staff).create_table()._table
+        permissions_models.TablePermission.objects.create(table=table, user=user)
+        permissions_models.TableSiteIdAccess.objects.create(table=table, user=user, is_active=True)
+        with self.assertRaises(PermissionError):
+            daos.SimulationDAO(table, user)
+        simulation_dao = daos.SimulationDAO(table, staff)
+        self.assertEqual(simulation_dao.simulation_strata().lengths.tolist(), [1, 1])
+        result = simulation_dao.simulate(10, 1, 10, seed=3, workers=1)
+        self.assertEqual(result.any_exhaustion_probability, 1)
+        self.assertEqual([stratum[1] for stratum in simulation_dao.stratum_iter(result)], [['a'], ['b']])
+        self.assertIn('<td>a</td><td>100.0%</td>', model_html.SimulationHtml(simulation_dao, result).as_html_table())
@@ -154,6 +154,63 @@ class TableImportTestCase(TestCase):
             table_creation.GenericTableCreator(header, rows, 'test4', None, self.user).create_table()
 
 
+class GeneratedTableTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test', is_staff=True)
+
+    def generate(self, table_name, seed):
+        columns = {'sex': ['female', 'male'], 'age': ['under 65', 'over 65']}
+        table_creator = table_creation.GeneratedTableCreator(columns, 10, [2, 4], table_name, self.user,
+                                                             site_id_field='site',
+                                                             site_values=['north', 'south', 'west'], seed=seed)
+        return table_creator.create_table()._table
+
+    def arm_sequence(self, table):
+        return [(row.site_id, row.key, row.randomization_arm) for row in table.row_set.order_by('pk')]
+
+    def test_generated_table(self):
+        table = self.generate('generated', 7)
+        self.assertEqual(table.site_id_column.potential_values, 'north,south,west')
+        self.assertEqual([column.name for column in table.column_set.all()], ['sex', 'age'])
+        self.assertEqual(table.row_set.count(), 3 * 4 * 10)
+        self.assertEqual(table.row_set.filter(processed=True).count(), 0)
+        self.assertEqual(table.activationcode_set.count(), 3)
+        for site_id in range(3):
+            for key in range(4):
+                arms = [row.randomization_arm for row in
+                        table.row_set.filter(site_id=site_id, key=key).order_by('pk')]
+                self.assertEqual(len(arms), 10)
+                self.assertLessEqual(abs(arms.count(1) - arms.count(2)), 2)
+        self.assertEqual(self.arm_sequence(self.generate('generated_again', 7)), self.arm_sequence(table))
+        self.assertNotEqual(self.arm_sequence(self.generate('generated_other', 8)), self.arm_sequence(table))
+
+    def test_generated_table_validation(self):
+        with self.assertRaises(ValueError):
+            table_creation.GeneratedTableCreator({'sex': ['female', 'male']}, 10, [3], 'bad_block', self.user)
+        with self.assertRaises(ValueError):
+            table_creation.GeneratedTableCreator({'sex': ['female', 'female']}, 10, [2], 'bad_values', self.user)
+        with self.assertRaises(ValueError):
+            table_creation.GeneratedTableCreator({'sex': ['female', 'male']}, 10, [2], 'bad_site', self.user,
+                                                 site_id_field='site')
+        table = table_creation.GeneratedTableCreator({'sex': ['female', 'male']}, 9, [3], 'ratio', self.user,
+                                                     allocation_ratio=(2, 1), seed=1).create_table()._table
+        self.assertEqual(table.row_set.filter(randomization_arm=1).count(), 12)
+        self.assertFalse(hasattr(table, 'site_id_column'))
+
+    def test_generate_view_rejects_invalid_column_names(self):
+        self.client.force_login(self.user)
+        data = {'name': 'bad_columns', 'rows_per_stratum': 4, 'block_sizes': '2', 'allocation_ratio': '1:1',
+                'seed': 1}
+        for columns, site_id_field in (('site: a, b', 'site'), ('a<b: x, y', ''), ('randomization_arm: x, y', ''),
+                                       ('processed: x, y', '')):
+            response = self.client.post('/generate/', dict(data, columns=columns, site_id_field=site_id_field,
+                                                           sites='north, south' if site_id_field else ''))
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, 'Invalid column name' if '<' in columns or 'processed' in columns
+                                else 'Duplicate column name')
+        self.assertFalse(models.Table.objects.filter(name='bad_columns').exists())
+
+
 class TableAppendImportTestCase(TestCase):
     def setUp(self):
         self.user = User.objects.create(username='test', is_staff=True)
@@ -0,0 +1,51 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from . import daos
+from . import table_creation
+from . import table_export
+from permissions import models as permissions_models
+
+
+class TableExportTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_not_staff')
+        self.staff = User.objects.create(username='test_staff', is_staff=True)
+        header = ['randomization_arm', 'processed', 'column_name', 'site']
+        rows = [{'randomization_arm': str(1 + i % 2), 'processed': '0', 'column_name': column_name, 'site': site}
+                for site in ('x', 'y') for column_name in ('low', 'high') for i in range(3)]
+        table_creator = table_creation.GenericTableCreator(header, rows, 'export_test', 'site', self.staff)
+        self.table = table_creator.create_table()._table
+        self.table.arm_1 = 'Placebo'
+        self.table.save()
+        permissions_models.TablePermission.objects.create(table=self.table, user=self.user)
+        permissions_models.TableSiteIdAccess.objects.create(table=self.table, user=self.user, site_id=1, is_active=True)
+        table_reservation_dao = daos.TableReservationDAO(self.table, self.user)
+        self.row = table_reservation_dao.reserve_next_available_row({'column_name': 0})
+
+    def test_export_permissions(self):
+        with self.assertRaises(PermissionError):
+            daos.TableExportDAO(self.table, self.user)
+
+    def test_export_records(self):
+        table_export_dao = daos.TableExportDAO(self.table, self.staff)
+        table_export_dao.chunk_size = 5
+        self.assertEqual(table_export_dao.export_header(),
+                         ['row_id', 'patient_id', 'site', 'column_name', 'randomization_arm', 'processed',
+                          'reserved_by', 'reservation_datetime', 'processed_datetime'])
+        records = list(table_export_dao.export_records_iter())
+        self.assertEqual(len(records), 12)
+        self.assertEqual([record[0] for record in records], sorted(record[0] for record in records))
+        self.assertEqual(records[0][1:7], ['', 'x', 'low', 'Placebo', 0, ''])
+        reserved_record = next(record for record in records if record[0] == self.row.pk)
+        self.assertEqual(reserved_record[1:7], [self.row.patient_id, 'y', 'high', 'Placebo', 0, 'test_not_staff'])
+        self.assertEqual(reserved_record[7], self.row.reservation_datetime.isoformat())
+
+    def test_export_lines(self):
+        header = ['row_id', 'site']
+        records = [[1, 'x'], [2, 'y,z']]
+        self.assertEqual(list(table_export.export_lines(table_export.CSV, header, records)),
+                         ['row_id,site\r\n', '1,x\r\n', '2,"y,z"\r\n'])
+        self.assertEqual(list(table_export.export_lines(table_export.NDJSON, header, records)),
+                         ['{"row_id": 1, "site": "x"}\n', '{"row_id": 2, "site": "y,z"}\n'])
+        with self.assertRaises(KeyError):
+            table_export.export_lines('xml', header, records)
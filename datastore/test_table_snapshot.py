@@ -0,0 +1,78 @@
+import io
+import numpy as np
+from django.contrib.auth.models import User
+from django.test import TestCase
+from . import daos
+from . import table_creation
+from . import table_snapshot
+from permissions import models as permissions_models
+
+
+class TableSnapshotTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_not_staff')
+        self.staff = User.objects.create(username='test_staff', is_staff=True)
+        header = ['randomization_arm', 'column_1', 'column_2', 'site']
+        rows = [{'randomization_arm': str(1 + i % 2), 'column_1': column_1, 'column_2': column_2, 'site': site}
+                for site in ('x', 'y') for column_1 in ('a', 'b', 'c') for column_2 in ('d', 'e') for i in range(2)]
+        table_creator = table_creation.GenericTableCreator(header, rows, 'snapshot_test', 'site', self.staff)
+        self.table = table_creator.create_table()._table
+        self.table.arm_2 = 'Drug'
+        self.table.save()
+        permissions_models.TablePermission.objects.create(table=self.table, user=self.user)
+        permissions_models.TableSiteIdAccess.objects.create(table=self.table, user=self.user, site_id=1, is_active=True)
+        table_reservation_dao = daos.TableReservationDAO(self.table, self.user)
+        self.row = table_reservation_dao.reserve_next_available_row({'column_1': 2, 'column_2': 1})
+        daos.TableReservationDAO(self.table, self.user).complete_my_reservation(self.row.pk)
+
+    def write_snapshot(self):
+        table_export_dao = daos.TableExportDAO(self.table, self.staff)
+        table_export_dao.chunk_size = 7
+        snapshot_file = io.BytesIO()
+        table_snapshot.write_table_snapshot(table_export_dao, snapshot_file)
+        snapshot_file.seek(0)
+        return snapshot_file
+
+    def test_snapshot_round_trip(self):
+        snapshot = table_snapshot.TableSnapshot.load(self.write_snapshot())
+        self.assertEqual(len(snapshot), 24)
+        self.assertEqual(snapshot.column_names(), ['column_1', 'column_2'])
+        self.assertEqual(snapshot.arrays['site_id'].dtype, np.int32)
+        frame = snapshot.labeled_frame()
+        self.assertEqual(list(frame), ['row_id', 'patient_id', 'site', 'column_1', 'column_2', 'randomization_arm',
+                                       'processed', 'reservation_id', 'reservation_datetime', 'processed_datetime'])
+        self.assertEqual(list(frame['site'][:12]), ['x'] * 12)
+        self.assertEqual(list(frame['column_1'][:4]), ['a', 'a', 'a', 'a'])
+        self.assertEqual(list(frame['column_2'][:4]), ['d', 'd', 'e', 'e'])
+        self.assertEqual(list(frame['randomization_arm'][:2]), ['1', 'Drug'])
+        index = int(np.flatnonzero(frame['row_id'] == self.row.pk)[0])
+        self.assertEqual((frame['site'][index], frame['column_1'][index], frame['column_2'][index]), ('y', 'c', 'e'))
+        self.assertEqual(frame['patient_id'][index], self.row.patient_id)
+        self.assertEqual(frame['reservation_id'][index], self.user.pk)
+        self.assertTrue(frame['processed'][index])
+        self.assertFalse(np.isnat(frame['processed_datetime'][index]))
+        self.assertEqual(int(frame['processed'].sum()), 1)
+        self.assertEqual(int((frame['patient_id'] == table_snapshot.MISSING).sum()), 23)
+        self.assertEqual(int(np.isnat(frame['reservation_datetime']).sum()), 23)
+
+    def test_load_selected_rows(self):
+        row_ids = {self.row.pk, self.table.row_set.order_by('pk').first().pk, 0}
+        snapshot = table_snapshot.TableSnapshot.load(self.write_snapshot(), row_ids)
+        self.assertEqual(sorted(snapshot.arrays['row_id'].tolist()), sorted(row_ids - {0}))
+        values = dict((row[0], row) for row in snapshot.row_values_iter())
+        self.assertEqual(values[self.row.pk][4:7], (self.row.patient_id, True, self.user.pk))
+        self.assertEqual(len(table_snapshot.TableSnapshot.load(self.write_snapshot(), set())), 0)
+
+    def test_rows_are_converted_in_chunks(self):
+        snapshot = table_snapshot.TableSnapshot.load(self.write_snapshot())
+        rows = list(snapshot.row_values_iter())
+        self.assertEqual(len(rows), 24)
+        self.assertEqual(list(snapshot.row_values_iter(chunk_size=5)), rows)
+        self.assertEqual(snapshot.reservation_ids(), [self.user.pk])
+
+    def test_snapshot_metadata(self):
+        metadata = daos.TableExportDAO(self.table, self.staff).snapshot_metadata()
+        self.assertEqual(metadata['columns'][0], {'name': 'column_1', 'number_of_options': 3,
+                                                  'potential_values': ['a', 'b', 'c']})
+        self.assertEqual(metadata['site_id_column'], {'name': 'site', 'potential_values': ['x', 'y']})
+        self.assertEqual(metadata['arm_names'], {1: '1', 2: 'Drug'})
@@ -0,0 +1,93 @@
+import hashlib
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+from . import import_jobs
+from . import models
+from . import staged_files
+from . import upload_sessions
+
+
+class UploadSessionTestCase(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create(username='test_staff', is_staff=True)
+        lines = ['randomization_arm,processed,sex,site'] + \
+                [f'{1 + i % 2},0,{"fm"[i // 2 % 2]},{"ab"[i // 4]}' for i in range(8)]
+        self.data = ('\n'.join(lines) + '\n').encode('utf-8')
+        self.client.force_login(self.staff)
+
+    def create_session(self, **kwargs):
+        data = {'name': 'resumed', 'site_id_field': 'site', 'size': len(self.data),
+                'sha256': hashlib.sha256(self.data).hexdigest()}
+        data.update(kwargs)
+        return self.client.post('/uploads/', data)
+
+    def put_chunk(self, url, start, end, data=None, sha256=None):
+        data = self.data[start:end] if data is None else data
+        return self.client.put(url, data, content_type='application/octet-stream',
+                               HTTP_CONTENT_RANGE=f'bytes {start}-{end - 1}/{len(self.data)}',
+                               HTTP_X_CONTENT_SHA256=sha256 or hashlib.sha256(data).hexdigest())
+
+    def test_resumed_upload_is_imported(self):
+        response = self.create_session()
+        self.assertEqual(response.status_code, 201)
+        url = response.json()['url']
+        self.assertEqual(self.put_chunk(url, 0, 40).json()['received_size'], 40)
+        response = self.put_chunk(url, 40, 80, data=b'x' * 40, sha256=hashlib.sha256(self.data[40:80]).hexdigest())
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['received_size'], 40)
+        response = self.put_chunk(url, 60, 80)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.client.get(url).json()['received_size'], 40)
+        self.assertEqual(self.put_chunk(url, 20, 80).json()['received_size'], 80)
+        progress = self.put_chunk(url, 80, len(self.data)).json()
+        self.assertEqual(progress['status'], models.UploadSession.COMPLETE)
+        job = models.ImportJob.objects.get()
+        self.assertEqual(progress['import_job_url'], f'/import/{job.pk}/')
+        job = import_jobs.run_import_job(job, workers=1)
+        self.assertEqual(job.status, models.ImportJob.SUCCEEDED)
+        self.assertEqual(job.table.name, 'resumed')
+        self.assertEqual(job.table.row_set.count(), 8)
+
+    def test_file_checksum_mismatch_fails_the_upload(self):
+        url = self.create_session(sha256='0' * 64).json()['url']
+        progress = self.put_chunk(url, 0, len(self.data)).json()
+        self.assertEqual((progress['status'], progress['error']),
+                         (models.UploadSession.FAILED, 'File checksum does not match'))
+        self.assertFalse(models.ImportJob.objects.exists())
+        self.assertEqual(self.put_chunk(url, 0, 10).status_code, 400)
+
+    def test_session_validation(self):
+        self.assertIn('name', self.create_session(name='').json()['errors'])
+        self.assertIn('table', self.create_session(table=999).json()['errors'])
+        other_staff = User.objects.create(username='other_staff', is_staff=True)
+        url = self.create_session().json()['url']
+        self.client.force_login(other_staff)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.put_chunk(url, 0, 10).status_code, 404)
+
+    def test_stale_sessions_expire(self):
+        session = upload_sessions.create_upload_session(self.staff, len(self.data))
+        self.assertEqual(upload_sessions.expire_stale_sessions(), 0)
+        models.UploadSession.objects.filter(pk=session.pk).update(
+            updated_datetime=timezone.now() - timedelta(days=2))
+        self.assertEqual(upload_sessions.expire_stale_sessions(), 1)
+        self.assertFalse(models.StagedFile.objects.filter(pk=session.staged_file_id).exists())
+
+    def test_chunks_are_staged_in_the_database(self):
+        url = self.create_session().json()['url']
+        self.put_chunk(url, 0, 40)
+        self.put_chunk(url, 20, 80)
+        session = models.UploadSession.objects.get()
+        self.assertEqual(b''.join(staged_files.data_iter(session.staged_file)), self.data[:80])
+
+    def test_lost_staged_file_fails_the_upload(self):
+        url = self.create_session().json()['url']
+        self.put_chunk(url, 0, 40)
+        models.StagedFile.objects.all().delete()
+        response = self.put_chunk(url, 40, 80)
+        self.assertEqual(response.status_code, 410)
+        self.assertEqual((response.json()['status'], response.json()['error']),
+                         (models.UploadSession.FAILED, upload_sessions.LOST_UPLOAD_ERROR))
+        self.assertEqual(self.put_chunk(url, 40, 80).status_code, 410)
@@ -0,0 +1,137 @@
+import hashlib
+import re
+from datetime import timedelta
+from django.db.transaction import atomic
+from django.urls import reverse
+from django.utils import timezone
+from . import import_jobs
+from . import models
+from . import staged_files
+
+# Resumable uploads of tables too large to send in one request, staged chunk by chunk in the database and handed
+# to an ImportJob once complete.
+
+MAX_CHUNK_BYTES = 64 * 1024 * 1024
+READ_BYTES = 64 * 1024
+STALE_SESSION_AGE = timedelta(days=1)
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+LOST_UPLOAD_ERROR = 'Upload was lost, please start a new upload'
+
+
+class UploadRangeError(ValueError):
+    pass
+
+
+class UploadLostError(ValueError):
+    pass
+
+
+def create_upload_session(owner, total_size, sha256='', table_name='', site_id_field='', table=None):
+    return models.UploadSession.objects.create(owner=owner, table=table, table_name=table_name,
+                                               site_id_field=site_id_field or '',
+                                               staged_file=models.StagedFile.objects.create(),
+                                               total_size=total_size, sha256=(sha256 or '').lower())
+
+
+def session_progress(session):
+    progress = {'url': reverse('upload_session', args=(session.pk,)), 'status': session.status,
+                'received_size': session.received_size, 'total_size': session.total_size,
+                'error': session.error, 'import_job_url': None}
+    if session.import_job_id:
+        progress['import_job_url'] = reverse('import_job', args=(session.import_job_id,))
+    return progress
+
+
+def parse_content_range(content_range):
+    match = CONTENT_RANGE.match(content_range or '')
+    if not match:
+        raise ValueError('Expected a Content-Range header of the form `bytes start-end/total`')
+    start, end, total = (int(group) for group in match.groups())
+    if end < start or end >= total:
+        raise ValueError(f'Invalid Content-Range `{content_range}`')
+    return start, end + 1, total
+
+
+def write_chunk(session_pk, owner, content_range, sha256, stream):
+    """
+    Writes one chunk read from stream and returns the updated session. Raises UploadRangeError if the chunk would
+    leave a gap after the bytes received so far, UploadLostError if its staged file is gone, which fails the
+    session, and ValueError if it is otherwise rejected. Bytes before received_size are only hashed, never
+    rewritten, so a retried chunk cannot corrupt data already accepted.
+    """
+    if models.UploadSession.objects.filter(pk=session_pk, owner=owner, staged_file__isnull=True,
+                                           status=models.UploadSession.UPLOADING).update(
+            status=models.UploadSession.FAILED, error=LOST_UPLOAD_ERROR):
+        raise UploadLostError(LOST_UPLOAD_ERROR)
+    with atomic():
+        session = models.UploadSession.objects.select_for_update().select_related('staged_file').get(
+            pk=session_pk, owner=owner)
+        if session.status != models.UploadSession.UPLOADING:
+            error = f'Upload is {session.get_status_display().lower()}'
+            raise UploadLostError(error) if session.error == LOST_UPLOAD_ERROR else ValueError(error)
+        start, end, total = parse_content_range(content_range)
+        if total != session.total_size:
+            raise ValueError(f'Expected a total size of {session.total_size}, got {total}')
+        if start > session.received_size:
+            raise UploadRangeError(f'Expected a chunk starting at or before byte {session.received_size}')
+        if end - start > MAX_CHUNK_BYTES:
+            raise ValueError(f'Chunks may be at most {MAX_CHUNK_BYTES} bytes')
+        digest = _write_range(session, start, end, stream)
+        if digest != (sha256 or '').lower():
+            raise ValueError('Chunk checksum does not match')
+        session.received_size = max(session.received_size, end)
+        session.updated_datetime = timezone.now()
+        if session.received_size == session.total_size:
+            _complete(session)
+        session.save()
+    return session
+
+
+def _write_range(session, start, end, stream):
+    chunk_hash = hashlib.sha256()
+    position = start
+    new_data = bytearray()
+    while position < end:
+        data = stream.read(min(READ_BYTES, end - position))
+        if not data:
+            raise ValueError(f'Chunk ended after {position - start} of {end - start} bytes')
+        chunk_hash.update(data)
+        new_data += data[max(session.received_size - position, 0):]
+        if len(new_data) >= staged_files.CHUNK_BYTES:
+            staged_files.append(session.staged_file, bytes(new_data))
+            new_data.clear()
+        position += len(data)
+    if new_data:
+        staged_files.append(session.staged_file, bytes(new_data))
+    return chunk_hash.hexdigest()
+
+
+def _complete(session):
+    if session.sha256 and _file_sha256(session.staged_file) != session.sha256:
+        session.status = models.UploadSession.FAILED
+        session.error = 'File checksum does not match'
+        session.staged_file.delete()
+        session.staged_file = None
+        return
+    session.import_job = import_jobs.create_staged_import_job(session.owner, session.staged_file,
+                                                              session.table_name, session.site_id_field,
+                                                              session.table)
+    session.status = models.UploadSession.COMPLETE
+
+
+def _file_sha256(staged_file):
+    file_hash = hashlib.sha256()
+    for data in staged_files.data_iter(staged_file):
+        file_hash.update(data)
+    return file_hash.hexdigest()
+
+
+def expire_stale_sessions(max_age=STALE_SESSION_AGE):
+    expired = 0
+    stale_sessions = models.UploadSession.objects.filter(status=models.UploadSession.UPLOADING,
+                                                         updated_datetime__lt=timezone.now() - max_age)
+    for session in stale_sessions:
+        expired += models.UploadSession.objects.filter(pk=session.pk, status=models.UploadSession.UPLOADING).update(
+            status=models.UploadSession.FAILED, error='Upload expired')
+        models.StagedFile.objects.filter(pk=session.staged_file_id).delete()
+    return expired
@@ -1,29 +1,89 @@
+import io
+import secrets
+from datetime import timedelta
 from django import forms
+from django.db.models import Exists, OuterRef
 from django.http import Http404
+from django.http import HttpResponse
+from django.http import HttpResponseBadRequest
 from django.http import HttpResponseRedirect
+from django.http import JsonResponse
+from django.http import StreamingHttpResponse
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.html import format_html
 from django.utils.translation import gettext
 from django.views.generic import ListView
+from django.views.generic import View
 from django.views.generic.detail import DetailView
 from django.views.generic.edit import FormView
+from . import chunked_csv
 from . import daos
+from . import enrollment
+from . import import_jobs
 from . import model_html
 from . import models
+from . import simulation
 from . import table_creation
+from . import table_export
+from . import table_snapshot
+from . import upload_sessions
 from . import input_validators
 from permissions import daos as permissions_daos
+from permissions import models as permissions_models
 from permissions import model_html as permissions_html
 
 
+class SiteAutocompleteWidget(forms.TextInput):
+    class Media:
+        js = ('site_autocomplete.js',)
+
+    def __init__(self, search_url, attrs=None):
+        super().__init__(attrs)
+        self.search_url = search_url
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['attrs'].update({'list': f'{name}_options', 'autocomplete': 'off',
+                                           'data-site-search-url': self.search_url})
+        return context
+
+    def render(self, name, value, attrs=None, renderer=None):
+        datalist = format_html('<datalist id="{}_options"></datalist>', name)
+        return super().render(name, value, attrs, renderer) + datalist
+
+
+class SiteIdField(forms.CharField):
+    def __init__(self, table_reservation_dao, search_url, **kwargs):
+        super().__init__(widget=SiteAutocompleteWidget(search_url), **kwargs)
+        self.table_reservation_dao = table_reservation_dao
+
+    def clean(self, value):
+        value = super().clean(value)
+        try:
+            return str(self.table_reservation_dao.site_id_for_value(value))
+        except KeyError:
+            raise forms.ValidationError(gettext('SiteIdInvalidError'))
+
+
 class ReserveRowForm(forms.Form):
-    def __init__(self, table_reservation_dao, data=None):
+    site_choice_limit = 100
+
+    def __init__(self, table_reservation_dao, data=None, site_search_url=None):
         super().__init__(data)
         self.table_reservation_dao = table_reservation_dao
+        self.site_search_url = site_search_url
         self.initialize_fields()
 
     def initialize_fields(self):
-        for column_name, column_choices in self.table_reservation_dao.column_names_and_choices_iter():
-            self.fields[column_name] = forms.ChoiceField(choices=column_choices)
+        site_choice_limit = self.site_choice_limit if self.site_search_url else None
+        column_iter = self.table_reservation_dao.column_names_and_choices_iter(site_choice_limit=site_choice_limit)
+        for column_name, column_choices in column_iter:
+            if column_choices is None:
+                self.fields[column_name] = SiteIdField(self.table_reservation_dao, self.site_search_url)
+            else:
+                self.fields[column_name] = forms.ChoiceField(choices=column_choices)
 
     def reserve_next_available_row(self):
         if not super().is_valid():
@@ -39,7 +99,6 @@ class UploadTableForm(forms.Form):
                                               'Otherwise, please provide the name of the column used for '
                                               'specifying the site of a given patient.')
     csv = forms.FileField()
-    table_creator = None
 
     def validate_name(self):
         try:
@@ -47,15 +106,11 @@ class UploadTableForm(forms.Form):
         except Exception as e:
             self.add_error('name', e)
 
-    def validate_csv(self):
-        try:
-            table_creation.validate_table_data(self.table_creator.csv_file, self.table_creator.site_id_field)
-        except (ValueError, KeyError) as e:
-            self.add_error('csv', f'File read error: {e}')
-
-    def initialize_table_creator(self):
+    def validate_header(self):
+        # Rows are only validated by the import job, but a file without the expected columns is rejected here.
         try:
-            self.table_creator.calculate_column_value_options_and_row_count()
+            header = chunked_csv.read_file_header(self.cleaned_data['csv'])
+            table_creation.validate_header(header, self.cleaned_data['site_id_field'])
         except (ValueError, KeyError) as e:
             self.add_error('csv', f'File read error: {e}')
 
@@ -63,17 +118,12 @@ class UploadTableForm(forms.Form):
         if not super().is_valid():
             return False
         self.validate_name()
-        if not self.errors:
-            self.table_creator = table_creation.CSVTableCreator(self.cleaned_data['csv'], self.cleaned_data['name'],
-                                                                self.cleaned_data['site_id_field'], self.user)
-        if not self.errors:
-            self.validate_csv()
-        if not self.errors:
-            self.initialize_table_creator()
+        self.validate_header()
         return not self.errors
 
     def upload_table(self):
-        return self.table_creator.create_table()
+        return import_jobs.create_import_job(self.user, self.cleaned_data['csv'], table_name=self.cleaned_data['name'],
+                                             site_id_field=self.cleaned_data['site_id_field'])
 
 
 class UploadTableView(FormView):
@@ -81,7 +131,183 @@ class UploadTableView(FormView):
     form_class = UploadTableForm
 
     def form_valid(self, form):
-        table_creation_dao = form.upload_table()
+        import_job = form.upload_table()
+        return HttpResponseRedirect(reverse('import_job', args=(import_job.pk,)))
+
+    def get_form(self, form_class=None):
+        form = super().get_form(form_class)
+        form.user = self.request.user
+        return form
+
+
+class ImportJobView(DetailView):
+    model = models.ImportJob
+
+    def get_queryset(self):
+        return models.ImportJob.objects.filter(owner=self.request.user)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['progress'] = import_jobs.job_progress(self.object)
+        context['user_can_create_tables'] = table_creation.user_can_create_tables(self.request.user)
+        return context
+
+
+class ImportJobProgressView(View):
+    def get(self, request, *args, **kwargs):
+        try:
+            import_job = models.ImportJob.objects.get(pk=kwargs['pk'], owner=request.user)
+        except models.ImportJob.DoesNotExist:
+            raise Http404
+        return JsonResponse(import_jobs.job_progress(import_job))
+
+
+class UploadSessionForm(forms.Form):
+    name = forms.CharField(required=False)
+    site_id_field = forms.CharField(required=False)
+    table = forms.IntegerField(required=False)
+    size = forms.IntegerField(min_value=1)
+    sha256 = forms.RegexField(regex=r'^[0-9a-fA-F]{64}$', required=False)
+
+    def __init__(self, user, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user = user
+
+    def clean_table(self):
+        if self.cleaned_data['table'] is None:
+            return None
+        try:
+            table = models.Table.objects.get(pk=self.cleaned_data['table'], is_hidden=False)
+            if not daos.TableCreationDAO(table, self.user).has_site_id_column():
+                raise forms.ValidationError('Sites can only be added to multi-site tables.')
+        except (models.Table.DoesNotExist, PermissionError):
+            raise forms.ValidationError('Table not found.')
+        return table
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('table') and 'table' not in self.errors:
+            try:
+                input_validators.validate_table_name(cleaned_data.get('name', ''))
+            except Exception as e:
+                self.add_error('name', e)
+        return cleaned_data
+
+    def create_upload_session(self):
+        return upload_sessions.create_upload_session(self.user, self.cleaned_data['size'], self.cleaned_data['sha256'],
+                                                     table_name=self.cleaned_data['name'],
+                                                     site_id_field=self.cleaned_data['site_id_field'],
+                                                     table=self.cleaned_data['table'])
+
+
+class UploadSessionCreateView(View):
+    def post(self, request, *args, **kwargs):
+        form = UploadSessionForm(request.user, data=request.POST)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+        return JsonResponse(upload_sessions.session_progress(form.create_upload_session()), status=201)
+
+
+class UploadSessionView(View):
+    def get(self, request, *args, **kwargs):
+        try:
+            upload_session = models.UploadSession.objects.get(pk=kwargs['pk'], owner=request.user)
+        except models.UploadSession.DoesNotExist:
+            raise Http404
+        return JsonResponse(upload_sessions.session_progress(upload_session))
+
+    def put(self, request, *args, **kwargs):
+        try:
+            upload_session = upload_sessions.write_chunk(kwargs['pk'], request.user,
+                                                         request.META.get('HTTP_CONTENT_RANGE'),
+                                                         request.META.get('HTTP_X_CONTENT_SHA256'), request)
+        except models.UploadSession.DoesNotExist:
+            raise Http404
+        except ValueError as e:
+            upload_session = models.UploadSession.objects.get(pk=kwargs['pk'])
+            if isinstance(e, upload_sessions.UploadLostError):
+                status = 410
+            elif isinstance(e, upload_sessions.UploadRangeError):
+                status = 409
+            else:
+                status = 400
+            return JsonResponse(dict(upload_sessions.session_progress(upload_session), error=str(e)), status=status)
+        return JsonResponse(upload_sessions.session_progress(upload_session))
+
+
+class GenerateTableForm(forms.Form):
+    name = forms.CharField()
+    columns = forms.CharField(widget=forms.Textarea,
+                              help_text='One stratification column per line, as the column name followed by a colon '
+                                        'and its comma-separated values, e.g. `sex: female, male`.')
+    site_id_field = forms.CharField(required=False,
+                                    help_text='Leave blank if this study is a single site study. '
+                                              'Otherwise, please provide the name of the site column.')
+    sites = forms.CharField(required=False, help_text='Comma-separated site names.')
+    rows_per_stratum = forms.IntegerField(min_value=1)
+    block_sizes = forms.CharField(initial='4, 6', help_text='Comma-separated block sizes, chosen at random.')
+    allocation_ratio = forms.CharField(initial='1:1', help_text='Ratio of arm 1 to arm 2 rows in every block.')
+    seed = forms.IntegerField(min_value=0, help_text='The same seed always generates the same table.')
+    table_creator = None
+
+    @staticmethod
+    def split_values(text):
+        return [value.strip() for value in text.split(',') if value.strip()]
+
+    def clean_columns(self):
+        column_values = {}
+        for line in self.cleaned_data['columns'].splitlines():
+            if not line.strip():
+                continue
+            column_name, separator, values = line.partition(':')
+            if not separator or not column_name.strip():
+                raise forms.ValidationError(f'Expected `name: value, value`, got `{line}`.')
+            column_values[column_name.strip()] = self.split_values(values)
+        if not column_values:
+            raise forms.ValidationError('At least one column is required.')
+        return column_values
+
+    def clean_block_sizes(self):
+        try:
+            return [int(value) for value in self.split_values(self.cleaned_data['block_sizes'])]
+        except ValueError:
+            raise forms.ValidationError('Block sizes must be integers.')
+
+    def clean_allocation_ratio(self):
+        try:
+            return tuple(int(value) for value in self.cleaned_data['allocation_ratio'].split(':'))
+        except ValueError:
+            raise forms.ValidationError('Expected a ratio such as `1:1` or `2:1`.')
+
+    def is_valid(self):
+        if not super().is_valid():
+            return False
+        try:
+            input_validators.validate_table_name(self.cleaned_data['name'])
+        except Exception as e:
+            self.add_error('name', e)
+            return False
+        try:
+            self.table_creator = table_creation.GeneratedTableCreator(
+                self.cleaned_data['columns'], self.cleaned_data['rows_per_stratum'],
+                self.cleaned_data['block_sizes'], self.cleaned_data['name'], self.user,
+                site_id_field=self.cleaned_data['site_id_field'],
+                site_values=self.split_values(self.cleaned_data['sites']),
+                allocation_ratio=self.cleaned_data['allocation_ratio'], seed=self.cleaned_data['seed'])
+        except (ValueError, KeyError) as e:
+            self.add_error(None, e)
+        return not self.errors
+
+    def generate_table(self):
+        return self.table_creator.create_table()
+
+
+class GenerateTableView(FormView):
+    template_name = 'randomization_table_generate.html'
+    form_class = GenerateTableForm
+
+    def form_valid(self, form):
+        table_creation_dao = form.generate_table()
         return HttpResponseRedirect(reverse('table_detail', args=table_creation_dao.table_detail_args()))
 
     def get_form(self, form_class=None):
@@ -89,23 +315,30 @@ class UploadTableView(FormView):
         form.user = self.request.user
         return form
 
+    def get_initial(self):
+        return {'seed': secrets.randbelow(2 ** 32)}
+
 
 class MyTablesView(ListView):
+    replica_reads = True
     model = models.Table
 
     def get(self, request, *args, **kwargs):
         self.object_list = self.get_queryset()
         can_create_table = table_creation.user_can_create_tables(self.request.user)
         if not can_create_table and len(self.object_list) == 1:
-            table = self.object_list.first()
-            if not permissions_daos.user_has_table_access(self.request.user, table):
+            table = self.object_list[0]
+            if not table.has_active_site_access:
                 return HttpResponseRedirect(reverse('study_access'))
             return HttpResponseRedirect(reverse('table_detail', args=(table.pk, table.slug())))
         context = self.get_context_data(user_can_create_tables=can_create_table)
         return self.render_to_response(context)
 
     def get_queryset(self):
-        return models.Table.objects.filter(tablepermission__user=self.request.user, is_hidden=False).order_by('name')
+        active_site_access = permissions_models.TableSiteIdAccess.objects.filter(
+            table=OuterRef('pk'), user=self.request.user, is_active=True)
+        return models.Table.objects.filter(tablepermission__user=self.request.user, is_hidden=False).annotate(
+            has_active_site_access=Exists(active_site_access)).order_by('name')
 
 
 class TableViewMixin:
@@ -118,7 +351,7 @@ class TableViewMixin:
         self.request = None
 
     def init_table(self, request, table_pk):
-        self.object = models.Table.objects.get(pk=table_pk)
+        self.object = permissions_daos.resolve_table_access(table_pk, request.user).table
         self.request = request
         if self.object.is_hidden:
             raise Http404
@@ -134,6 +367,8 @@ class TableViewMixin:
     def post(self, request, *args, **kwargs):
         try:
             self.init_table(request, kwargs['pk'])
+            if self.object.is_archived:
+                raise PermissionError('Archived tables are read-only')
             return self.validate_slug(self.post_core, *args, **kwargs)
         except Exception as e:
             return self.post_error(e)
@@ -151,17 +386,27 @@ class TableViewMixin:
         return reverse(cls.view_name(), args=(table.pk, table.slug()))
 
     def table_options(self):
-        options = {'is_owner': False,
+        options = {'is_owner': False, 'is_archived': self.object.is_archived,
                    'user_can_create_tables': table_creation.user_can_create_tables(self.request.user)}
         if self.table_reservation_dao.is_owner:
             options['is_owner'] = True
             if not isinstance(self, TableDetailView):
                 options['table_home'] = TableDetailView.redirect_url_for_table(self.object)
+            options['table_export'] = TableExportView.redirect_url_for_table(self.object)
+            options['table_snapshot'] = TableSnapshotView.redirect_url_for_table(self.object)
+            if not isinstance(self, TableBalanceView):
+                options['table_balance'] = TableBalanceView.redirect_url_for_table(self.object)
+            if self.object.is_archived:
+                return options
             if not isinstance(self, TableColumnsView):
                 options['table_columns'] = TableColumnsView.redirect_url_for_table(self.object)
             if not isinstance(self, TableAppendView):
                 if self.table_reservation_dao.has_site_id_column():
                     options['table_append'] = TableAppendView.redirect_url_for_table(self.object)
+            if not isinstance(self, TableForecastView):
+                options['table_forecast'] = TableForecastView.redirect_url_for_table(self.object)
+            if not isinstance(self, TableSimulationView):
+                options['table_simulation'] = TableSimulationView.redirect_url_for_table(self.object)
         return options
 
     def get_core(self, *args, **kwargs):
@@ -211,7 +456,7 @@ class TableDetailView(TableViewMixin, DetailView):
         return self.render_to_response(context)
 
     def _post_reserve_next_row(self):
-        form = ReserveRowForm(self.table_reservation_dao, self.request.POST)
+        form = ReserveRowForm(self.table_reservation_dao, self.request.POST, self.site_search_url())
         form.reserve_next_available_row()
 
     def _post_complete_reservation(self, **kwargs):
@@ -256,10 +501,12 @@ class TableDetailView(TableViewMixin, DetailView):
         context['html_table'] = table_html.as_html_table()
         context.update(self.table_options())
         if as_staff or not context['is_owner']:
-            self.populate_context_data_for_reservations(context)
+            if not self.object.is_archived:
+                self.populate_context_data_for_reservations(context)
         else:
             activation_code_html = permissions_html.ActivationCodeHtml(self.table_reservation_dao)
             context['activation_code_html_table'] = activation_code_html.as_html_table()
+            context['table_events'] = TableEventsView.redirect_url_for_table(self.object)
         return context
 
     def populate_context_data_for_reservations(self, context):
@@ -274,12 +521,209 @@ class TableDetailView(TableViewMixin, DetailView):
             except PermissionError:
                 pass
         else:
-            context['form'] = ReserveRowForm(self.table_reservation_dao)
+            context['form'] = ReserveRowForm(self.table_reservation_dao, site_search_url=self.site_search_url())
+
+    def site_search_url(self):
+        return TableSiteSearchView.redirect_url_for_table(self.object)
 
     def get_queryset(self):
         return super().get_queryset().prefetch_related('row_set', 'column_set')
 
 
+class TableSiteSearchView(TableViewMixin, View):
+    replica_reads = True
+    max_results = 50
+
+    @staticmethod
+    def view_name():
+        return 'table_site_search'
+
+    def get_core(self, *args, **kwargs):
+        prefix = self.request.GET.get('q', '')
+        try:
+            limit = min(int(self.request.GET.get('limit', 20)), self.max_results)
+        except ValueError:
+            limit = 20
+        choices = self.table_reservation_dao.search_site_id_choices(prefix, limit)
+        return JsonResponse({'results': [{'id': site_id, 'label': label} for site_id, label in choices]})
+
+
+class TableExportView(TableViewMixin, View):
+    replica_reads = True
+
+    @staticmethod
+    def view_name():
+        return 'table_export'
+
+    def get_core(self, *args, **kwargs):
+        try:
+            table_export_dao = daos.TableExportDAO(self.object, self.request.user)
+        except PermissionError:
+            raise Http404
+        export_format = self.request.GET.get('format', table_export.CSV)
+        if export_format not in table_export.CONTENT_TYPES:
+            raise Http404
+        as_of = None
+        if self.request.GET.get('as_of'):
+            as_of = parse_datetime(self.request.GET['as_of'])
+            if not as_of:
+                return HttpResponseBadRequest('Invalid as_of timestamp')
+            if timezone.is_naive(as_of):
+                as_of = timezone.make_aware(as_of)
+        records = table_export_dao.export_records_iter(table_export_dao.export_row_values_iter(as_of))
+        lines = table_export.export_lines(export_format, table_export_dao.export_header(), records)
+        response = StreamingHttpResponse(lines, content_type=table_export.CONTENT_TYPES[export_format])
+        filename = table_export_dao.export_filename(export_format)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class TableSnapshotView(TableViewMixin, View):
+    replica_reads = True
+
+    @staticmethod
+    def view_name():
+        return 'table_snapshot'
+
+    def get_core(self, *args, **kwargs):
+        try:
+            table_export_dao = daos.TableExportDAO(self.object, self.request.user)
+        except PermissionError:
+            raise Http404
+        snapshot_file = io.BytesIO()
+        table_snapshot.write_table_snapshot(table_export_dao, snapshot_file)
+        response = HttpResponse(snapshot_file.getvalue(), content_type='application/octet-stream')
+        response['Content-Disposition'] = f'attachment; filename="{table_export_dao.export_filename("npz")}"'
+        return response
+
+
+class TableBalanceView(TableViewMixin, DetailView):
+    replica_reads = True
+    template_name_suffix = '_balance'
+
+    @staticmethod
+    def view_name():
+        return 'table_balance'
+
+    def get_core(self, *args, **kwargs):
+        try:
+            arm_balance_dao = daos.ArmBalanceDAO(self.object, self.request.user)
+        except PermissionError:
+            raise Http404
+        context = self.get_context_data()
+        context['arm_balance_html_table'] = model_html.ArmBalanceHtml(arm_balance_dao).as_html_table()
+        context['can_see_table_list'] = True
+        context.update(self.table_options())
+        return self.render_to_response(context)
+
+
+class TableForecastView(TableViewMixin, DetailView):
+    replica_reads = True
+    template_name_suffix = '_forecast'
+
+    @staticmethod
+    def view_name():
+        return 'table_forecast'
+
+    def get_core(self, *args, **kwargs):
+        try:
+            enrollment_forecast_dao = daos.EnrollmentForecastDAO(self.object, self.request.user)
+        except PermissionError:
+            raise Http404
+        context = self.get_context_data()
+        context['forecast_html_table'] = model_html.EnrollmentForecastHtml(enrollment_forecast_dao).as_html_table()
+        context['top_up_days'] = enrollment.TOP_UP_DAYS
+        if enrollment_forecast_dao.has_site_id_column():
+            context['sites_needing_top_up'] = enrollment_forecast_dao.sites_needing_top_up()
+            context['table_append_url'] = TableAppendView.redirect_url_for_table(self.object)
+        context['can_see_table_list'] = True
+        context.update(self.table_options())
+        return self.render_to_response(context)
+
+
+class SimulationForm(forms.Form):
+    patients_per_site_per_week = forms.FloatField(min_value=0, initial=5)
+    weeks = forms.IntegerField(min_value=1, initial=52)
+    replicates = forms.IntegerField(min_value=1, max_value=2000, initial=1000)
+    seed = forms.IntegerField(min_value=0, required=False)
+
+
+class TableSimulationView(TableViewMixin, DetailView):
+    """
+    Simulations from this page run in the request process with a capped number of replicates; use the
+    simulate_enrollment command to run more replicates in a process pool.
+    """
+    replica_reads = True
+    template_name_suffix = '_simulation'
+
+    @staticmethod
+    def view_name():
+        return 'table_simulation'
+
+    def get_core(self, *args, **kwargs):
+        try:
+            simulation_dao = daos.SimulationDAO(self.object, self.request.user)
+        except PermissionError:
+            raise Http404
+        context = self.get_context_data()
+        form = SimulationForm(self.request.GET or None)
+        if form.is_valid():
+            simulation_result = simulation_dao.simulate(form.cleaned_data['patients_per_site_per_week'] / 7,
+                                                        form.cleaned_data['weeks'] * 7,
+                                                        form.cleaned_data['replicates'],
+                                                        seed=form.cleaned_data['seed'], workers=1)
+            context['simulation_result'] = simulation_result
+            context['quantiles'] = [f'{quantile:.0%}' for quantile in simulation.QUANTILES]
+            context['imbalance_quantiles'] = [
+                ('Total (absolute)', list(simulation_result.total_imbalance_quantiles.values())),
+                ('Largest site (absolute)', list(simulation_result.site_imbalance_quantiles.values())),
+                ('Largest stratum (absolute)', list(simulation_result.stratum_imbalance_quantiles.values()))]
+            context['simulation_html_table'] = model_html.SimulationHtml(simulation_dao,
+                                                                         simulation_result).as_html_table()
+        context['form'] = form
+        context['can_see_table_list'] = True
+        context.update(self.table_options())
+        return self.render_to_response(context)
+
+
+class TableChangesView(TableViewMixin, View):
+    """
+    Change sequences are allocated when a transition is written, so a change can become visible after one with a
+    higher sequence. A page ends at the first change from the last settle_seconds to keep cursors from skipping them.
+    """
+    settle_seconds = 5
+
+    @staticmethod
+    def view_name():
+        return 'table_changes'
+
+    def get_core(self, *args, **kwargs):
+        try:
+            row_change_feed_dao = daos.RowChangeFeedDAO(self.object, self.request.user)
+            visible_before = timezone.now() - timedelta(seconds=self.settle_seconds)
+            changes, cursor, has_more = row_change_feed_dao.changes_since(self.request.GET.get('since', 0),
+                                                                          self.request.GET.get('limit', 100),
+                                                                          visible_before)
+        except PermissionError:
+            raise Http404
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        return JsonResponse({'changes': changes, 'cursor': cursor, 'has_more': has_more})
+
+
+class TableEventsView(TableViewMixin, View):
+    """
+    Row events are streamed by event_stream.TableEventStreamApplication when served over ASGI, as in the Procfile.
+    Under WSGI, such as runserver, there is no stream, and a 204 tells the browser's EventSource not to reconnect.
+    """
+    @staticmethod
+    def view_name():
+        return 'table_events'
+
+    def get_core(self, *args, **kwargs):
+        return HttpResponse(status=204)
+
+
 class TableColumnsView(TableViewMixin, DetailView):
     template_name_suffix = '_columns'
 
@@ -324,37 +768,27 @@ class TableColumnsView(TableViewMixin, DetailView):
 
 class TableAppendForm(forms.Form):
     csv = forms.FileField()
-    table_appender = None
 
     def __init__(self, table_creation_dao, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.table_creation_dao = table_creation_dao
 
-    def validate_csv(self):
-        try:
-            table_creation.validate_table_data(self.table_appender.csv_file,
-                                               self.table_creation_dao.site_id_column_name())
-        except (ValueError, KeyError) as e:
-            self.add_error('csv', f'File read error: {e}')
-
-    def initialize_table_appender(self):
+    def validate_header(self):
         try:
-            self.table_appender.calculate_column_value_options()
+            header = chunked_csv.read_file_header(self.cleaned_data['csv'])
+            table_creation.validate_header(header, self.table_creation_dao.site_id_column_name())
+            self.table_creation_dao.validate_header_against_existing(header)
         except (ValueError, KeyError) as e:
             self.add_error('csv', f'File read error: {e}')
 
     def is_valid(self):
         if not super().is_valid():
             return False
-        self.table_appender = table_creation.CSVTableAppender(self.cleaned_data['csv'], self.table_creation_dao)
-        if not self.errors:
-            self.validate_csv()
-        if not self.errors:
-            self.initialize_table_appender()
+        self.validate_header()
         return not self.errors
 
-    def append_to_table(self):
-        return self.table_appender.append_to_table()
+    def append_to_table(self, table, user):
+        return import_jobs.create_import_job(user, self.cleaned_data['csv'], table=table)
 
 
 class TableAppendView(TableViewMixin, DetailView):
@@ -387,8 +821,8 @@ class TableAppendView(TableViewMixin, DetailView):
         table_creation_dao = daos.TableCreationDAO(self.object, self.request.user)
         self.form = TableAppendForm(table_creation_dao, data=self.request.POST, files=self.request.FILES)
         if self.form.is_valid():
-            table_creation_dao = self.form.append_to_table()
-            return HttpResponseRedirect(reverse('table_detail', args=table_creation_dao.table_detail_args()))
+            import_job = self.form.append_to_table(self.object, self.request.user)
+            return HttpResponseRedirect(reverse('import_job', args=(import_job.pk,)))
         return self.render_to_response(self.get_context_data(form=self.form))
 
     def post_error(self, error):
@@ -5,12 +5,14 @@ from . import models
 class TablePermissionAdmin(admin.ModelAdmin):
     list_display = ('id', 'table', 'user', 'is_owner')
     list_filter = ('table', 'user')
+    list_select_related = ('table', 'user')
 
 
 class TableSiteIdAccessAdmin(admin.ModelAdmin):
     list_display = ('id', 'table', 'user', 'site', 'is_active')
     list_filter = ('table', 'user', 'is_active')
     list_editable = ('is_active',)
+    list_select_related = ('table__site_id_column', 'user')
 
     @staticmethod
     def site(obj):
@@ -22,6 +24,7 @@ class TableSiteIdAccessAdmin(admin.ModelAdmin):
 class ActivationCodeAdmin(admin.ModelAdmin):
     list_display = ('id', 'table', 'code', 'site_id')
     list_filter = ('table',)
+    list_select_related = ('table',)
 
 
 admin.site.register(models.TablePermission, TablePermissionAdmin)
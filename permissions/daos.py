@@ -1,11 +1,27 @@
+from collections import namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.contrib.auth.models import User
+from django.db.models import F, FilteredRelation, Q
 from django.db.transaction import atomic
+from django.db.utils import IntegrityError
+from datastore.models import Table
 from . import models
 
+ACTIVATION_CODE_ATTEMPTS = 5
+ACTIVATION_CODE_QUERY_BATCH_SIZE = 900
+
+AccessReview = namedtuple('AccessReview', ('approved', 'users_activated', 'rejected'))
+TableAccess = namedtuple('TableAccess', ('table', 'has_permission', 'is_owner', 'site_ids'))
+
+_table_access_memo = ContextVar('table_access_memo', default=None)
+
 
 @atomic
 def set_table_owner(table, owner):
     models.TablePermission.objects.get_or_create(table=table, user=owner, is_owner=True)
     models.TableSiteIdAccess.objects.get_or_create(table=table, user=owner, site_id=None, is_active=True)
+    clear_table_access_memo()
 
 
 @atomic
@@ -14,38 +30,136 @@ def register_user_for_table(user, table_activation_code):
     models.TablePermission.objects.get_or_create(user=user, table=activation_code.table)
     models.TableSiteIdAccess.objects.get_or_create(user=user, table=activation_code.table,
                                                    site_id=activation_code.site_id)
+    clear_table_access_memo()
+    return activation_code
+
 
 @atomic
 def create_activation_codes(table):
+    """
+    Creates the missing activation codes of a table, one per site, with a few queries regardless of the number of
+    sites. If a concurrent writer takes one of the codes, or creates a code for the same site, the insert is
+    rolled back and retried with fresh candidates.
+    """
     has_site_id_column = hasattr(table, 'site_id_column')
     site_ids = range(table.site_id_column.number_of_options) if has_site_id_column else [None]
-    for site_id in site_ids:
-        models.ActivationCode.objects.get_or_create(table=table, site_id=site_id)
-
-
-def get_site(table_site_id_access):
-    if table_site_id_access.site_id is None:
-        return ''
-    choices = table_site_id_access.table.site_id_column.potential_values_list()
-    return choices[table_site_id_access.site_id]
+    for attempt in range(ACTIVATION_CODE_ATTEMPTS):
+        existing_site_ids = set(models.ActivationCode.objects.filter(table=table).values_list('site_id', flat=True))
+        missing_site_ids = [site_id for site_id in site_ids if site_id not in existing_site_ids]
+        if not missing_site_ids:
+            return
+        codes = unused_activation_codes(len(missing_site_ids))
+        try:
+            with atomic():
+                models.ActivationCode.objects.bulk_create(
+                    models.ActivationCode(table=table, site_id=site_id, code=code)
+                    for site_id, code in zip(missing_site_ids, codes))
+            return
+        except IntegrityError:
+            if attempt == ACTIVATION_CODE_ATTEMPTS - 1:
+                raise
+
+
+def unused_activation_codes(count):
+    codes = set()
+    while len(codes) < count:
+        candidates = set()
+        while len(candidates) < count - len(codes):
+            candidate = models.ActivationCode.random_code()
+            if candidate not in codes:
+                candidates.add(candidate)
+        candidates = list(candidates)
+        for start in range(0, len(candidates), ACTIVATION_CODE_QUERY_BATCH_SIZE):
+            batch = candidates[start:start + ACTIVATION_CODE_QUERY_BATCH_SIZE]
+            taken = set(models.ActivationCode.objects.filter(code__in=batch).values_list('code', flat=True))
+            codes.update(code for code in batch if code not in taken)
+    return list(codes)
+
+
+class SiteLabels:
+    """
+    Decodes the site ids of TableSiteIdAccess rows, splitting each table's potential site values only once.
+    """
+    def __init__(self):
+        self._labels = {}
+
+    def get_site(self, table_site_id_access):
+        if table_site_id_access.site_id is None:
+            return ''
+        if table_site_id_access.table_id not in self._labels:
+            site_id_column = table_site_id_access.table.site_id_column
+            self._labels[table_site_id_access.table_id] = site_id_column.potential_values_list()
+        return self._labels[table_site_id_access.table_id][table_site_id_access.site_id]
+
+
+def get_table_owner(table):
+    """
+    Returns the owner of a table. Raises PermissionError if the table has no owner.
+    """
+    table_permission = models.TablePermission.objects.select_related('user').filter(table=table, is_owner=True).first()
+    if not table_permission:
+        raise PermissionError(f'Table `{table.name}` has no owner')
+    return table_permission.user
 
 
 def user_has_table_access(user, table):
-    site_id_access = models.TableSiteIdAccess.objects.filter(table=table, user=user, is_active=True)
-    return site_id_access.count() > 0
+    return bool(resolve_table_access(table.pk, user).site_ids)
+
+
+def resolve_table_access(table_pk, user):
+    """
+    Returns the TableAccess of a user to a table from one query that joins the table with the user's permission
+    and active site accesses. Within a table_access_memo, such as the one opened for each request by
+    TableAccessMemoMiddleware, each table is resolved once. Raises Table.DoesNotExist for a missing table.
+    """
+    memo = _table_access_memo.get()
+    key = (table_pk, user.pk)
+    if memo is not None and key in memo:
+        return memo[key]
+    tables = list(Table.objects.filter(pk=table_pk).select_related('site_id_column').annotate(
+        permission=FilteredRelation('tablepermission', condition=Q(tablepermission__user=user)),
+        site_access=FilteredRelation('tablesiteidaccess', condition=Q(tablesiteidaccess__user=user,
+                                                                      tablesiteidaccess__is_active=True)),
+        permission_is_owner=F('permission__is_owner'),
+        site_access_pk=F('site_access__pk'),
+        site_access_site_id=F('site_access__site_id'),
+    ).order_by('site_access__pk'))
+    if not tables:
+        raise Table.DoesNotExist(f'Table {table_pk} does not exist')
+    table_access = TableAccess(tables[0], tables[0].permission_is_owner is not None,
+                               bool(tables[0].permission_is_owner),
+                               [table.site_access_site_id for table in tables if table.site_access_pk is not None])
+    if memo is not None:
+        memo[key] = table_access
+    return table_access
+
+
+@contextmanager
+def table_access_memo():
+    token = _table_access_memo.set({})
+    try:
+        yield
+    finally:
+        _table_access_memo.reset(token)
+
+
+def clear_table_access_memo():
+    memo = _table_access_memo.get()
+    if memo is not None:
+        memo.clear()
 
 
 class TablePermissionsDAO:
     def __init__(self, table, user):
-        self._table_permission = models.TablePermission.objects.get(table=table, user=user)
-        self._table_site_id_access_queryset = models.TableSiteIdAccess.objects.filter(table=table, user=user,
-                                                                                      is_active=True)
+        self._table_access = resolve_table_access(table.pk, user)
+        if not self._table_access.has_permission:
+            raise models.TablePermission.DoesNotExist('TablePermission matching query does not exist.')
 
     def is_owner(self):
-        return self._table_permission.is_owner
+        return self._table_access.is_owner
 
     def site_ids(self):
-        return [table_site_id_access.site_id for table_site_id_access in self._table_site_id_access_queryset]
+        return list(self._table_access.site_ids)
 
 
 class TableSiteAccessDAO:
@@ -59,6 +173,9 @@ class TableSiteAccessDAO:
         table_site_id_access_queryset = self._get_accessible_table_site_id_access_queryset()
         return table_site_id_access_queryset.filter(is_active=False)
 
+    def get_pending_list_queryset(self):
+        return self.get_inactive_queryset().select_related('table__site_id_column', 'user').order_by('table_id', 'pk')
+
     @atomic
     def approve(self, table_site_id_access_pk):
         table_site_id_access_queryset = self._get_accessible_table_site_id_access_queryset()
@@ -70,8 +187,27 @@ class TableSiteAccessDAO:
         table_site_id_access.save()
         user.is_active = True
         user.save()
+        clear_table_access_memo()
         return user, table_site_id_access.table.name
 
+    @atomic
+    def review(self, approve_pks=(), reject_pks=()):
+        """
+        Approves and rejects pending requests on the owner's tables with set-based queries and returns an
+        AccessReview of the counts. Rejected requests are deleted. Requests that are not pending, or not on the
+        owner's tables, are ignored.
+        """
+        if set(approve_pks) & set(reject_pks):
+            raise ValueError('A request cannot be both approved and rejected')
+        pending_queryset = self.get_inactive_queryset()
+        approved_queryset = pending_queryset.filter(pk__in=approve_pks)
+        users_activated = User.objects.filter(is_active=False,
+                                              pk__in=approved_queryset.values('user_id')).update(is_active=True)
+        approved = approved_queryset.update(is_active=True)
+        rejected = pending_queryset.filter(pk__in=reject_pks).delete()[0] if reject_pks else 0
+        clear_table_access_memo()
+        return AccessReview(approved, users_activated, rejected)
+
     def _get_accessible_table_site_id_access_queryset(self):
         valid_table_permissions = models.TablePermission.objects.filter(user=self.user, is_owner=True)
         valid_table_ids = valid_table_permissions.values_list('table_id', flat=True)
@@ -0,0 +1,14 @@
+from . import daos
+
+
+class TableAccessMemoMiddleware:
+    """
+    Resolves each table's permissions once per request, so that every DAO built while handling the request shares
+    the same resolution.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with daos.table_access_memo():
+            return self.get_response(request)
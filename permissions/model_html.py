@@ -21,14 +21,17 @@ class TableSiteIdAccessHtml(HtmlTableGenerator):
         self.table_site_id_access_query = table_site_id_access_query
 
     def get_html_table_header(self):
-        return thead_tag(tr_tag(ths(['Table', 'User', 'Site Id', 'Approve'])))
+        select_all = input_tag('select_all', 'all', type='checkbox', id='select-all-access')
+        return thead_tag(tr_tag(ths([select_all, 'Table', 'User', 'Site Id', 'Approve'])))
 
     def get_html_table_body(self):
         rows_html = ''
+        site_labels = daos.SiteLabels()
         for access in self.table_site_id_access_query:
-            site = daos.get_site(access)
+            site = site_labels.get_site(access)
+            select = input_tag('access', access.pk, type='checkbox')
             submit = input_tag(f'site_{access.pk}', 'Approve', type='submit')
-            rows_html += tr_tag(tds([access.table.name, access.user, site, submit]))
+            rows_html += tr_tag(tds([select, access.table.name, access.user, site, submit]))
         if not rows_html:
-            rows_html = tr_tag(td_tag('No study access requests pending approval.', colspan=4))
+            rows_html = tr_tag(td_tag('No study access requests pending approval.', colspan=5))
         return tbody_tag(rows_html)
@@ -1,7 +1,7 @@
 from django.contrib.auth.models import User
 from django.core.validators import ValidationError
 from django.db import models
-from random import randint
+import secrets
 from datastore.models import Table
 
 
@@ -37,11 +37,15 @@ class ActivationCode(models.Model):
             raise ValidationError('Code must be 8 characters long')
 
     @staticmethod
-    def generate_code():
+    def random_code():
         potential_letters = 'BCDFGHJKLMNPQRSTVWXZ'
+        return ''.join(secrets.choice(potential_letters) for _ in range(8))
+
+    @staticmethod
+    def generate_code():
         code = None
         while not code:
-            code = ''.join(potential_letters[randint(0, len(potential_letters) - 1)] for _ in range(8))
+            code = ActivationCode.random_code()
             if ActivationCode.objects.filter(code=code).exists():
                 code = None
         return code
@@ -1,9 +1,13 @@
+from unittest import mock
 from django.contrib.auth.models import User
 from django.core.validators import ValidationError
+from django.db import connection
 from django.db.transaction import atomic
 from django.db.utils import IntegrityError
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from . import model_html
+from . import daos as permissions_daos
 from . import models
 from datastore import daos
 
@@ -59,6 +63,36 @@ class StaffTableAppendTestCase(TestCase):
         self.assertEqual(models.ActivationCode.objects.count(), 5)
 
 
+class BulkActivationCodeTestCase(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create(username='test_staff', is_staff=True)
+        self.table_creation_dao = daos.create_table('dao_test', self.staff)
+        self.table = self.table_creation_dao._table
+        self.table_creation_dao.create_column('site', [f'site{i}' for i in range(2000)], is_site_id_column=True)
+
+    def test_codes_are_created_in_bulk(self):
+        models.ActivationCode.objects.create(table=self.table, code='BBBBBBBB', site_id=5)
+        with CaptureQueriesContext(connection) as context:
+            self.table_creation_dao.create_activation_codes()
+        self.assertLess(len(context.captured_queries), 20)
+        codes = models.ActivationCode.objects.filter(table=self.table)
+        self.assertEqual(codes.count(), 2000)
+        self.assertEqual(len(set(codes.values_list('code', flat=True))), 2000)
+        self.assertEqual(sorted(codes.values_list('site_id', flat=True)), list(range(2000)))
+        self.assertEqual(codes.get(site_id=5).code, 'BBBBBBBB')
+        for code in codes.values_list('code', flat=True)[:100]:
+            models.ActivationCode.activation_code_validator(code)
+
+    def test_collisions_are_retried(self):
+        other_table = daos.create_table('other', self.staff)._table
+        models.ActivationCode.objects.create(table=other_table, code='BBBBBBBB')
+        candidates = iter(['BBBBBBBB'] * 3 + [f'CCCCC{i:03d}' for i in range(2000)])
+        with mock.patch.object(models.ActivationCode, 'random_code', side_effect=lambda: next(candidates)):
+            self.table_creation_dao.create_activation_codes()
+        self.assertFalse(models.ActivationCode.objects.filter(table=self.table, code='BBBBBBBB').exists())
+        self.assertEqual(models.ActivationCode.objects.filter(table=self.table).count(), 2000)
+
+
 class MultisiteActivationCodeHtmlTestCase(TestCase):
     def setUp(self):
         self.owner = User.objects.create(username='test', is_staff=True)
@@ -106,3 +140,131 @@ class SingleSiteActivationCodeHtmlTestCase(TestCase):
                          '<tbody><tr><td>10000002</td></tr></tbody>')
 
 
+class AccessApprovalTestCase(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(username='owner', is_staff=True)
+        table_creation_dao = daos.create_table('approval', self.owner)
+        table_creation_dao.create_column('site', ['a', 'b'], is_site_id_column=True)
+        self.table = table_creation_dao._table
+        other_owner = User.objects.create(username='other_owner', is_staff=True)
+        self.other_table = daos.create_table('other', other_owner)._table
+        self.users = [User.objects.create(username=f'user_{i}', is_active=False) for i in range(4)]
+        self.accesses = [models.TableSiteIdAccess.objects.create(table=self.table, user=user, site_id=i % 2)
+                         for i, user in enumerate(self.users[:3])]
+        self.other_access = models.TableSiteIdAccess.objects.create(table=self.other_table, user=self.users[3])
+        self.client.force_login(self.owner)
+
+    def test_list(self):
+        response = self.client.get('/approve/')
+        self.assertContains(response, 'user_2')
+        self.assertNotContains(response, 'user_3')
+        self.assertContains(response, f'<input name="access" value="{self.accesses[0].pk}" type="checkbox">',
+                            html=True)
+
+    def test_list_queries_do_not_grow_with_requests(self):
+        table_site_id_access_dao = permissions_daos.TableSiteAccessDAO(self.owner)
+        with self.assertNumQueries(1):
+            model_html.TableSiteIdAccessHtml(table_site_id_access_dao.get_pending_list_queryset()).as_html_table()
+        User.objects.bulk_create(User(username=f'extra_{i}', is_active=False) for i in range(150))
+        models.TableSiteIdAccess.objects.bulk_create(models.TableSiteIdAccess(table=self.table, user=user, site_id=1)
+                                                     for user in User.objects.filter(username__startswith='extra_'))
+        with self.assertNumQueries(1):
+            html_table = model_html.TableSiteIdAccessHtml(
+                table_site_id_access_dao.get_pending_list_queryset()).as_html_table()
+        self.assertEqual(html_table.count('<td>b</td>'), 151)
+        with self.assertNumQueries(4):
+            response = self.client.get('/approve/?page=2')
+        self.assertContains(response, 'Page 2 of 2')
+        self.assertContains(response, 'extra_149')
+        self.assertNotContains(response, 'user_0')
+
+    def test_bulk_approve_and_reject(self):
+        response = self.client.post('/approve/', {'action': 'approve',
+                                                  'access': [self.accesses[0].pk, self.accesses[1].pk,
+                                                             self.other_access.pk]})
+        self.assertContains(response, 'Approved 2 requests, activating 2 users. Rejected 0 requests.')
+        self.assertEqual(list(User.objects.filter(is_active=True, is_staff=False).order_by('pk')), self.users[:2])
+        self.assertFalse(models.TableSiteIdAccess.objects.get(pk=self.other_access.pk).is_active)
+        response = self.client.post('/approve/', {'action': 'reject',
+                                                  'access': [self.accesses[0].pk, self.accesses[2].pk]})
+        self.assertContains(response, 'Approved 0 requests, activating 0 users. Rejected 1 requests.')
+        self.assertTrue(models.TableSiteIdAccess.objects.get(pk=self.accesses[0].pk).is_active)
+        self.assertFalse(models.TableSiteIdAccess.objects.filter(pk=self.accesses[2].pk).exists())
+        self.assertContains(self.client.post('/approve/', {'action': 'approve'}),
+                            'No study access requests were selected')
+
+    def test_review_on_emptied_last_page(self):
+        User.objects.bulk_create(User(username=f'extra_{i}', is_active=False) for i in range(98))
+        models.TableSiteIdAccess.objects.bulk_create(models.TableSiteIdAccess(table=self.table, user=user, site_id=1)
+                                                     for user in User.objects.filter(username__startswith='extra_'))
+        last_access = models.TableSiteIdAccess.objects.filter(table=self.table).order_by('pk').last()
+        self.assertContains(self.client.get('/approve/?page=2'), 'Page 2 of 2')
+        response = self.client.post('/approve/?page=2', {'action': 'approve', 'access': [last_access.pk]})
+        self.assertContains(response, 'Approved 1 requests, activating 1 users. Rejected 0 requests.')
+        self.assertTrue(models.TableSiteIdAccess.objects.get(pk=last_access.pk).is_active)
+        self.assertEqual(self.client.get('/approve/?page=x').status_code, 200)
+
+    def test_single_approve(self):
+        response = self.client.post('/approve/', {f'site_{self.accesses[1].pk}': 'Approve'})
+        self.assertContains(response, '`user_1` has been granted access to table `approval`.')
+        self.assertTrue(User.objects.get(pk=self.users[1].pk).is_active)
+
+
+class TableAccessResolutionTestCase(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(username='owner', is_staff=True)
+        table_creation_dao = daos.create_table('resolved', self.owner)
+        table_creation_dao.create_column('site', ['a', 'b', 'c'], is_site_id_column=True)
+        self.table = table_creation_dao._table
+        self.user = User.objects.create(username='user')
+        models.TablePermission.objects.create(table=self.table, user=self.user)
+        for site_id, is_active in ((0, True), (1, False), (2, True)):
+            models.TableSiteIdAccess.objects.create(table=self.table, user=self.user, site_id=site_id,
+                                                    is_active=is_active)
+
+    def test_single_query(self):
+        with self.assertNumQueries(1):
+            table_access = permissions_daos.resolve_table_access(self.table.pk, self.user)
+            self.assertEqual(table_access.table.site_id_column.name, 'site')
+        self.assertEqual((table_access.has_permission, table_access.is_owner, table_access.site_ids),
+                         (True, False, [0, 2]))
+        owner_access = permissions_daos.resolve_table_access(self.table.pk, self.owner)
+        self.assertEqual((owner_access.is_owner, owner_access.site_ids), (True, [None]))
+        with self.assertRaises(models.Table.DoesNotExist):
+            permissions_daos.resolve_table_access(self.table.pk + 1, self.user)
+
+    def test_memo(self):
+        with permissions_daos.table_access_memo():
+            with self.assertNumQueries(1):
+                daos.TableDAO(self.table, self.user)
+                daos.TableReservationDAO(self.table, self.user)
+                self.assertTrue(permissions_daos.user_has_table_access(self.user, self.table))
+            models.TableSiteIdAccess.objects.filter(user=self.user).update(is_active=False)
+            permissions_daos.clear_table_access_memo()
+            with self.assertRaises(PermissionError):
+                daos.TableDAO(self.table, self.user)
+
+    def test_missing_permission(self):
+        with self.assertRaises(models.TablePermission.DoesNotExist):
+            daos.TableDAO(self.table, User.objects.create(username='stranger'))
+
+    def test_table_owner(self):
+        self.assertEqual(permissions_daos.get_table_owner(self.table), self.owner)
+        models.TablePermission.objects.filter(user=self.owner).delete()
+        with self.assertRaises(PermissionError):
+            permissions_daos.get_table_owner(self.table)
+
+    def test_views_share_one_resolution(self):
+        self.client.force_login(self.owner)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(f'/{self.table.pk}-{self.table.slug()}/add-site/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sum('permissions_tablepermission' in query['sql'] for query in context.captured_queries), 1)
+
+    def test_table_list_redirects(self):
+        self.client.force_login(self.user)
+        with self.assertNumQueries(3):
+            response = self.client.get('/')
+        self.assertEqual(response['Location'], f'/{self.table.pk}-{self.table.slug()}/')
+        models.TableSiteIdAccess.objects.filter(user=self.user).update(is_active=False)
+        self.assertEqual(self.client.get('/')['Location'], '/study-access/')
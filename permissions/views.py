@@ -7,9 +7,10 @@ from django.urls import reverse
 from django.utils.translation import gettext_lazy, gettext
 from django.views.generic import ListView
 from django.views.generic.edit import FormView
+from . import daos
 from . import model_html
 from . import models
-from datastore import daos
+from datastore import daos as datastore_daos
 
 
 class SignupForm(UserCreationForm):
@@ -40,7 +41,7 @@ class SignupForm(UserCreationForm):
         user.is_active = False
         if commit:
             user.save()
-            daos.register_user_for_table(self.request, user, self.cleaned_data['activation_code'])
+            datastore_daos.register_user_for_table(self.request, user, self.cleaned_data['activation_code'])
         return user
 
 
@@ -82,7 +83,7 @@ class StudyAccessForm(forms.Form):
 
     def save(self, commit=True):
         if commit:
-            daos.register_user_for_table(self.request, self.user, self.cleaned_data['activation_code'])
+            datastore_daos.register_user_for_table(self.request, self.user, self.cleaned_data['activation_code'])
 
 
 class StudyAccessView(FormView):
@@ -99,29 +100,53 @@ class StudyAccessView(FormView):
 
 class AccessApproval(ListView):
     model = models.TableSiteIdAccess
+    template_name = 'datastore/tablesiteidaccess_list.html'
+    paginate_by = 100
 
     def get(self, request, *args, **kwargs):
         self.request = request
         self.object_list = self.get_queryset()
         context = self.get_context_data(user_can_create_tables=True, **kwargs)
-        context['html_table'] = model_html.TableSiteIdAccessHtml(self.object_list).as_html_table()
+        context['html_table'] = model_html.TableSiteIdAccessHtml(context['object_list']).as_html_table()
         return self.render_to_response(context)
 
     @atomic
     def post(self, request, *args, **kwargs):
         self.request = request
         try:
-            pk = self._extract_row_pk()
             table_site_id_access_dao = daos.TableSiteAccessDAO(request.user)
-            user, table_name = table_site_id_access_dao.approve(pk)
-            kwargs['success_message'] = f'`{user}` has been granted access to table `{table_name}`.'
+            if 'action' in request.POST:
+                kwargs['success_message'] = self._review(table_site_id_access_dao)
+            else:
+                pk = self._extract_row_pk()
+                user, table_name = table_site_id_access_dao.approve(pk)
+                kwargs['success_message'] = f'`{user}` has been granted access to table `{table_name}`.'
         except Exception as error:
             kwargs['error'] = error
         return self.get(request, *args, **kwargs)
 
+    def _review(self, table_site_id_access_dao):
+        pks = [int(pk) for pk in self.request.POST.getlist('access')]
+        if not pks:
+            raise ValueError('No study access requests were selected')
+        action = self.request.POST['action']
+        if action not in ('approve', 'reject'):
+            raise ValueError(f'Unknown action `{action}`')
+        review = table_site_id_access_dao.review(**{f'{action}_pks': pks})
+        return f'Approved {review.approved} requests, activating {review.users_activated} users. ' \
+               f'Rejected {review.rejected} requests.'
+
     def get_queryset(self):
         table_site_id_access_dao = daos.TableSiteAccessDAO(self.request.user)
-        return table_site_id_access_dao.get_inactive_queryset()
+        return table_site_id_access_dao.get_pending_list_queryset()
+
+    def paginate_queryset(self, queryset, page_size):
+        # A review posts back to the page it was made on, which may no longer exist once its requests are no longer
+        # pending, so out of range pages show the last page instead of a 404 that would roll back the review.
+        paginator = self.get_paginator(queryset, page_size, orphans=self.get_paginate_orphans(),
+                                       allow_empty_first_page=self.get_allow_empty())
+        page = paginator.get_page(self.request.GET.get(self.page_kwarg))
+        return paginator, page, page.object_list, page.has_other_pages()
 
     def _extract_row_pk(self):
         for key in self.request.POST:
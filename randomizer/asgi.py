@@ -13,4 +13,8 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'randomizer.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from datastore.event_stream import TableEventStreamApplication  # noqa: E402 (requires configured settings)
+
+application = TableEventStreamApplication(django_application)
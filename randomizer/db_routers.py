@@ -0,0 +1,93 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Routes reads to the REPLICA_DATABASE_ALIAS database inside replica_reads(), and back to the primary once
+# anything has been written or while the primary is in a transaction.
+
+STICKY_SESSION_KEY = '_primary_until'
+
+
+class RoutingState:
+    def __init__(self, read_alias=None):
+        self.read_alias = read_alias
+        self.wrote = False
+
+
+_routing_state = ContextVar('routing_state', default=None)
+
+
+def replica_alias():
+    alias = getattr(settings, 'REPLICA_DATABASE_ALIAS', None)
+    return alias if alias in settings.DATABASES else None
+
+
+@contextmanager
+def routing_state(read_alias=None):
+    state = RoutingState(read_alias)
+    token = _routing_state.set(state)
+    try:
+        yield state
+    finally:
+        _routing_state.reset(token)
+
+
+def replica_reads():
+    """
+    Opened by ReplicaRoutingMiddleware for GET requests to views with replica_reads = True and to admin change lists,
+    and by report and export commands.
+    """
+    return routing_state(replica_alias())
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _routing_state.get()
+        if state is None or not state.read_alias or state.wrote or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return state.read_alias
+
+    def db_for_write(self, model, **hints):
+        state = _routing_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+class ReplicaRoutingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with routing_state() as state:
+            request.routing_state = state
+            response = self.get_response(request)
+        if state.wrote and hasattr(request, 'session'):
+            request.session[STICKY_SESSION_KEY] = time.time() + settings.REPLICA_STICKY_SECONDS
+        if response.streaming and state.read_alias and not state.wrote:
+            response.streaming_content = self._replica_stream(response.streaming_content, state.read_alias)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in ('GET', 'HEAD') or not self._reads_from_replica(view_func):
+            return None
+        if hasattr(request, 'session') and request.session.get(STICKY_SESSION_KEY, 0) > time.time():
+            return None
+        request.routing_state.read_alias = replica_alias()
+        return None
+
+    @staticmethod
+    def _reads_from_replica(view_func):
+        if getattr(getattr(view_func, 'view_class', None), 'replica_reads', False):
+            return True
+        return hasattr(view_func, 'model_admin') and view_func.__name__ == 'changelist_view'
+
+    @staticmethod
+    def _replica_stream(streaming_content, read_alias):
+        with routing_state(read_alias):
+            yield from streaming_content
@@ -0,0 +1,88 @@
+import time
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TransactionTestCase, override_settings
+from django.views.generic import View
+from datastore import models
+from . import db_routers
+
+REPLICA_DATABASES = dict(settings.DATABASES, replica={'ENGINE': 'django.db.backends.sqlite3', 'NAME': 'replica'})
+
+
+def read_alias():
+    return models.Table.objects.all().db
+
+
+class ReportView(View):
+    replica_reads = True
+
+    def get(self, request):
+        return HttpResponse(read_alias())
+
+    def post(self, request):
+        return HttpResponse(read_alias())
+
+
+class WritingReportView(ReportView):
+    def get(self, request):
+        User.objects.create(username='writer')
+        return HttpResponse(read_alias())
+
+
+class StreamingReportView(ReportView):
+    def get(self, request):
+        return StreamingHttpResponse(read_alias() for _ in range(1))
+
+
+class FormView(View):
+    def get(self, request):
+        return HttpResponse(read_alias())
+
+
+@override_settings(DATABASES=REPLICA_DATABASES)
+class PrimaryReplicaRouterTestCase(TransactionTestCase):
+    # TestCase wraps each test in a transaction, which keeps every read on the primary.
+    def test_reads_only_use_the_replica_when_asked(self):
+        self.assertEqual(read_alias(), 'default')
+        with db_routers.replica_reads():
+            self.assertEqual(read_alias(), 'replica')
+            with transaction.atomic():
+                self.assertEqual(read_alias(), 'default')
+            self.assertEqual(read_alias(), 'replica')
+            User.objects.create(username='writer')
+            self.assertEqual(read_alias(), 'default')
+        with db_routers.replica_reads():
+            self.assertEqual(models.Table.objects.select_for_update().db, 'default')
+            self.assertEqual(read_alias(), 'default')
+
+    @override_settings(DATABASES={'default': settings.DATABASES['default']})
+    def test_without_a_replica(self):
+        with db_routers.replica_reads():
+            self.assertEqual(read_alias(), 'default')
+
+    def request(self, view, method='get', session=None):
+        request = getattr(RequestFactory(), method)('/')
+        request.session = {} if session is None else session
+        view_func = view.as_view()
+
+        def get_response(request):
+            return middleware.process_view(request, view_func, (), {}) or view_func(request)
+
+        middleware = db_routers.ReplicaRoutingMiddleware(get_response)
+        response = middleware(request)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        return content.decode(), request.session
+
+    def test_middleware(self):
+        self.assertEqual(self.request(ReportView), ('replica', {}))
+        self.assertEqual(self.request(StreamingReportView)[0], 'replica')
+        self.assertEqual(self.request(FormView)[0], 'default')
+        self.assertEqual(self.request(ReportView, 'post')[0], 'default')
+        content, session = self.request(WritingReportView)
+        self.assertEqual(content, 'default')
+        self.assertGreater(session[db_routers.STICKY_SESSION_KEY], time.time())
+        self.assertEqual(self.request(ReportView, session=session)[0], 'default')
+        session[db_routers.STICKY_SESSION_KEY] = time.time() - 1
+        self.assertEqual(self.request(ReportView, session=session)[0], 'replica')
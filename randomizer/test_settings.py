@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 """
 
 import os
+import tempfile
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -47,6 +48,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'permissions.middleware.TableAccessMemoMiddleware',
+    'randomizer.db_routers.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.locale.LocaleMiddleware',
@@ -114,6 +117,21 @@ STATICFILES_DIRS = (
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'
 
+IMPORT_STAGING_DIR = os.path.join(tempfile.gettempdir(), 'randomizer_import_staging')
+
+NOTIFICATION_SLACK_CHANNEL = '#study-randomizer'
+NOTIFICATION_WEBHOOK_URL = None
+NOTIFICATION_SINKS = {'fake': 'datastore.notifications.FakeSink'}
+
+ROW_PARTITIONING = False
+
+DATABASE_ROUTERS = ['randomizer.db_routers.PrimaryReplicaRouter']
+REPLICA_DATABASE_ALIAS = 'replica'
+REPLICA_STICKY_SECONDS = 10
+if os.environ.get('replica_database_url'):
+    import dj_database_url
+    DATABASES[REPLICA_DATABASE_ALIAS] = dj_database_url.parse(os.environ['replica_database_url'])
+
 if 'HEROKU' in os.environ:
     import django_heroku
     django_heroku.settings(locals())
@@ -23,10 +23,42 @@ urlpatterns = [
 
     path('', login_required(datastore_views.MyTablesView.as_view()), name='table_list'),
     path('import/', staff_member_required(datastore_views.UploadTableView.as_view()), name='table_import'),
+    path('import/<int:pk>/', staff_member_required(datastore_views.ImportJobView.as_view()), name='import_job'),
+    path('import/<int:pk>/progress/', staff_member_required(datastore_views.ImportJobProgressView.as_view()),
+         name='import_job_progress'),
+    path('uploads/', staff_member_required(datastore_views.UploadSessionCreateView.as_view()),
+         name='upload_session_create'),
+    path('uploads/<int:pk>/', staff_member_required(datastore_views.UploadSessionView.as_view()),
+         name='upload_session'),
+    path('generate/', staff_member_required(datastore_views.GenerateTableView.as_view()), name='table_generate'),
 
     path('<int:pk>-<slug:table_slug>/',
          login_required(datastore_views.TableDetailView.as_view()),
          name=datastore_views.TableDetailView.view_name()),
+    path('<int:pk>-<slug:table_slug>/sites/',
+         login_required(datastore_views.TableSiteSearchView.as_view()),
+         name=datastore_views.TableSiteSearchView.view_name()),
+    path('<int:pk>-<slug:table_slug>/export/',
+         staff_member_required(datastore_views.TableExportView.as_view()),
+         name=datastore_views.TableExportView.view_name()),
+    path('<int:pk>-<slug:table_slug>/snapshot/',
+         staff_member_required(datastore_views.TableSnapshotView.as_view()),
+         name=datastore_views.TableSnapshotView.view_name()),
+    path('<int:pk>-<slug:table_slug>/balance/',
+         staff_member_required(datastore_views.TableBalanceView.as_view()),
+         name=datastore_views.TableBalanceView.view_name()),
+    path('<int:pk>-<slug:table_slug>/forecast/',
+         staff_member_required(datastore_views.TableForecastView.as_view()),
+         name=datastore_views.TableForecastView.view_name()),
+    path('<int:pk>-<slug:table_slug>/simulation/',
+         staff_member_required(datastore_views.TableSimulationView.as_view()),
+         name=datastore_views.TableSimulationView.view_name()),
+    path('<int:pk>-<slug:table_slug>/changes/',
+         staff_member_required(datastore_views.TableChangesView.as_view()),
+         name=datastore_views.TableChangesView.view_name()),
+    path('<int:pk>-<slug:table_slug>/events/',
+         login_required(datastore_views.TableEventsView.as_view()),
+         name=datastore_views.TableEventsView.view_name()),
     path('<int:pk>-<slug:table_slug>/columns/',
          staff_member_required(datastore_views.TableColumnsView.as_view()),
          name=datastore_views.TableColumnsView.view_name()),
@@ -0,0 +1,21 @@
+document.addEventListener('DOMContentLoaded', function () {
+    var job = document.getElementById('import-job');
+    if (!job || job.getAttribute('data-status') === 'succeeded' || job.getAttribute('data-status') === 'failed') {
+        return;
+    }
+    var poll = function () {
+        fetch(job.getAttribute('data-import-progress-url'), {credentials: 'same-origin'})
+            .then(function (response) { return response.json(); })
+            .then(function (progress) {
+                if (progress.status === 'succeeded' || progress.status === 'failed') {
+                    window.location.reload();
+                    return;
+                }
+                ['rows_parsed', 'rows_validated', 'rows_inserted'].forEach(function (field) {
+                    job.querySelector('[data-progress="' + field + '"]').textContent = progress[field];
+                });
+                window.setTimeout(poll, 2000);
+            });
+    };
+    window.setTimeout(poll, 2000);
+});
@@ -0,0 +1,100 @@
+document.addEventListener('DOMContentLoaded', function () {
+    var form = document.querySelector('form[data-upload-session-url]');
+    if (!form || !window.fetch || !window.crypto || !window.crypto.subtle) {
+        return;
+    }
+    var chunkBytes = 8 * 1024 * 1024;
+    var maxRetries = 5;
+    var fileInput = form.querySelector('input[type="file"]');
+    var submit = form.querySelector('input[type="submit"]');
+    var status = document.createElement('div');
+    form.appendChild(status);
+
+    var hex = function (buffer) {
+        return Array.prototype.map.call(new Uint8Array(buffer), function (byte) {
+            return ('0' + byte.toString(16)).slice(-2);
+        }).join('');
+    };
+    var send = function (url, options) {
+        options.credentials = 'same-origin';
+        options.headers = Object.assign({'X-CSRFToken': form.querySelector('[name="csrfmiddlewaretoken"]').value},
+                                        options.headers || {});
+        return fetch(url, options).then(function (response) {
+            return response.json().then(function (body) {
+                return {status: response.status, body: body};
+            });
+        });
+    };
+    var fail = function (message) {
+        status.className = 'errorlist';
+        status.textContent = message;
+        submit.disabled = false;
+    };
+    var upload = function (file, session, retries) {
+        if (session.import_job_url) {
+            window.location = session.import_job_url;
+            return;
+        }
+        if (session.status !== 'uploading') {
+            fail(session.error);
+            return;
+        }
+        var start = session.received_size;
+        var end = Math.min(start + chunkBytes, file.size);
+        status.className = '';
+        status.textContent = 'Uploaded ' + Math.floor(100 * start / file.size) + '%';
+        var chunk = file.slice(start, end);
+        chunk.arrayBuffer().then(function (data) {
+            return window.crypto.subtle.digest('SHA-256', data).then(function (digest) {
+                return send(session.url, {
+                    method: 'PUT', body: data,
+                    headers: {'Content-Range': 'bytes ' + start + '-' + (end - 1) + '/' + file.size,
+                              'X-Content-SHA256': hex(digest)}
+                });
+            });
+        }).then(function (response) {
+            if (response.status === 200 || response.status === 409) {
+                upload(file, response.body, maxRetries);
+            } else {
+                fail(response.body.error);
+            }
+        }).catch(function () {
+            if (!retries) {
+                fail('The upload was interrupted. Submit the form again to resume.');
+                return;
+            }
+            window.setTimeout(function () {
+                send(session.url, {method: 'GET'}).then(function (response) {
+                    upload(file, response.body, retries - 1);
+                }).catch(function () {
+                    upload(file, session, retries - 1);
+                });
+            }, 2000);
+        });
+    };
+
+    form.addEventListener('submit', function (event) {
+        var file = fileInput.files[0];
+        if (!file) {
+            return;
+        }
+        event.preventDefault();
+        submit.disabled = true;
+        var data = new FormData(form);
+        data.delete(fileInput.name);
+        data.append('size', file.size);
+        if (form.getAttribute('data-upload-table')) {
+            data.append('table', form.getAttribute('data-upload-table'));
+        }
+        send(form.getAttribute('data-upload-session-url'), {method: 'POST', body: data}).then(function (response) {
+            if (response.status !== 201) {
+                var errors = response.body.errors || {};
+                fail(Object.keys(errors).map(function (field) { return errors[field].join(' '); }).join(' '));
+                return;
+            }
+            upload(file, response.body, maxRetries);
+        }).catch(function () {
+            fail('The upload could not be started.');
+        });
+    });
+});
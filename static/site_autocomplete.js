@@ -0,0 +1,22 @@
+document.addEventListener('DOMContentLoaded', function () {
+    document.querySelectorAll('input[data-site-search-url]').forEach(function (input) {
+        var datalist = document.getElementById(input.getAttribute('list'));
+        var searchUrl = input.getAttribute('data-site-search-url');
+        var pending = null;
+        input.addEventListener('input', function () {
+            clearTimeout(pending);
+            pending = setTimeout(function () {
+                fetch(searchUrl + '?q=' + encodeURIComponent(input.value), {credentials: 'same-origin'})
+                    .then(function (response) { return response.json(); })
+                    .then(function (data) {
+                        datalist.innerHTML = '';
+                        data.results.forEach(function (result) {
+                            var option = document.createElement('option');
+                            option.value = result.label;
+                            datalist.appendChild(option);
+                        });
+                    });
+            }, 200);
+        });
+    });
+});
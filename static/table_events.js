@@ -0,0 +1,26 @@
+document.addEventListener('DOMContentLoaded', function () {
+    var form = document.querySelector('[data-table-events-url]');
+    if (!form || !window.EventSource) {
+        return;
+    }
+    var tbody = form.querySelector('tbody');
+    var source = new EventSource(form.getAttribute('data-table-events-url'));
+    source.addEventListener('row', function (message) {
+        var event = JSON.parse(message.data);
+        if (event.state === 'reload') {
+            window.location.reload();
+            return;
+        }
+        var existing = tbody.querySelector('input[name="row_' + event.row + '"]');
+        if (existing) {
+            existing.closest('tr').remove();
+        }
+        if (event.html) {
+            var placeholder = tbody.querySelector('td[colspan]');
+            if (placeholder) {
+                placeholder.closest('tr').remove();
+            }
+            tbody.insertAdjacentHTML('beforeend', event.html);
+        }
+    });
+});